@@ -1,201 +1,64 @@
 import streamlit as st
-import re
+import datetime
+import importlib.util
 import json # Import the json module
+import os
+import tempfile
+import time
+import uuid
 import pandas as pd
-# Removed asyncio and httpx imports as LLM is no longer used
+from streamlit.errors import StreamlitAPIException
+from dazzle.parsing import IncrementalOrdersParser, parse_shopify_export_compact, split_shopify_exports
+from dazzle.cache import DEFAULT_PARSE_CACHE_SIZE, DEFAULT_PARSE_CACHE_TTL, ParseCache
+from dazzle.catalog import CatalogError, default_catalog
+from dazzle.dispatch import DispatchError, SmtpSettings
+from dazzle.guard import DEFAULT_PARSE_TIME_BUDGET, GuardedParser, ParseRejected, check_paste_size
+from dazzle.exports import (
+    COLUMNAR_EXPORT_FORMATS,
+    ExportFormatError,
+    list_saved_exports,
+    open_columnar_export,
+    write_frame_columnar,
+)
+from dazzle.instrumentation import INSTRUMENTATION
+from dazzle.jobs import JobError, JobQueue, batch_line_items, resolve_batch_parse
+from dazzle.linkage import LinkageIndex, linkage_columns
+from dazzle.risk import load_risk_model, risk_columns
+from dazzle.store import OrderStore
+from dazzle.emails import (
+    EMAIL_EXPORT_FORMATS,
+    EMAIL_TEMPLATE_LABELS,
+    EMAIL_TEMPLATES,
+)
+
+rerun_started = time.perf_counter() # Whole-script timing, recorded as "streamlit_rerun" at the bottom
+DIAGNOSTIC_TRACES_SHOWN = 25
+BATCH_EXPORT_DIR = os.environ.get("DAZZLE_EXPORT_DIR") or None # Parquet/Feather exports are also saved here when set
+OPENED_EXPORT_PREVIEW_ROWS = 1000
+JOB_POLL_SECONDS = 1.0 # How often a running job's progress bar refreshes
+STYLESHEET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dazzle", "static", "app.css")
+PREVIEW_ITEMS_PAGE_SIZE = 10 # Item cards shown per page in the Email Generator preview
+BATCH_TABLE_PAGE_ROWS = 500 # Batch result rows sent to the browser per page
+ANALYTICS_PERIODS = {"Last 30 days": 30, "Last 90 days": 90, "Last 365 days": 365, "All time": None}
+ANALYTICS_TOP_ROWS = 10 # Customers and style codes listed in the Analytics tab
 
 # --- Page Configuration ---
 st.set_page_config(page_title="DAZZLE PREMIUM Order Email Generator", layout="wide", initial_sidebar_state="collapsed")
 
-# --- Custom CSS Styling (Award-quality, Handcrafted UI - Extended) ---
-st.markdown("""
-<style>
-    /* --------------------------------------------------------- */
-    /* Design System Variables */
-    :root {
-        --bg: #f6f8fa;
-        --panel: #ffffff;
-        --muted: #9aa5ad;
-        --text: #12232b;
-        --accent: #0f6fff;
-        --accent-2: #243b55;
-        --success: #16a34a;
-        --warning: #f59e0b;
-        --danger: #ef4444;
-        --soft: rgba(17, 24, 39, 0.03);
-        --glass: rgba(255,255,255,0.8);
-        --radius: 10px;
-        --card-radius: 12px;
-        --shadow-1: 0 6px 18px rgba(18,35,43,0.06);
-        --shadow-2: 0 10px 30px rgba(18,35,43,0.08);
-    }
-
-    /* Reset */
-    * { box-sizing: border-box; margin: 0; padding: 0; }
-    html, body, .stApp { height: 100%; background: var(--bg); color: var(--text); font-family: Inter, system-ui, -apple-system, 'Segoe UI', Roboto, 'Helvetica Neue', Arial; }
-
-    /* Global layout container tuning */
-    .main .block-container { max-width: 1360px; margin: 28px auto; padding: 28px; background: linear-gradient(180deg, var(--panel) 0%, #fbfcfd 100%); border-radius: 14px; box-shadow: var(--shadow-1); }
-
-    /* Typography scale */
-    h1 { font-size: 34px; line-height: 1.06; font-weight: 700; color: #0b1720; margin-bottom: 6px; }
-    .subtitle { font-size: 15px; color: var(--muted); margin-bottom: 20px; }
-    h2 { font-size: 20px; font-weight: 700; color: #071524; margin: 20px 0 14px; }
-    h3 { font-size: 16px; font-weight: 600; color: #0b1720; margin: 14px 0 10px; }
-    h4 { font-size: 12px; font-weight: 700; color: #6b7280; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 8px; }
-
-    p, label { color: #334155; font-size: 14px; line-height: 1.5; }
-
-    /* Utility */
-    .muted { color: var(--muted); }
-    .small { font-size: 12px; }
-    .kbd { font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, 'Roboto Mono', monospace; background: #eef2f7; padding: 2px 6px; border-radius: 6px; font-size: 12px; }
-
-    /* Top navigation / hero area */
-    .app-hero { display:flex; align-items:center; justify-content:space-between; gap:20px; margin-bottom: 18px; }
-    .app-hero .left { display:flex; gap:16px; align-items:center; }
-    .brand-badge { display:flex; align-items:center; gap:10px; }
-    .brand-badge .logo { width:48px; height:48px; border-radius:10px; background: linear-gradient(135deg, var(--accent), #5aa2ff); box-shadow: var(--shadow-2); display:flex; align-items:center; justify-content:center; color:white; font-weight:700; }
-    .brand-badge .title { display:flex; flex-direction:column; }
-    .brand-badge .title .name { font-weight:700; font-size:20px; letter-spacing: -0.3px; }
-    .brand-badge .title .tag { font-size:12px; color:var(--muted); }
-
-    .app-hero .actions { display:flex; gap:10px; align-items:center; }
-    .search { display:flex; align-items:center; gap:8px; background:var(--soft); padding:8px 12px; border-radius:999px; border:1px solid rgba(17,24,39,0.03); }
-    .search input { border: none; background: transparent; outline:none; width:220px; font-size:14px; color:var(--text); }
-    .pill { background: linear-gradient(180deg,#fbfcff, #f4f8ff); border-radius:999px; padding:8px 12px; border:1px solid rgba(17,24,39,0.04); font-weight:600; color:var(--accent-2); }
-
-    /* Panels and cards */
-    .panel { background: var(--panel); border-radius: var(--card-radius); padding: 18px; border: 1px solid rgba(2,6,23,0.04); box-shadow: var(--shadow-1); }
-    .panel.header { display:flex; align-items:center; justify-content:space-between; gap:18px; }
-
-    .panel.grid { display:grid; grid-template-columns: 1fr 420px; gap: 22px; align-items:start; }
-
-    /* Buttons */
-    .btn { display:inline-flex; align-items:center; gap:8px; padding:10px 14px; border-radius:10px; border:none; cursor:pointer; font-weight:600; font-size:14px; }
-    .btn.primary { background: linear-gradient(90deg,var(--accent), #4aa3ff); color:white; box-shadow: 0 8px 30px rgba(15,111,255,0.14); }
-    .btn.ghost { background: transparent; border: 1px solid rgba(2,6,23,0.06); color:var(--accent-2); }
-    .btn.warn { background: linear-gradient(90deg,#fff3e0,#fff1d6); color:var(--warning); border:1px solid rgba(245,158,11,0.08); }
-
-    .btn:hover { transform: translateY(-2px); transition: transform 160ms ease; }
-
-    .icon-circle { width:38px; height:38px; border-radius:9px; display:flex; align-items:center; justify-content:center; background: linear-gradient(180deg,#fff,#f5f7fb); border:1px solid rgba(2,6,23,0.04); }
-
-    /* Form and textarea styling */
-    .form-row { display:flex; flex-direction:column; gap:8px; margin-bottom:12px; }
-    .label { font-size:13px; font-weight:700; color:#475569; }
-    .input { width:100%; padding:12px 14px; border-radius:10px; border:1px solid #e6eef6; background: #fbfdff; font-size:14px; color:var(--text); }
-    textarea.input { min-height: 160px; resize: vertical; }
-
-    .helper { font-size:12px; color:var(--muted); }
-
-    /* Data display */
-    .data-row { display:flex; align-items:center; justify-content:space-between; gap:12px; padding:10px; border-radius:10px; border:1px solid rgba(2,6,23,0.04); background: linear-gradient(180deg,#ffffff,#fbfdff); }
-
-    .items { display:flex; flex-direction:column; gap:10px; }
-    .item { display:flex; gap:12px; align-items:flex-start; padding:12px; border-radius:10px; background: linear-gradient(180deg,#ffffff,#fbfcff); border:1px solid rgba(2,6,23,0.03); }
-    .item .meta { display:flex; flex-direction:column; }
-    .item .title { font-weight:700; color:#0b1720; }
-    .item .meta .small { color:var(--muted); font-size:13px; }
-
-    /* Status badges */
-    .badge { display:inline-flex; align-items:center; gap:8px; padding:6px 10px; border-radius:999px; font-weight:700; font-size:13px; }
-    .badge.success { background: rgba(16,185,129,0.12); color: var(--success); border:1px solid rgba(16,185,129,0.12); }
-    .badge.warn { background: rgba(245,158,11,0.08); color: var(--warning); border:1px solid rgba(245,158,11,0.08); }
-    .badge.info { background: rgba(14,165,233,0.08); color: #0369a1; border:1px solid rgba(14,165,233,0.08); }
-
-    /* Message blocks */
-    .message-block { border-radius: 10px; padding: 14px; border: 1px dashed rgba(2,6,23,0.04); background: linear-gradient(180deg,#fbfdff,#f7fbff); white-space: pre-wrap; font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, 'Roboto Mono', monospace; }
-
-    /* Table-like styles */
-    .orders-table { width:100%; border-collapse: collapse; font-size: 14px; }
-    .orders-table thead th { text-align:left; padding:12px; color:#55636f; font-weight:700; border-bottom: 1px solid rgba(2,6,23,0.04); }
-    .orders-table tbody td { padding:12px; border-bottom: 1px solid rgba(2,6,23,0.03); }
-
-    /* Micro-interactions */
-    .hover-lift { transition: transform 160ms ease, box-shadow 160ms ease; }
-    .hover-lift:hover { transform: translateY(-6px); box-shadow: var(--shadow-2); }
-
-    @keyframes pulseSoft { 0% { box-shadow: 0 0 0 0 rgba(15,111,255,0.08);} 70% { box-shadow: 0 0 0 8px rgba(15,111,255,0);} 100% { box-shadow: 0 0 0 0 rgba(15,111,255,0);} }
-    .pulse { animation: pulseSoft 2.6s infinite; }
-
-    /* Accessibility */
-    .sr-only { position:absolute; left:-10000px; top:auto; width:1px; height:1px; overflow:hidden; }
-
-    /* Mobile responsive grid stacks */
-    @media (max-width: 980px) {
-        .panel.grid { grid-template-columns: 1fr; }
-        .search input { width: 120px; }
-        .main .block-container { padding: 18px; margin: 8px; }
-    }
-
-    /* Extended form helpers */
-    .field-inline { display:flex; gap:10px; align-items:center; }
-    .field-inline .input { flex:1; }
-    .field-muted { color:#94a3b8; font-size:13px; }
-
-    .chip { display:inline-flex; align-items:center; gap:8px; padding:6px 10px; border-radius:999px; background:#f1f5f9; border:1px solid rgba(2,6,23,0.03); font-weight:600; }
-
-    /* Modal and tooltip (visual only) */
-    .mod-backdrop { position:fixed; inset:0; background: rgba(2,6,23,0.35); display:none; align-items:center; justify-content:center; }
-    .mod { width:720px; background:var(--panel); border-radius:12px; padding:22px; box-shadow: var(--shadow-2); }
-    .tooltip { position:relative; display:inline-block; }
-    .tooltip .tip { position:absolute; bottom:calc(100% + 8px); left:50%; transform:translateX(-50%); background:#0b1720; color:white; padding:8px 10px; border-radius:6px; font-size:12px; display:none; }
-    .tooltip:hover .tip { display:block; }
-
-    .input.error { border-color: rgba(239,68,68,0.12); box-shadow: 0 2px 8px rgba(239,68,68,0.06); }
-    .input.success { border-color: rgba(16,185,129,0.12); box-shadow: 0 2px 8px rgba(16,185,129,0.06); }
-
-    .mini-footer { display:flex; justify-content:space-between; gap:10px; align-items:center; border-top:1px solid rgba(2,6,23,0.04); padding-top:12px; margin-top:16px; color:var(--muted); font-size:13px; }
-
-    .ic { width:18px; height:18px; display:inline-block; }
-    .rule { height:1px; background: linear-gradient(90deg, transparent, rgba(2,6,23,0.04), transparent); margin: 12px 0; }
-
-    .cols-3 { display:grid; grid-template-columns: repeat(3,1fr); gap:12px; }
-    .cols-2 { display:grid; grid-template-columns: repeat(2,1fr); gap:12px; }
-
-    .muted-block { background: linear-gradient(180deg,#fbfdff,#f6f9fb); border:1px solid rgba(2,6,23,0.03); padding:8px 10px; border-radius:8px; color:var(--muted); }
-    .btn.large { padding:12px 18px; font-size:15px; border-radius:12px; }
-    .soft-border { border: 1px solid rgba(2,6,23,0.03); border-radius:10px; background: linear-gradient(180deg,#fff,#fbfdff); }
-
-    .stCode { overflow-x:auto; }
-
-    @media (max-width: 560px) {
-        h1 { font-size:22px; }
-        .search input { width:90px; }
-        .brand-badge .title .name { font-size:16px; }
-    }
+# --- Styling ---
+# The stylesheet is a static file read once per process. st.html sends style-only content
+# to Streamlit's event container, so it takes no layout space, and fragment reruns
+# (most clicks in either tab) do not send it again.
+@st.cache_resource
+def load_stylesheet():
+    with open(STYLESHEET_PATH, encoding="utf-8") as stylesheet:
+        return stylesheet.read()
 
-</style>
-""", unsafe_allow_html=True)
-
-# --- JavaScript for Copy to Clipboard Functionality ---
-# This script is injected once and provides a JS function to copy text.
-st.markdown("""
-<script>
-function copyToClipboard(text, elementId) {
-    const textarea = document.createElement('textarea');
-    textarea.value = text;
-    document.body.appendChild(textarea);
-    textarea.select();
-    try {
-        document.execCommand('copy');
-        const element = document.getElementById(elementId);
-        if (element) {
-            element.innerText = 'Copied!';
-            setTimeout(() => { element.innerText = 'Copy'; }, 1500); // Reset text after 1.5s
-        }
-    } catch (err) {
-        console.error('Failed to copy text: ', err);
-    }
-    document.body.removeChild(textarea);
-}
-</script>
-""", unsafe_allow_html=True)
+st.html(f"<style>{load_stylesheet()}</style>")
 
 # --- Initialize Session State ---
 if "current_step" not in st.session_state:
-    st.session_state.current_step = "input"  # input, generate_standard, generate_high_risk, generate_return
+    st.session_state.current_step = "input"  # input, generate_standard, generate_high_risk, generate_return, generate_medium_risk
 if "raw_text" not in st.session_state:
     st.session_state.raw_text = ""
 if "parsed_data" not in st.session_state:
@@ -206,381 +69,278 @@ if "generated_subject" not in st.session_state:
     st.session_state.generated_subject = ""
 if "missing_info_flags" not in st.session_state: # Re-added for regex parser
     st.session_state.missing_info_flags = []
+if "order_segments" not in st.session_state: # One text per order when a paste holds several order pages
+    st.session_state.order_segments = []
+if "order_index" not in st.session_state: # Order of the paste shown in the preview
+    st.session_state.order_index = 0
+if "email_template" not in st.session_state: # Template applied to every order of the paste
+    st.session_state.email_template = "standard"
+if "parse_error" not in st.session_state: # Why the shown order of the paste was refused (size or time budget)
+    st.session_state.parse_error = None
+if "batch_incremental_parser" not in st.session_state: # Re-parses of the pasted text only parse new blocks
+    st.session_state.batch_incremental_parser = IncrementalOrdersParser()
+if "batch_id" not in st.session_state: # Saved with this session's parsed orders, so its re-parses aren't their own history
+    st.session_state.batch_id = uuid.uuid4().hex
+if "batch_job_id" not in st.session_state: # Background parse shown in the Batch Orders tab
+    st.session_state.batch_job_id = None
+if "batch_job_parser" not in st.session_state: # (job id, the job's copy of the incremental parser) until it finishes
+    st.session_state.batch_job_parser = None
+if "batch_result" not in st.session_state: # Display form of batch_job_id's result (a view of its shared batch)
+    st.session_state.batch_result = None
+if "email_job_id" not in st.session_state: # Background bulk email rendering
+    st.session_state.email_job_id = None
+if "send_job_id" not in st.session_state: # Background SMTP send of the bulk emails
+    st.session_state.send_job_id = None
 
 
 # --- Helper Functions ---
 
-def parse_shopify_export(raw_text_input):
+# The DAZZLE_CATALOG product catalog is indexed once per process, before any parse (parse
+# guard workers index their own copy when they start); every parse resolves items against it
+try:
+    default_catalog()
+except CatalogError as exc:
+    st.error(f"Product catalog: {exc}")
+    st.stop()
+
+@st.cache_resource
+def get_parse_cache():
     """
-    Parses the raw Shopify order export text to extract key information.
-    This function uses multiple, redundant regex patterns and fallback strategies
-    to maximize extraction success without human intervention.
+    One parse cache per server process, shared by every session, so switching between
+    email types on the same paste parses it once. Size and TTL come from the
+    DAZZLE_PARSE_CACHE_SIZE / DAZZLE_PARSE_CACHE_TTL environment variables.
+    Pastes are untrusted, so misses run in GuardedParser worker processes under
+    DAZZLE_PARSE_TIME_BUDGET (0 parses in-process instead).
     """
-    data = {
-        "customer_name": "[Customer Name Not Found]",
-        "email_address": "[Email Not Found]",
-        "phone_number": "[Phone Not Found]",
-        "order_number": "[Order # Not Found]",
-        "items": [],
-        "missing_info": []
-    }
-
-    # Normalize input: remove extra spaces, ensure consistent line breaks
-    normalized_text = re.sub(r'\s+', ' ', raw_text_input).strip() # Replace multiple spaces with single
-    lines = [line.strip() for line in raw_text_input.split('\n') if line.strip()]
-
-    # --- Extract Customer Name (Redundancy Level 1: Multiple Patterns) ---
-    name_found = False
-    
-    # Attempt 1: From "Order confirmation email was sent to [Name] ([email])"
-    email_sent_match = re.search(r"Order confirmation email was sent to (.*?) \([\w\.-]+@[\w\.-]+\.[\w\.-]+\)", raw_text_input, re.IGNORECASE)
-    if email_sent_match:
-        data["customer_name"] = email_sent_match.group(1).strip()
-        name_found = True
-
-    # Attempt 2: From "Customer" or "Contact information" sections
-    if not name_found:
-        for i, line in enumerate(lines):
-            # Look for "Customer" or "Contact information" labels
-            if re.search(r"Customer\s*$", line, re.IGNORECASE) or re.search(r"Contact information\s*$", line, re.IGNORECASE):
-                # Try to find the name on the next line
-                if i + 1 < len(lines):
-                    potential_name = lines[i+1].split('\n')[0].strip()
-                    # Ensure it doesn't look like an email or phone number
-                    if "@" not in potential_name and not re.search(r"^\+?\d", potential_name):
-                        data["customer_name"] = potential_name
-                        name_found = True
-                        break
-            # Attempt 3: From "Shipping address" or "Billing address" sections
-            elif (re.search(r"Shipping address\s*$", line, re.IGNORECASE) or \
-                  re.search(r"Billing address\s*$", line, re.IGNORECASE)):
-                # Try to find the name on the next line
-                if i + 1 < len(lines):
-                    potential_name = lines[i+1].split('\n')[0].strip()
-                    if "@" not in potential_name and not re.search(r"^\+?\d", potential_name):
-                        data["customer_name"] = potential_name
-                        name_found = True
-                        break
-    
-    if not name_found or data["customer_name"] == "[Customer Name Not Found]":
-        data["missing_info"].append("Customer Name")
-
-
-    # --- Extract Email Address (Redundancy Level 1: Multiple Patterns) ---
-    # Attempt 1: General email pattern
-    email_match = re.search(r"[\w\.-]+@[\w\.-]+\.[\w\.-]+", raw_text_input)
-    if email_match:
-        data["email_address"] = email_match.group(0).strip()
-    else:
-        # Attempt 2: Look for "Email:" label explicitly
-        email_label_match = re.search(r"Email:\s*([\w\.-]+@[\w\.-]+\.[\w\.-]+)", raw_text_input, re.IGNORECASE)
-        if email_label_match:
-            data["email_address"] = email_label_match.group(1).strip()
-        else:
-            data["missing_info"].append("Email Address")
-
-    # --- Extract Phone Number (Redundancy Level 1: Multiple Patterns) ---
-    # Attempt 1: Flexible US phone number regex (common formats)
-    phone_match = re.search(r"(\+1[\s\-()]?\d{3}[\s\-()]?\d{3}[\s\-()]?\d{4}|\d{3}[\s\-()]?\d{3}[\s\-()]?\d{4})", raw_text_input)
-    if phone_match:
-        data["phone_number"] = phone_match.group(0).strip()
-    else:
-        # Attempt 2: Look for "Phone:" label explicitly
-        phone_label_match = re.search(r"(?:Phone|Tel|Contact):\s*(\+?\d[\d\s\-\(\).]{7,})", raw_text_input, re.IGNORECASE)
-        if phone_label_match:
-            data["phone_number"] = phone_label_match.group(1).strip()
-        else:
-            data["missing_info"].append("Phone Number")
-
-    # --- Extract Order Number (Redundancy Level 1: Multiple Patterns) ---
-    # Attempt 1: dazzlepremium# followed by digits
-    order_number_match = re.search(r"dazzlepremium#(\d+)", raw_text_input, re.IGNORECASE)
-    if order_number_match:
-        data["order_number"] = order_number_match.group(1).strip()
-    else:
-        # Attempt 2: General "Order #" or "Order Number" followed by digits
-        order_number_match_general = re.search(r"(?:Order #|Order Number|Invoice #)\s*(\d+)", raw_text_input, re.IGNORECASE)
-        if order_number_match_general:
-            data["order_number"] = order_number_match_general.group(1).strip()
-        else:
-            data["missing_info"].append("Order Number")
-
-    # --- Extract Items (Redundancy Level 2: Layered Heuristics) ---
-    # Strategy: Find lines that look like product names, then parse details from surrounding lines.
-    
-    product_lines_info = []
-    # Heuristic 1: Lines containing " - " and ending with a style code (e.g., "Product Name - STYLECODE")
-    for i, line in enumerate(lines):
-        # This regex looks for product names followed by " - " and a style code,
-        # ensuring it's not a line containing keywords like SKU, discount, etc.
-        if re.search(r" - [A-Z0-9\-]+$", line) and \
-           not any(kw in line.lower() for kw in ["sku", "discount", "subtotal", "shipping", "tax", "total", "paid", "balance"]):
-            product_lines_info.append({"line": line, "index": i})
-    
-    # Heuristic 2: Lines containing a price and a quantity (e.g., "$57.00 x 1")
-    # This helps identify product lines that might not have a style code in their main name
-    # This is a fallback if Heuristic 1 didn't find anything, or to capture additional items.
-    if not product_lines_info: # If no products found by Heuristic 1, try this
-        for i, line in enumerate(lines):
-            if re.search(r"\$\d+\.\d{2}\s*x\s*\d+", line) and \
-               not any(kw in line.lower() for kw in ["sku", "discount", "subtotal", "shipping", "tax", "total", "paid", "balance"]):
-                # Try to infer product name from the line above if it looks like a product description
-                if i > 0 and " - " in lines[i-1] and not any(kw in lines[i-1].lower() for kw in ["sku", "discount", "subtotal"]):
-                    product_lines_info.append({"line": lines[i-1], "index": i-1})
-                else: # Fallback: use the line itself as product name, but this is less reliable
-                    # This might pick up non-product lines, so it's a last resort
-                    product_lines_info.append({"line": line.split('$')[0].strip(), "index": i})
-
-
-    processed_indices = set() # To avoid processing the same product line multiple times
-
-    for prod_info in product_lines_info:
-        line_idx = prod_info["index"]
-        if line_idx in processed_indices:
-            continue # Skip if already processed
-
-        product_name = "Unknown Product"
-        style_code = "N/A"
-        size = "Size Not Found" # Default to "Size Not Found"
-        quantity = 1
-
-        # Extract product name and style code from the identified product line
-        if " - " in prod_info["line"]:
-            parts = prod_info["line"].rsplit(" - ", 1)
-            product_name = parts[0].strip()
-            style_code = parts[1].strip()
-        else:
-            product_name = prod_info["line"] # Use full line as product name if no " - "
-
-        # Look for size and quantity in the next few lines (Redundancy Level 3: Iterative Scan)
-        found_size_for_item = False
-        found_quantity_for_item = False
-
-        for offset in range(1, 6): # Scan up to 5 lines after the product line
-            if line_idx + offset >= len(lines):
-                break # Reached end of document
-
-            potential_detail_line = lines[line_idx + offset].strip()
-            
-            # Attempt to extract Quantity
-            if not found_quantity_for_item:
-                qty_match = re.search(r"x\s*(\d+)", potential_detail_line, re.IGNORECASE)
-                if qty_match:
-                    quantity = int(qty_match.group(1))
-                    found_quantity_for_item = True
-            
-            # Attempt to extract Size (more flexible patterns)
-            if not found_size_for_item:
-                # Pattern 1: Common letter sizes (S, M, L, XL, etc.) or "One Size"
-                size_match = re.search(r"\b(XS|S|M|L|XL|XXL|XXXL|One Size|OS)\b", potential_detail_line, re.IGNORECASE)
-                
-                # Pattern 2: Sizes like "M / YLW" or "16 / BS" (size is the first part before /)
-                if not size_match:
-                    match_slash_size = re.search(r"(\b\d{1,2}\b|\b[A-Z]{1,3}\b)\s*/\s*[A-Z0-9]+", potential_detail_line, re.IGNORECASE)
-                    if match_slash_size:
-                        size = match_slash_size.group(1).strip() # Capture the first group (the actual size part)
-                        found_size_for_item = True
-                        
-                # Pattern 3: Standalone numeric sizes, but ONLY if the line doesn't contain "SKU" or "$"
-                if not size_match: # Only attempt if size not found by previous patterns
-                    if "SKU" not in potential_detail_line.upper() and "$" not in potential_detail_line:
-                        # Very strict: must be just the number or number/number on the line
-                        # Ensures it's a standalone size, not part of a larger number or price.
-                        numeric_size_match = re.search(r"^\s*(?:US|EU)?\s*(\d{1,3}(?:/\d{1,2})?)\s*$", potential_detail_line, re.IGNORECASE)
-                        if numeric_size_match:
-                            size = numeric_size_match.group(1).strip()
-                            found_size_for_item = True
-                        # No need for the broader search here, the strict one is safer given the context.
-                        # If it's not a standalone size line, it's probably not a size.
-
-                if size_match and not found_size_for_item: # Only assign if size hasn't been found yet
-                    size = size_match.group(0).strip()
-                    found_size_for_item = True
-            
-            # If both size and quantity are found, we can stop scanning for this item's details.
-            if found_size_for_item and found_quantity_for_item:
-                break 
-
-            # If we hit a line that signifies end of product details (e.g., another product, subtotal, discount)
-            # This is a strong signal to stop.
-            if any(kw in potential_detail_line.lower() for kw in ["subtotal", "discount", "shipping", "tax", "total", "paid", "balance"]) or \
-               (re.search(r" - [A-Z0-9\-]+$", potential_detail_line) and potential_detail_line != prod_info["line"]):
-                break # Stop scanning for details for this item
-
-        # Special handling for "Sock" products: assign "One Size" if no explicit size was found
-        # and the product name contains "sock".
-        if size == "Size Not Found" and "sock" in product_name.lower():
-            size = "One Size"
-
-        data["items"].append({
-            "product_name": product_name,
-            "style_code": style_code,
-            "size": size,
-            "quantity": quantity
-        })
-        processed_indices.add(line_idx) # Mark the main product line as processed
-
-    if not data["items"]:
-        data["missing_info"].append("Order Items")
-    
-    # Add "Item Sizes" to missing_info if any item still has "Size Not Found" after all attempts
-    for item in data["items"]:
-        if item["size"] == "Size Not Found" and "Item Sizes" not in data["missing_info"]:
-            data["missing_info"].append("Item Sizes")
-
-
-    return data
-
-
-def generate_standard_email(parsed_data):
-    """Generates the standard order confirmation email."""
-    customer_name = parsed_data.get("customer_name", "[Customer Name Not Found]")
-    order_number = parsed_data.get("order_number", "[Order # Not Found]")
-    items = parsed_data.get("items", [])
-
-    order_details_list = []
-    # Check if there's more than one item to decide on item numbering
-    if len(items) > 1:
-        for idx, item in enumerate(items):
-            item_detail = (
-                f"- Item {idx+1}:\n" # Display item count only if multiple items
-                f"•\u2060  \u2060Product: {item.get('product_name', 'N/A')}\n"
-                f"•\u2060  \u2060Style Code: {item.get('style_code', 'N/A')}\n"
-                f"•\u2060  \u2060Size: {item.get('size', 'Size Not Found')}" # Use 'Size Not Found' default
-            )
-            # Only add quantity if it's greater than 1
-            if item.get('quantity', 1) > 1:
-                item_detail += f"\n•\u2060  \u2060Quantity: {item.get('quantity', 1)}"
-            order_details_list.append(item_detail)
-    elif len(items) == 1: # Only one item, no "Item 1:" prefix
-        item = items[0]
-        item_detail = (
-            f"•\u2060  \u2060Product: {item.get('product_name', 'N/A')}\n"
-            f"•\u2060  \u2060Style Code: {item.get('style_code', 'N/A')}\n"
-            f"•\u2060  \u2060Size: {item.get('size', 'Size Not Found')}" # Use 'Size Not Found' default
-        )
-        # Only add quantity if it's greater than 1
-        if item.get('quantity', 1) > 1:
-            item_detail += f"\n•\u2060  \u2060Quantity: {item.get('quantity', 1)}"
-        order_details_list.append(item_detail)
-    
-    order_details = "\n\n".join(order_details_list) if order_details_list else "No items found."
-
-    subject = f"Final Order Confirmation of dazzlepremium#{order_number}"
-    message = f"""Hello {customer_name},
-
-This is DAZZLE PREMIUM Support confirming Order {order_number}
-
-- Please reply YES to confirm just this order only.
-- Kindly also reply YES to the SMS sent automatically to your inbox.
-
-Order Details:
-{order_details}
-
-For your security, we use two-factor authentication. If this order wasn’t placed by you, text us immediately at 410-381-0000 to cancel.
-
-Note: Any order confirmed after 3:00 pm will be scheduled for the next business day.
-
-If you have any questions our US-based team is here Monday–Saturday, 10 AM–6 PM.
-Thank you for choosing DAZZLE PREMIUM!"""
-
-    return subject, message
-
-def generate_high_risk_email(parsed_data):
-    """Generates the high-risk order cancellation email."""
-    customer_name = parsed_data.get("customer_name", "[Customer Name Not Found]")
-
-    subject = f"Important: Your DAZZLE PREMIUM Order - Action Required"
-    message = f"""Hello {customer_name},
-
-We hope this message finds you well.
-
-We regret to inform you that your recent order has been automatically cancelled as it was flagged as a high-risk transaction by our system. This is a standard security measure to help prevent unauthorized or fraudulent activity.
-
-If you would still like to proceed with your order, we’d be happy to assist you in placing it manually. To do so, we kindly ask that you transfer the payment via Cash App.
-
-Once the payment is received, we will immediately process your order and provide confirmation along along with tracking details.
-
-If you have any questions or need assistance, feel free to reply to this email.
-
-Thank you,
-DAZZLE PREMIUM Support"""
-    return subject, message
-
-def generate_return_email(parsed_data):
-    """Generates the return mail template."""
-    customer_name = parsed_data.get("customer_name", "[Customer Name Not Found]") # Get the customer name
-
-    subject = f"DAZZLE PREMIUM: Your Return Request Instructions"
-    message = f"""Dear {customer_name},
-Thank you for reaching out to us regarding your return request. To 
-ensure a smooth and successful return process, please carefully follow 
-the steps below:
-1. Go to your local post office or any shipping carrier (USPS, FedEx, UPS, DHL).
-
-2. Create and pay for the return shipping label.
-(Please note: You are responsible for the return shipping cost.)
-
-3. Ship the item to the following address:
-
-Dazzle Premium 
-3500 East-West Highway 
-Suite 1032 
-Hyattsville, MD 20782 
-+1 (301) 942-0000 
-
-4. Email us the tracking number after you ship the package by replying to this email.
-
-Once we receive the returned item in its original condition with the 
-tags intact and complete our inspection, we will process your refund.
-If you have any questions, feel free to reply to this email.
-"""
-    return subject, message
-
-
-def generate_medium_risk_email(parsed_data):
-    """Generates the medium-risk order verification email."""
-    customer_name = parsed_data.get("customer_name", "[Customer Name Not Found]")
-    order_number = parsed_data.get("order_number", "[Order # Not Found]")
-    items = parsed_data.get("items", [])
-
-    # Build order details (similar to standard)
-    order_details_list = []
-    for item in items:
-        item_detail = (
-            f"• Product: {item.get('product_name', 'N/A')}\n"
-            f"• Style Code: {item.get('style_code', 'N/A')}\n"
-            f"• Size: {item.get('size', 'Size Not Found')}"
-        )
-        order_details_list.append(item_detail)
-    order_details = "\n".join(order_details_list) if order_details_list else "No items found."
+    parser = parse_shopify_export_compact
+    if float(os.environ.get("DAZZLE_PARSE_TIME_BUDGET") or DEFAULT_PARSE_TIME_BUDGET) > 0:
+        parser = GuardedParser(parse_shopify_export_compact, initializer=default_catalog)
+        parser.start() # Workers index the catalog now rather than during the first paste's time budget
+    return ParseCache(
+        parser,
+        maxsize=int(os.environ.get("DAZZLE_PARSE_CACHE_SIZE", DEFAULT_PARSE_CACHE_SIZE)),
+        ttl=float(os.environ.get("DAZZLE_PARSE_CACHE_TTL", DEFAULT_PARSE_CACHE_TTL)),
+    )
 
-    subject = f"Verification Required for dazzlepremium#{order_number}"
-    message = f"""Hello {customer_name},
+parse_cache = get_parse_cache()
 
-Thank you for shopping with DAZZLE PREMIUM. Our system has flagged your recent order (#{order_number}) for additional verification. For your security and to prevent fraudulent activity, we are unable to ship this order until it has been manually reviewed and confirmed.
+@st.cache_resource
+def get_order_store():
+    """The process-wide SQLite order history behind the header search (path from DAZZLE_ORDER_DB)."""
+    return OrderStore()
 
-Order Details:
-{order_details}
+order_store = get_order_store()
 
-To complete verification, please reply to this email with:
-- Your Order Number
-- A valid photo ID (you may cover sensitive information, but your name must be visible)
-- A picture of the payment card used (you may cover all digits except the last 4)
+@st.cache_resource
+def get_linkage_index():
+    """
+    Duplicate/repeat-customer index over the last DAZZLE_LINKAGE_DAYS of order history,
+    built once per process and kept current as batches are saved.
+    """
+    return LinkageIndex.from_store(order_store)
 
-Once we receive this information, our fraud prevention team will promptly review it and proceed with shipping.
+@st.cache_resource
+def get_risk_model():
+    """Risk rules compiled once per process, from DAZZLE_RISK_RULES or the built-in defaults."""
+    return load_risk_model()
 
-For your security: If you did not place this order, please text us immediately at 410-381-0000 so we can cancel and secure your account.
+@st.cache_resource(max_entries=4)
+def open_saved_export(path, modified_at):
+    """
+    Opens an export from DAZZLE_EXPORT_DIR once per process (keyed by path and mtime,
+    so a rewritten file is reopened). Tables are immutable and shared by every session.
+    """
+    return open_columnar_export(path)
 
-Note: Any order confirmed after 3:00 PM will be scheduled for the next business day.
+@st.cache_resource
+def get_job_queue():
+    """
+    Background jobs (batch parses, bulk emails) shared by every session (DAZZLE_JOB_DB /
+    DAZZLE_JOB_DIR). Batch parses score, link and save their orders in the job itself.
+    """
+    return JobQueue(services={"order_store": get_order_store, "linkage_index": get_linkage_index, "risk_model": get_risk_model})
+
+job_queue = get_job_queue()
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress(job_id, key):
+    """Progress bar and Cancel button for a running job; reruns only itself until the job finishes."""
+    job = job_queue.get(job_id)
+    if job is None or job.finished:
+        st.rerun() # Whole page, so the result is rendered
+    if job.status == "queued":
+        label = "Waiting for a free worker..."
+    elif job.progress_total:
+        label = f"{job.progress_done:,} / {job.progress_total:,} {job.message or ''}"
+    else:
+        label = "Starting..."
+    st.progress(job.fraction or 0.0, text=label)
+    if job.cancel_requested:
+        st.caption("Cancelling...")
+    elif st.button("Cancel", key=f"{key}_job_cancel"):
+        job_queue.cancel(job_id)
+
+def finish_batch_parse(job):
+    """
+    Turns a finished batch_parse job into what the Batch Orders tab shows: the job's
+    risk scores and links as columns, captions, and the download's name. Display only
+    (the job already saved the orders), so reconnecting sessions can run it again.
+    The session keeps only this: the table is the shared batch's zero-copy view plus
+    the added columns, and the download and bulk emails are built from the job.
+    """
+    result = resolve_batch_parse(job.params, job_queue.result(job.id))
+    risk_scores = result.get("risk")
+    links = result.get("links")
+    if result.get("risk_error"):
+        st.error(f"Risk rules: {result['risk_error']}")
+    captions = []
+    line_item_columns = result.get("line_items")
+    line_item_orders = None
+    if line_item_columns is not None:
+        # The display table is the shared batch's zero-copy view when there is one,
+        # otherwise it is built from the columns
+        shared_frame, warnings = result.get("frame"), []
+        if shared_frame is not None:
+            df = shared_frame
+        else:
+            if risk_scores is not None:
+                line_item_columns.set_templates(risk_scores.templates)
+            df = line_item_columns.to_pandas() if line_item_columns else pd.DataFrame()
+        if risk_scores is not None:
+            if shared_frame is not None: # to_pandas() already includes the templates just set
+                df = df.assign(Template=risk_columns(risk_scores, line_item_columns.row_orders)["Template"])
+            df = df.assign(**risk_columns(risk_scores, line_item_columns.row_orders, include_template=False))
+        if links is not None:
+            df = df.assign(**linkage_columns(links, line_item_columns.row_orders))
+        line_item_orders = line_item_columns.order_count
+    else:
+        df, warnings = result["frame"], result["warnings"]
+        if risk_scores is not None:
+            df = df.assign(**risk_columns(risk_scores)) # A new frame; the incremental parser's frame is reused
+        if links is not None:
+            df = df.assign(**linkage_columns(links))
+
+    if not df.empty:
+        if result.get("parsed_blocks") is not None:
+            captions.append(
+                f"Parsed {result['parsed_blocks']} new or changed order block(s); "
+                f"reused {result['reused_blocks']} from the previous parse."
+            )
+        if risk_scores is not None:
+            template_counts = pd.Series(risk_scores.templates).value_counts()
+            captions.append("Risk templates: " + " · ".join(
+                f"{EMAIL_TEMPLATE_LABELS.get(template, template)}: {count}" for template, count in template_counts.items()
+            ))
+        if links is not None:
+            duplicates, seen_before = sum(links["Duplicate Order"]), sum(links["Seen Before"])
+            repeat_customers = sum(count > 1 for count in links["Customer Orders"])
+            if duplicates or seen_before or repeat_customers:
+                captions.append(
+                    f"{duplicates} repeated order number(s) in this batch · {seen_before} already in the order history · "
+                    f"{repeat_customers} order(s) from returning customers"
+                )
 
-If you have any questions, our US-based team is available Monday–Saturday, 10 AM–6 PM.
+    export_format = job.params.get("export_format", "csv")
+    if export_format == "csv":
+        export = ("csv", "shopify_orders.csv", "text/csv")
+    else:
+        mime, suffix = COLUMNAR_EXPORT_FORMATS[export_format]
+        export = (export_format, f"shopify_orders_{time.strftime('%Y%m%d-%H%M%S')}{suffix}", mime)
+    return {"job_id": job.id, "df": df, "warnings": warnings, "captions": captions, "export": export,
+            "line_item_orders": line_item_orders, "templates": risk_scores is not None}
 
-We truly value your safety and appreciate your cooperation.
+def build_batch_export(batch_result):
+    """
+    The batch download's bytes, built when the download button is clicked (so no
+    session holds a copy). Line items are written from the job's columns.
+    """
+    export_format, file_name, _ = batch_result["export"]
+    df = batch_result["df"]
+    if export_format == "csv":
+        return df.to_csv(index=False)
+
+    line_item_columns = None
+    if batch_result["line_item_orders"] is not None:
+        line_item_columns = batch_line_items(job_queue, batch_result["job_id"])
+    if BATCH_EXPORT_DIR:
+        os.makedirs(BATCH_EXPORT_DIR, exist_ok=True)
+        export_file = open(os.path.join(BATCH_EXPORT_DIR, file_name), "w+b")
+    else:
+        export_file = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+    # Row groups stream into the file; line items keep their dictionary-encoded columns
+    with export_file:
+        if line_item_columns is not None:
+            line_item_columns.write_columnar(export_file, export_format)
+        else:
+            write_frame_columnar(df, export_file, export_format)
+        export_file.seek(0)
+        return export_file.read()
 
-Thank you for choosing DAZZLE PREMIUM!
-"""
-    return subject, message
+def page_bounds(total, page_size, key, label="Page"):
+    """
+    (start, stop) of the page chosen in a page selector, which is only shown when
+    there is more than one page. Pages are 1-based; a stale page past the end is clamped.
+    """
+    pages = max(1, -(-total // page_size))
+    if pages == 1:
+        return 0, total
+    if st.session_state.get(key, 1) > pages:
+        st.session_state[key] = pages
+    page = st.number_input(f"{label} (of {pages})", min_value=1, max_value=pages, step=1, key=key) # Starts at min_value
+    start = (page - 1) * page_size
+    return start, min(total, start + page_size)
+
+def rerun_fragment():
+    """Reruns only the calling fragment; a full-page run (e.g. first load) falls back to a full rerun."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def parse_and_store(raw_text_input):
+    """Parses an export through the shared cache and records the order in the order store."""
+    parsed_data = parse_cache.parse(raw_text_input)
+    order_store.save_parsed_order(parsed_data, raw_text_input)
+    return parsed_data
+
+def show_pasted_order(index):
+    """
+    Parses order `index` of the current paste (through the cache) and renders its email.
+    A refused parse (too large, or over its time budget) is kept as parse_error instead.
+    """
+    st.session_state.order_index = index
+    template = st.session_state.email_template
+    try:
+        parsed_data = parse_and_store(st.session_state.order_segments[index])
+    except ParseRejected as exc:
+        st.session_state.parse_error = str(exc)
+        st.session_state.parsed_data = {}
+        st.session_state.missing_info_flags = []
+        st.session_state.generated_subject = ""
+        st.session_state.generated_email_body = ""
+        return
+    subject, message = EMAIL_TEMPLATES[template](parsed_data)
+    st.session_state.parse_error = None
+    st.session_state.parsed_data = parsed_data
+    st.session_state.missing_info_flags = parsed_data["missing_info"]
+    st.session_state.generated_subject = subject
+    st.session_state.generated_email_body = message
+    st.session_state.current_step = f"generate_{template}"
+
+def generate_for_paste(raw_text_input, template):
+    """Splits the paste into orders and shows the first one's email; the rest are parsed as they are paged to."""
+    st.session_state.raw_text = raw_text_input
+    st.session_state.email_template = template
+    st.session_state.pasted_order_page = 1
+    try:
+        check_paste_size(raw_text_input)
+    except ParseRejected as exc:
+        st.session_state.order_segments = []
+        st.session_state.parse_error = str(exc)
+        st.session_state.generated_email_body = ""
+        return
+    st.session_state.order_segments = split_shopify_exports(raw_text_input)
+    show_pasted_order(0)
 
 def reset_app_state():
     """Resets all session state variables to their initial values."""
@@ -590,6 +350,9 @@ def reset_app_state():
     st.session_state.generated_email_body = ""
     st.session_state.generated_subject = ""
     st.session_state.missing_info_flags = [] # Reset this too
+    st.session_state.order_segments = []
+    st.session_state.order_index = 0
+    st.session_state.parse_error = None
     st.rerun() # Rerun to clear the UI immediately
 
 # --- Main Application Logic ---
@@ -608,10 +371,6 @@ st.markdown("""
     </div>
 
     <div class="actions">
-        <div class="search" title="Quickly find an order (visual)">
-            <svg class="ic" viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg"><path d="M21 21l-4.35-4.35" stroke="#6b7280" stroke-width="1.6" stroke-linecap="round" stroke-linejoin="round"/></svg>
-            <input placeholder="Find order or email..." />
-        </div>
         <div class="pill">Premium</div>
         <button class="btn primary" onclick="window.scrollTo({ top: 400, behavior: 'smooth' })">Generate Email</button>
         <button class="btn ghost" onclick="window.scrollTo({ top: 900, behavior: 'smooth' })">Batch Orders</button>
@@ -619,10 +378,34 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Order search over every order parsed so far (order #, email, phone, name, product or style code)
+search_query = st.text_input(
+    "Find order",
+    placeholder="🔍 Find order or email...",
+    key="order_search",
+    label_visibility="collapsed"
+)
+if search_query:
+    search_results = order_store.search(search_query)
+    if search_results:
+        st.dataframe(
+            pd.DataFrame(search_results).drop(columns=["id"]).rename(columns={
+                "order_number": "Order #", "customer_name": "Name", "email_address": "Email", "phone_number": "Phone",
+                "amount": "Amount ($)", "source": "Source", "items": "Items",
+                "updated_at": "Last Seen",
+            }).assign(**{"Last Seen": lambda frame: pd.to_datetime(frame["Last Seen"], unit="s")}),
+            use_container_width=True,
+            hide_index=True
+        )
+    else:
+        st.caption(f"No stored orders match “{search_query}”.")
+
 # Tabs for different sections
-tab1, tab2 = st.tabs(["📧 Email Generator", "📦 Batch Orders"])
+tab1, tab2, tab3 = st.tabs(["📧 Email Generator", "📦 Batch Orders", "📊 Analytics"])
 
-with tab1:
+@st.fragment
+def email_generator_tab():
+    """The Email Generator tab, as a fragment: its inputs and buttons rerun only this tab."""
     st.markdown("<h2 style='margin-top: 0;'>Generate Professional Emails</h2>", unsafe_allow_html=True)
     
     # Create two columns
@@ -646,62 +429,48 @@ with tab1:
         with col_buttons[0]:
             if st.button("✓ Confirmation", use_container_width=True, key="btn_confirm"):
                 if raw_text_input:
-                    st.session_state.raw_text = raw_text_input
-                    st.session_state.parsed_data = parse_shopify_export(raw_text_input)
-                    st.session_state.missing_info_flags = st.session_state.parsed_data["missing_info"]
-                    subject, message = generate_standard_email(st.session_state.parsed_data)
-                    st.session_state.generated_subject = subject
-                    st.session_state.generated_email_body = message
-                    st.session_state.current_step = "generate_standard"
-                    st.rerun()
+                    generate_for_paste(raw_text_input, "standard")
+                    rerun_fragment() # Only this tab needs redrawing
                 else:
                     st.warning("Please paste order details first")
         
         with col_buttons[1]:
             if st.button("⚠️ High-Risk", use_container_width=True, key="btn_highrisk"):
                 if raw_text_input:
-                    st.session_state.raw_text = raw_text_input
-                    st.session_state.parsed_data = parse_shopify_export(raw_text_input)
-                    st.session_state.missing_info_flags = st.session_state.parsed_data["missing_info"]
-                    subject, message = generate_high_risk_email(st.session_state.parsed_data)
-                    st.session_state.generated_subject = subject
-                    st.session_state.generated_email_body = message
-                    st.session_state.current_step = "generate_high_risk"
-                    st.rerun()
+                    generate_for_paste(raw_text_input, "high_risk")
+                    rerun_fragment() # Only this tab needs redrawing
                 else:
                     st.warning("Please paste order details first")
         
         with col_buttons[2]:
             if st.button("↩️ Return", use_container_width=True, key="btn_return"):
                 if raw_text_input:
-                    st.session_state.raw_text = raw_text_input
-                    st.session_state.parsed_data = parse_shopify_export(raw_text_input)
-                    st.session_state.missing_info_flags = st.session_state.parsed_data["missing_info"]
-                    subject, message = generate_return_email(st.session_state.parsed_data)
-                    st.session_state.generated_subject = subject
-                    st.session_state.generated_email_body = message
-                    st.session_state.current_step = "generate_return"
-                    st.rerun()
+                    generate_for_paste(raw_text_input, "return")
+                    rerun_fragment() # Only this tab needs redrawing
                 else:
                     st.warning("Please paste order details first")
         
         with col_buttons[3]:
             if st.button("🔍 Verify", use_container_width=True, key="btn_medium"):
                 if raw_text_input:
-                    st.session_state.raw_text = raw_text_input
-                    st.session_state.parsed_data = parse_shopify_export(raw_text_input)
-                    st.session_state.missing_info_flags = st.session_state.parsed_data["missing_info"]
-                    subject, message = generate_medium_risk_email(st.session_state.parsed_data)
-                    st.session_state.generated_subject = subject
-                    st.session_state.generated_email_body = message
-                    st.session_state.current_step = "generate_medium_risk"
-                    st.rerun()
+                    generate_for_paste(raw_text_input, "medium_risk")
+                    rerun_fragment() # Only this tab needs redrawing
                 else:
                     st.warning("Please paste order details first")
 
     with col_right:
         st.markdown("<h3>Email Preview</h3>", unsafe_allow_html=True)
 
+        # A paste of several order pages is stepped through one order at a time, without re-pasting
+        order_count = len(st.session_state.order_segments)
+        if order_count > 1:
+            index, _ = page_bounds(order_count, 1, "pasted_order_page", label="Order")
+            if index != st.session_state.order_index:
+                show_pasted_order(index)
+            st.caption(f"{order_count} orders in this paste · showing order {index + 1}")
+        if st.session_state.parse_error:
+            st.error(f"This order could not be parsed: {st.session_state.parse_error}")
+
         if st.session_state.generated_email_body:
             # Status indicator
             if st.session_state.missing_info_flags and st.session_state.current_step == "generate_standard":
@@ -715,37 +484,15 @@ with tab1:
             else:
                 st.markdown("""<div class="success-card"><strong>✓ Ready to send</strong></div>""", unsafe_allow_html=True)
 
+            # st.code blocks come with a copy-to-clipboard button
             st.markdown("<h4>To</h4>", unsafe_allow_html=True)
-            st.markdown(f"""
-                <div class="data-display-box">
-                    <span>{st.session_state.parsed_data.get('email_address', 'N/A')}</span>
-                    <button class="copy-button" id="copyEmailBtn" onclick="copyToClipboard(
-                        '{st.session_state.parsed_data.get('email_address', 'N/A').replace("'", "\\'")}', 'copyEmailBtn'
-                    )">Copy</button>
-                </div>
-            """, unsafe_allow_html=True)
+            st.code(st.session_state.parsed_data.get('email_address', 'N/A'), language=None)
 
             st.markdown("<h4>Subject</h4>", unsafe_allow_html=True)
-            st.markdown(f"""
-                <div class="data-display-box">
-                    <span>{st.session_state.generated_subject}</span>
-                    <button class="copy-button" id="copySubjectBtn" onclick="copyToClipboard(
-                        '{st.session_state.generated_subject.replace("'", "\\'")}', 'copySubjectBtn'
-                    )">Copy</button>
-                </div>
-            """, unsafe_allow_html=True)
+            st.code(st.session_state.generated_subject, language=None)
 
             st.markdown("<h4>Message</h4>", unsafe_allow_html=True)
             st.code(st.session_state.generated_email_body, language="text")
-            
-            js_safe_email_body = json.dumps(st.session_state.generated_email_body)
-            st.markdown(f"""
-                <div style="text-align: right; margin: -0.8rem 0 1.2rem 0;">
-                    <button class="copy-button" id="copyBodyBtn" onclick="copyToClipboard(
-                        {js_safe_email_body}, 'copyBodyBtn'
-                    )">Copy Message</button>
-                </div>
-            """, unsafe_allow_html=True)
 
             # Show extracted data in an expander
             with st.expander("👁️ View extracted data"):
@@ -767,10 +514,13 @@ with tab1:
                         </div>
                     """, unsafe_allow_html=True)
 
-                    if st.session_state.parsed_data.get("items"):
+                    items = st.session_state.parsed_data.get("items")
+                    if items:
                         st.markdown("<h4 style='margin-top: 1rem;'>Items Ordered</h4>", unsafe_allow_html=True)
-                        for idx, item in enumerate(st.session_state.parsed_data["items"], 1):
-                            st.markdown(f"""
+                        start, stop = page_bounds(len(items), PREVIEW_ITEMS_PAGE_SIZE, "preview_items_page")
+                        # One markdown element per page of cards, not one per item
+                        st.markdown("".join(
+                            f"""
                                 <div class="order-item">
                                     <div class="item-detail"><span class="label">Item {idx}</span></div>
                                     <div class="item-detail"><span class="label">Product</span> <span class="value">{item.get('product_name', 'N/A')}</span></div>
@@ -778,14 +528,140 @@ with tab1:
                                     <div class="item-detail"><span class="label">Size</span> <span class="value">{item.get('size', 'Not found')}</span></div>
                                     <div class="item-detail"><span class="label">Qty</span> <span class="value">{item.get('quantity', 1)}</span></div>
                                 </div>
-                            """, unsafe_allow_html=True)
+                            """
+                            for idx, item in enumerate(items[start:stop], start + 1)
+                        ), unsafe_allow_html=True)
+
+                cache_stats = parse_cache.stats()
+                st.caption(f"Parse cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses · {cache_stats['size']}/{cache_stats['maxsize']} orders cached")
 
             st.markdown("<div style='margin-top: 1.5rem;'></div>", unsafe_allow_html=True)
             if st.button("🔄 New order", use_container_width=True, key="btn_reset"):
                 reset_app_state()
-        else:
+        elif not st.session_state.parse_error:
             st.markdown("""<p style='color: #bdc3c7; text-align: center; padding: 3rem 1rem; font-size: 1.05rem;'>Paste an order on the left &rarr;</p>""", unsafe_allow_html=True)
 
+with tab1:
+    email_generator_tab()
+
+@st.fragment
+def batch_results_view(batch_result):
+    """Extracted orders table (paged), captions and download, as a fragment."""
+    df = batch_result["df"]
+
+    if df.empty:
+        st.error("No valid orders could be extracted.")
+    else:
+        st.subheader("Extracted Orders")
+        for caption in batch_result["captions"]:
+            st.caption(caption)
+        # Only one page of rows is sent to the browser; paging reruns just this fragment
+        start, stop = page_bounds(len(df), BATCH_TABLE_PAGE_ROWS, "batch_table_page")
+        st.dataframe(df.iloc[start:stop], use_container_width=True)
+        if stop - start < len(df):
+            st.caption(f"Rows {start + 1:,}–{stop:,} of {len(df):,} (downloads include every row)")
+
+        export_format, file_name, mime = batch_result["export"]
+        if export_format != "csv" and importlib.util.find_spec("pyarrow") is None:
+            st.error("Parquet and Feather exports need pyarrow (pip install pyarrow).")
+        else:
+            st.download_button(
+                "⬇️ Download as CSV" if export_format == "csv" else f"⬇️ Download {file_name}",
+                lambda: build_batch_export(batch_result),
+                file_name=file_name,
+                mime=mime,
+                use_container_width=True
+            )
+            if BATCH_EXPORT_DIR and export_format != "csv":
+                st.caption(f"Downloads are also saved to {BATCH_EXPORT_DIR}; reopen them below without re-parsing.")
+
+    if batch_result["warnings"]:
+        st.warning(f"{len(batch_result['warnings'])} order(s) skipped — check your data format")
+
+@st.fragment
+def bulk_email_panel(batch_result):
+    """
+    Bulk email generation for a "Full line items" parse, as a fragment. The email
+    jobs read the line items from the parse job, not from the session.
+    """
+    st.markdown("<h3>Bulk Email Generation</h3>", unsafe_allow_html=True)
+    template_options = list(EMAIL_TEMPLATE_LABELS)
+    if batch_result["templates"]:
+        template_options.insert(0, None) # Per-order rule column
+    template_choice = st.selectbox(
+        "Email template",
+        template_options,
+        format_func=lambda key: "Per order (Template column)" if key is None else EMAIL_TEMPLATE_LABELS[key],
+        key="bulk_email_template"
+    )
+    export_format = st.radio(
+        "Download format",
+        list(EMAIL_EXPORT_FORMATS),
+        format_func={"zip": "ZIP of .eml drafts", "jsonl": "JSONL", "csv": "CSV"}.get,
+        horizontal=True,
+        key="bulk_email_format"
+    )
+
+    if st.button("Generate emails", use_container_width=True, key="btn_bulk_emails"):
+        st.session_state.email_job_id = job_queue.submit(
+            "bulk_render", {"template": template_choice, "export_format": export_format, "batch_job": batch_result["job_id"]}
+        )
+        st.query_params["email_job"] = st.session_state.email_job_id
+
+    email_job_id = st.session_state.email_job_id or st.query_params.get("email_job")
+    email_job = job_queue.get(email_job_id) if email_job_id else None
+    if email_job is not None and not email_job.finished:
+        job_progress(email_job.id, "emails")
+    elif email_job is not None and email_job.status == "failed":
+        st.error(f"Email generation failed: {email_job.error}")
+    elif email_job is not None and email_job.status == "done":
+        rendered = job_queue.result(email_job.id)
+        _, mime, file_name = EMAIL_EXPORT_FORMATS[email_job.params["export_format"]]
+        st.success(f"Generated {rendered['count']} emails")
+        st.download_button(
+            f"⬇️ Download {file_name}",
+            rendered["data"],
+            file_name=file_name,
+            mime=mime,
+            use_container_width=True,
+            key="btn_bulk_emails_download"
+        )
+
+    # Sending goes through the dispatch ledger: an order already sent is only mailed again on an explicit resend
+    try:
+        smtp_settings = SmtpSettings.from_env()
+    except DispatchError as exc:
+        st.error(f"Email sending: {exc}")
+        smtp_settings = None
+    if smtp_settings is None:
+        st.caption("Set DAZZLE_SMTP_HOST and DAZZLE_MAIL_FROM to send these emails directly instead of downloading them.")
+        return
+    st.caption(f"Sends through {smtp_settings.host}:{smtp_settings.port} as {smtp_settings.sender}. "
+               "Orders already sent an email are skipped.")
+    resend = st.checkbox("Resend orders already sent with a different template", key="send_emails_resend")
+    confirmed = st.checkbox(f"Send {batch_result['line_item_orders']:,} emails to customers", key="send_emails_confirm")
+    if st.button("📨 Send emails", use_container_width=True, disabled=not confirmed, key="btn_send_emails"):
+        st.session_state.send_job_id = job_queue.submit(
+            "email_dispatch", {"template": template_choice, "batch_job": batch_result["job_id"], "resend": resend}
+        )
+        st.query_params["send_job"] = st.session_state.send_job_id
+
+    send_job_id = st.session_state.send_job_id or st.query_params.get("send_job")
+    send_job = job_queue.get(send_job_id) if send_job_id else None
+    if send_job is not None and not send_job.finished:
+        job_progress(send_job.id, "send")
+    elif send_job is not None and send_job.status == "failed":
+        st.error(f"Sending failed: {send_job.error}")
+    elif send_job is not None and send_job.status == "cancelled":
+        st.info("Sending cancelled. Emails already sent stay recorded; sending again only sends the rest.")
+    elif send_job is not None:
+        dispatched = job_queue.result(send_job.id)
+        counts = dispatched["counts"]
+        st.success(" · ".join(f"{counts.get(status, 0):,} {status}" for status in ("sent", "skipped", "invalid", "failed")))
+        unsent = [result for result in dispatched["results"] if result["status"] != "sent"]
+        if unsent:
+            st.dataframe(pd.DataFrame(unsent).drop(columns=["message_id"]), use_container_width=True, hide_index=True)
+
 with tab2:
     st.markdown("<h2 style='margin-top: 0;'>Batch Processing</h2>", unsafe_allow_html=True)
 
@@ -796,61 +672,220 @@ with tab2:
         key="batch_orders_textarea"
     )
 
-    def parse_orders(text):
-        rows = []
-        warnings = []
-
-        if "Select gid://shopify/Order/" not in text:
-            return pd.DataFrame(), ["No Shopify order blocks found"]
-
-        blocks = text.split("Select gid://shopify/Order/")[1:]
-
-        for block in blocks:
-            order = name = amount = None
-
-            order_match = re.search(r"#\d+", block)
-            if order_match:
-                order = order_match.group(0)
+    uploaded_export = st.file_uploader(
+        "Or upload an export file (TXT orders page, CSV or JSON/JSONL)",
+        type=["txt", "csv", "json", "jsonl"],
+        key="batch_orders_file"
+    )
 
-            amount_match = re.search(r"\$[\d,]+\.\d{2}", block)
-            if amount_match:
-                amount = float(
-                    amount_match.group(0).replace("$", "").replace(",", "")
-                )
+    parse_mode = st.radio(
+        "Parse mode",
+        ["Order summary", "Full line items"],
+        horizontal=True,
+        key="batch_parse_mode",
+        help="Full line items runs the Email Generator parser on every order (items, sizes, style codes, phone, email) across worker processes."
+    )
+    batch_export_format = st.radio(
+        "Export format",
+        ["csv"] + list(COLUMNAR_EXPORT_FORMATS),
+        format_func={"csv": "CSV", "parquet": "Parquet", "feather": "Feather (Arrow IPC)"}.get,
+        horizontal=True,
+        key="batch_export_format",
+        help="Parquet and Feather keep column types and reopen without re-parsing (see Open previous export)."
+    )
 
-            name_match = re.search(r"\d+\sitems?\s*\n([^\n]+)", block)
-            if name_match:
-                candidate = name_match.group(1).strip()
-                if "$" not in candidate and len(candidate) > 1:
-                    name = candidate
-
-            if order and name and amount is not None:
-                rows.append({
-                    "Order Number": order,
-                    "Customer Name": name,
-                    "Amount ($)": amount
-                })
-            else:
-                warnings.append("One order skipped due to incomplete parsing")
+    if st.button("Parse Orders", use_container_width=True, key="btn_parse"):
+        # The parse runs as a background job; the page (and the Email Generator tab) stays usable
+        if uploaded_export is not None:
+            payload = {"name": uploaded_export.name, "data": uploaded_export.getvalue()}
+        else:
+            payload = raw_text
+        # The job parses with its own copy, so a rerun (or another Parse) can't change it mid-parse;
+        # the session adopts the copy once the job is done
+        job_parser = st.session_state.batch_incremental_parser.copy()
+        st.session_state.batch_job_id = job_queue.submit(
+            "batch_parse",
+            {
+                "mode": "line_items" if parse_mode == "Full line items" else "summary",
+                "export_format": batch_export_format,
+                "batch_id": st.session_state.batch_id,
+            },
+            payload,
+            local={"incremental_parser": job_parser},
+        )
+        st.session_state.batch_job_parser = (st.session_state.batch_job_id, job_parser)
+        st.session_state.batch_result = None
+        st.query_params["batch_job"] = st.session_state.batch_job_id # Lets a refreshed page find the job again
+
+    batch_job_id = st.session_state.batch_job_id or st.query_params.get("batch_job")
+    batch_job = job_queue.get(batch_job_id) if batch_job_id else None
+    if batch_job is not None and st.session_state.batch_job_id is None: # A refreshed page carries on the same batch
+        st.session_state.batch_job_id = batch_job.id
+        st.session_state.batch_id = batch_job.params.get("batch_id", st.session_state.batch_id)
+    if batch_job is not None and not batch_job.finished:
+        job_progress(batch_job.id, "batch")
+    elif batch_job is not None and batch_job.status != "done":
+        if batch_job.status == "failed":
+            st.error(f"Parse failed: {batch_job.error}")
+        else:
+            st.info("Parse cancelled.")
+    elif batch_job is not None:
+        if st.session_state.batch_job_parser is not None and st.session_state.batch_job_parser[0] == batch_job.id:
+            st.session_state.batch_incremental_parser = st.session_state.batch_job_parser[1]
+            st.session_state.batch_job_parser = None
+        batch_result = st.session_state.batch_result
+        if batch_result is None or batch_result["job_id"] != batch_job.id:
+            try:
+                batch_result = st.session_state.batch_result = finish_batch_parse(batch_job)
+            except JobError as exc: # Its parsed table is gone from the job directory
+                batch_result = None
+                st.error(str(exc))
+        if batch_result is not None:
+            batch_results_view(batch_result)
+
+    if st.session_state.batch_result is not None and st.session_state.batch_result["line_item_orders"]:
+        bulk_email_panel(st.session_state.batch_result)
+
+    with st.expander("📂 Open previous export"):
+        st.caption("Reopen a Parquet or Feather export without re-parsing. Saved Feather files are memory-mapped, not read.")
+        saved_exports = list_saved_exports(BATCH_EXPORT_DIR) if BATCH_EXPORT_DIR else []
+        saved_choice = None
+        if saved_exports:
+            saved_choice = st.selectbox(
+                f"Saved in {BATCH_EXPORT_DIR}",
+                [None] + saved_exports,
+                format_func=lambda path: "—" if path is None else os.path.basename(path),
+                key="batch_saved_export"
+            )
+        previous_export = st.file_uploader(
+            "Or upload one",
+            type=["parquet", "feather", "arrow"],
+            key="batch_previous_export"
+        )
 
-        return pd.DataFrame(rows), warnings
+        opened_table = None
+        try:
+            if previous_export is not None:
+                opened_table = open_columnar_export(previous_export.getbuffer())
+            elif saved_choice is not None:
+                opened_table = open_saved_export(saved_choice, os.path.getmtime(saved_choice))
+        except ExportFormatError as exc:
+            st.error(str(exc))
+        except ImportError:
+            st.error("Opening Parquet and Feather exports needs pyarrow (pip install pyarrow).")
+        except OSError as exc:
+            st.error(f"Could not open {saved_choice}: {exc.strerror}")
+
+        if opened_table is not None:
+            st.caption(
+                f"{opened_table.num_rows:,} rows · {opened_table.num_columns} columns"
+                + (f" · showing the first {OPENED_EXPORT_PREVIEW_ROWS:,}" if opened_table.num_rows > OPENED_EXPORT_PREVIEW_ROWS else "")
+            )
+            st.dataframe(opened_table.slice(0, OPENED_EXPORT_PREVIEW_ROWS), use_container_width=True)
 
-    if st.button("Parse Orders", use_container_width=True, key="btn_parse"):
-        df, warnings = parse_orders(raw_text)
 
-        if df.empty:
-            st.error("No valid orders could be extracted.")
+# --- Analytics ---
+@st.fragment
+def analytics_tab():
+    """
+    The Analytics tab, as a fragment. Every chart reads the order store's rollup
+    tables, which are updated as batches are saved, so nothing here groups over
+    the order history.
+    """
+    st.markdown("<h2 style='margin-top: 0;'>Order Analytics</h2>", unsafe_allow_html=True)
+    period = st.selectbox("Period", list(ANALYTICS_PERIODS), index=2, key="analytics_period")
+    days = ANALYTICS_PERIODS[period]
+    since_day = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat() if days else None
+
+    daily = pd.DataFrame(order_store.daily_rollup(since_day), columns=["Day", "Orders", "Priced Orders", "Revenue ($)"])
+    if daily.empty:
+        st.caption("No stored orders in this period yet. Orders are added as batches and pasted orders are parsed.")
+        return
+    daily["Day"] = pd.to_datetime(daily["Day"])
+    daily = daily.set_index("Day")
+    total_orders, priced_orders, revenue = daily["Orders"].sum(), daily["Priced Orders"].sum(), daily["Revenue ($)"].sum()
+
+    col_orders, col_revenue, col_average = st.columns(3)
+    col_orders.metric("Orders", f"{total_orders:,}")
+    col_revenue.metric("Revenue", f"${revenue:,.2f}")
+    col_average.metric("Avg order value", f"${revenue / priced_orders:,.2f}" if priced_orders else "–")
+
+    st.markdown("<h3>Revenue by day</h3>", unsafe_allow_html=True)
+    st.bar_chart(daily["Revenue ($)"])
+    st.markdown("<h3>Orders by day</h3>", unsafe_allow_html=True)
+    st.line_chart(daily["Orders"])
+    st.caption("Days are when an order was first saved; orders without a known total count as orders but not as revenue.")
+
+    col_customers, col_sizes = st.columns(2)
+    with col_customers:
+        st.markdown("<h3>Top customers (all time)</h3>", unsafe_allow_html=True)
+        st.dataframe(
+            pd.DataFrame(order_store.top_customers(ANALYTICS_TOP_ROWS), columns=["Name", "Email", "Orders", "Revenue ($)"]),
+            use_container_width=True,
+            hide_index=True
+        )
+    with col_sizes:
+        st.markdown("<h3>Sizes (all time)</h3>", unsafe_allow_html=True)
+        sizes = pd.DataFrame(order_store.item_distribution("size"), columns=["Size", "Line Items", "Quantity"])
+        if sizes.empty:
+            st.caption("No line items stored yet.")
+        else:
+            st.bar_chart(sizes.set_index("Size")["Quantity"])
+
+    styles = pd.DataFrame(order_store.item_distribution("style_code", ANALYTICS_TOP_ROWS), columns=["Style Code", "Line Items", "Quantity"])
+    if not styles.empty:
+        st.markdown(f"<h3>Top {ANALYTICS_TOP_ROWS} style codes (all time)</h3>", unsafe_allow_html=True)
+        st.bar_chart(styles.set_index("Style Code")["Quantity"], horizontal=True)
+
+with tab3:
+    analytics_tab()
+
+
+# --- Diagnostics (hidden; open the app with ?diagnostics=1 or set DAZZLE_DIAGNOSTICS=1) ---
+if INSTRUMENTATION.enabled:
+    INSTRUMENTATION.record("streamlit_rerun", time.perf_counter() - rerun_started, [])
+
+if st.query_params.get("diagnostics") == "1" or os.environ.get("DAZZLE_DIAGNOSTICS") == "1":
+    with st.expander("🩺 Diagnostics"):
+        recent_traces = INSTRUMENTATION.recent(DIAGNOSTIC_TRACES_SHOWN)
+        if recent_traces:
+            st.dataframe(
+                pd.DataFrame([
+                    {
+                        "Operation": trace["operation"],
+                        "Total (ms)": round(trace["total_ms"], 3),
+                        "Input (chars)": trace["input_size"],
+                        **{f"{stage} (ms)": round(ms, 3) for stage, ms in trace["stages_ms"].items()},
+                    }
+                    for trace in recent_traces
+                ]),
+                use_container_width=True,
+                hide_index=True
+            )
         else:
-            st.subheader("Extracted Orders")
-            st.dataframe(df, use_container_width=True)
+            st.caption("No instrumented calls yet (DAZZLE_INSTRUMENTATION may be off).")
 
+        col_prometheus, col_json = st.columns(2)
+        with col_prometheus:
             st.download_button(
-                "⬇️ Download as CSV",
-                df.to_csv(index=False),
-                file_name="shopify_orders.csv",
-                mime="text/csv",
-                use_container_width=True
+                "⬇️ Prometheus metrics",
+                INSTRUMENTATION.to_prometheus(),
+                file_name="dazzle_metrics.prom",
+                mime="text/plain",
+                use_container_width=True,
+                key="btn_metrics_prometheus"
             )
-
-        if warnings:
-            st.warning(f"{len(warnings)} order(s) skipped — check your data format")
+        with col_json:
+            st.download_button(
+                "⬇️ Metrics JSON",
+                json.dumps(INSTRUMENTATION.to_json(), indent=2),
+                file_name="dazzle_metrics.json",
+                mime="application/json",
+                use_container_width=True,
+                key="btn_metrics_json"
+            )
+        if INSTRUMENTATION.profile_dir:
+            st.caption(f"{INSTRUMENTATION.profile_sample:.0%} of calls are stack-sampled; those slower than "
+                       f"{INSTRUMENTATION.profile_slow_seconds * 1000:.0f} ms are profiled into {INSTRUMENTATION.profile_dir}")
+        else:
+            st.caption("Set DAZZLE_PROFILE_DIR (and DAZZLE_PROFILE_SLOW_MS, DAZZLE_PROFILE_SAMPLE) to capture profiles of slow inputs.")
@@ -0,0 +1,197 @@
+"""
+Benchmark harness for parse_shopify_export, parse_orders and incremental re-parses.
+
+Times both parsers over a seeded synthetic corpus, reports p50/p95/p99 latency,
+throughput in orders/sec and peak RSS, and can save a baseline JSON and compare
+later runs against it (exit status 1 on a regression).
+
+    python benchmarks/bench_parsers.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_parsers.py --compare benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dazzle.parsing import IncrementalOrdersParser, parse_orders, parse_shopify_export # noqa: E402
+from synthetic_exports import make_order_corpus, make_orders_page # noqa: E402
+
+# Metrics compared against the baseline; higher is worse for latencies, lower is worse for throughput
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+THROUGHPUT_METRIC = "orders_per_sec"
+BENCHMARKS = ("parse_shopify_export", "parse_orders", "parse_orders_incremental")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # bytes on macOS, KB on Linux
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, orders):
+    """Builds the result record for one benchmark from per-call latencies (seconds)."""
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {
+        "calls": len(latencies),
+        "orders": orders,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "orders_per_sec": orders / total if total else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_parse_shopify_export(order_count, seed, missing_rate):
+    """Times parse_shopify_export once per synthetic order export."""
+    corpus = make_order_corpus(seed, order_count, missing_rate=missing_rate)
+    for export_text in corpus[:50]: # Warm up regex caches and the allocator
+        parse_shopify_export(export_text)
+
+    latencies = []
+    clock = time.perf_counter
+    for export_text in corpus:
+        started = clock()
+        parse_shopify_export(export_text)
+        latencies.append(clock() - started)
+    return summarize(latencies, order_count)
+
+
+def bench_parse_orders(page_count, blocks_per_page, seed):
+    """Times parse_orders once per synthetic orders page of `blocks_per_page` blocks."""
+    rng = random.Random(seed)
+    latencies = []
+    for page in range(page_count):
+        page_text = make_orders_page(rng, blocks_per_page, first_order_number=1001 + page * blocks_per_page)
+        started = time.perf_counter()
+        parse_orders(page_text)
+        latencies.append(time.perf_counter() - started)
+        del page_text
+    return summarize(latencies, page_count * blocks_per_page)
+
+
+def bench_parse_orders_incremental(page_count, blocks_per_page, added_blocks, seed):
+    """
+    Times IncrementalOrdersParser re-parsing each orders page after `added_blocks`
+    new orders are pasted on top (the first parse of the page is not timed).
+    Throughput counts only the added orders, which is all a re-parse should pay for.
+    """
+    rng = random.Random(seed)
+    latencies = []
+    for page in range(page_count):
+        first_order_number = 1001 + page * (blocks_per_page + added_blocks)
+        page_text = make_orders_page(rng, blocks_per_page, first_order_number=first_order_number + added_blocks)
+        added_text = make_orders_page(rng, added_blocks, first_order_number=first_order_number)
+        parser = IncrementalOrdersParser()
+        parser.parse(page_text)
+        started = time.perf_counter()
+        parser.parse(added_text + page_text)
+        latencies.append(time.perf_counter() - started)
+        del page_text, added_text, parser
+    return summarize(latencies, page_count * added_blocks)
+
+
+def run_benchmarks(args):
+    """Runs every benchmark and returns the report dict."""
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "orders": args.orders,
+            "pages": args.pages,
+            "page_blocks": args.page_blocks,
+            "added_blocks": args.added_blocks,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "parse_shopify_export": bench_parse_shopify_export(args.orders, args.seed, args.missing_rate),
+        "parse_orders": bench_parse_orders(args.pages, args.page_blocks, args.seed),
+        "parse_orders_incremental": bench_parse_orders_incremental(args.pages, args.page_blocks, args.added_blocks, args.seed),
+    }
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Returns a list of human-readable regressions beyond `tolerance` (a fraction, e.g. 0.2 = 20%)."""
+    regressions = []
+    for name in BENCHMARKS:
+        current, previous = report.get(name), baseline.get(name)
+        if not current or not previous:
+            continue
+        for metric in LATENCY_METRICS:
+            if previous[metric] and current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {previous[metric]:.3f} -> {current[metric]:.3f} ms")
+        if previous[THROUGHPUT_METRIC] and current[THROUGHPUT_METRIC] < previous[THROUGHPUT_METRIC] * (1 - tolerance):
+            regressions.append(f"{name}.{THROUGHPUT_METRIC}: {previous[THROUGHPUT_METRIC]:.0f} -> {current[THROUGHPUT_METRIC]:.0f}")
+    return regressions
+
+
+def print_report(report):
+    """Prints a compact table of the results."""
+    print(f"{'benchmark':<26}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'orders/s':>12}{'peak RSS MB':>13}")
+    for name in BENCHMARKS:
+        result = report[name]
+        rss = f"{result['peak_rss_mb']:.1f}" if result["peak_rss_mb"] is not None else "n/a"
+        print(f"{name:<26}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+              f"{result['orders_per_sec']:>12.0f}{rss:>13}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the DAZZLE PREMIUM order parsers on synthetic exports.")
+    parser.add_argument("--orders", type=int, default=2000, help="single-order exports for parse_shopify_export")
+    parser.add_argument("--pages", type=int, default=5, help="orders pages for parse_orders")
+    parser.add_argument("--page-blocks", type=int, default=10000, help="order blocks per orders page")
+    parser.add_argument("--added-blocks", type=int, default=50, help="orders pasted on top before an incremental re-parse")
+    parser.add_argument("--missing-rate", type=float, default=0.1, help="chance of dropping each customer field")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the report as a baseline JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a metric counts as a regression")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            regressions = compare_to_baseline(report, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("Regressions vs baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions vs baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
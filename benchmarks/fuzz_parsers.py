@@ -0,0 +1,180 @@
+"""
+Worst-case latency harness for the parsers on hostile or malformed pastes.
+
+Two kinds of input are timed:
+
+- Pathological families: inputs built to make a backtracking regex go quadratic
+  (long word or digit runs without "@", dotted runs, repeated confirmation lines,
+  parenthesis runs, ...). Each family is timed at doubling sizes; time growing much
+  faster than the input (GROWTH_LIMIT per doubling) fails the run.
+- Mutations: seeded random edits of synthetic exports (spliced junk, duplicated
+  and deleted spans, very long lines), cut to the guarded parse mode's size limits.
+  No single parse may exceed --max-ms.
+
+The guarded parse mode is also checked: a parse that cannot finish must come back
+as ParseTimeout within its budget.
+
+    python benchmarks/fuzz_parsers.py
+    python benchmarks/fuzz_parsers.py --max-size 131072 --mutations 5000 --max-ms 100
+
+Exit status 1 when any check fails.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dazzle.guard import MAX_ORDER_CHARS, GuardedParser, ParseTimeout, clip_long_lines # noqa: E402
+from dazzle.parsing import parse_order_block, parse_shopify_export, split_shopify_exports # noqa: E402
+from synthetic_exports import make_order_corpus # noqa: E402
+
+GROWTH_LIMIT = 3.0 # Max time ratio per doubling of the input (2.0 is linear; quadratic is 4.0)
+MIN_TIMED_MS = 5.0 # Below this, timer noise swamps the growth ratio
+CONFIRMATION = "Order confirmation email was sent to "
+JUNK_PIECES = ["@", ".", "-", "(", ")", " ", "\n", "#", "$", "x", "1", "a", "é", CONFIRMATION, "Email:", "Phone:", " - "]
+
+# Family -> builder of an input of about `size` characters
+PATHOLOGICAL_FAMILIES = {
+    "word_run": lambda size: "a" * size,
+    "digit_run": lambda size: "1" * size,
+    "dotted_run": lambda size: "a." * (size // 2),
+    "dash_run": lambda size: "-" * size,
+    "at_runs": lambda size: "a@" * (size // 2),
+    "domain_dots": lambda size: "x@" + "a." * (size // 2) + "!",
+    "confirmation_paren": lambda size: CONFIRMATION + "(a@" + "a." * (size // 2) + "!",
+    "confirmation_repeat": lambda size: (CONFIRMATION + "x (y ") * (size // 43),
+    "paren_run": lambda size: CONFIRMATION + " (" * (size // 2),
+    "phone_separators": lambda size: "1-(" * (size // 3),
+    "size_whitespace": lambda size: "US" + " " * size + "x",
+    "style_code_dashes": lambda size: " - A" * (size // 4),
+    "header_lines": lambda size: "#1001\n#1002\n" * (size // 12),
+    "item_count_digits": lambda size: "9" * size + " items",
+}
+
+# Parsers exercised per family: the single-order parser, the paste splitter and the batch block parser
+PARSERS = {
+    "parse_shopify_export": parse_shopify_export,
+    "split_shopify_exports": split_shopify_exports,
+    "parse_order_block": parse_order_block,
+}
+
+
+def time_call(func, text, repeat=5):
+    """Best-of-`repeat` wall time of func(text), in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(text)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def check_growth(min_size, max_size):
+    """Times every family at doubling sizes; returns (rows, failures)."""
+    rows, failures = [], []
+    for family, build in PATHOLOGICAL_FAMILIES.items():
+        for parser_name, parser in PARSERS.items():
+            previous_ms = None
+            size = min_size
+            while size <= max_size:
+                elapsed_ms = time_call(parser, build(size))
+                if previous_ms is not None and previous_ms >= MIN_TIMED_MS and elapsed_ms > previous_ms * GROWTH_LIMIT:
+                    failures.append(f"{parser_name} / {family}: {previous_ms:.1f} -> {elapsed_ms:.1f} ms at {size:,} chars")
+                previous_ms = elapsed_ms
+                size *= 2
+            rows.append((parser_name, family, max_size, previous_ms))
+    return rows, failures
+
+
+def mutate(rng, text):
+    """One random edit of an export: spliced junk, a duplicated or deleted span, or a very long line."""
+    position = rng.randrange(len(text) + 1)
+    edit = rng.randrange(4)
+    if edit == 0:
+        junk = "".join(rng.choice(JUNK_PIECES) for _ in range(rng.randint(1, 400)))
+        return text[:position] + junk + text[position:]
+    if edit == 1:
+        span = text[position:position + rng.randint(1, 2000)]
+        return text[:position] + span * rng.randint(2, 50) + text[position:]
+    if edit == 2:
+        return text[:position] + text[position + rng.randint(1, 500):]
+    return text[:position] + rng.choice(JUNK_PIECES) * rng.randint(1000, 20000) + text[position:]
+
+
+def check_mutations(count, seed, max_ms):
+    """Parses `count` mutated exports; returns (worst ms, failures)."""
+    rng = random.Random(seed)
+    corpus = make_order_corpus(seed, 200)
+    worst_ms, failures = 0.0, []
+    for _ in range(count):
+        text = rng.choice(corpus)
+        for _ in range(rng.randint(1, 5)):
+            text = mutate(rng, text)
+        text = clip_long_lines(text[:MAX_ORDER_CHARS]) # What GuardedParser lets through to the parser
+        elapsed_ms = time_call(parse_shopify_export, text, repeat=1)
+        worst_ms = max(worst_ms, elapsed_ms)
+        if elapsed_ms > max_ms:
+            failures.append(f"mutation of {len(text):,} chars took {elapsed_ms:.1f} ms: {text[:80]!r}...")
+    return worst_ms, failures
+
+
+# Nested quantifiers: exponential backtracking on a run of "x" with no "y" after it. The
+# guard pickles its parser to a worker process, so it must be importable, not a local function.
+STUCK_PATTERN = re.compile(r"(x+x+)+y")
+
+
+def check_time_budget(budget):
+    """A parse that never finishes must raise ParseTimeout close to `budget` seconds; returns failures."""
+    guarded = GuardedParser(STUCK_PATTERN.match, time_budget=budget, workers=1)
+    try:
+        guarded.start()
+        started = time.perf_counter()
+        try:
+            guarded("x" * 64)
+        except ParseTimeout:
+            elapsed = time.perf_counter() - started
+            if elapsed > budget * 2 + 0.5:
+                return [f"ParseTimeout after {elapsed:.2f}s for a {budget:g}s budget"]
+            return []
+        return ["a stuck parse returned instead of timing out"]
+    finally:
+        guarded.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that parser latency stays bounded on hostile pastes.")
+    parser.add_argument("--min-size", type=int, default=4096, help="smallest pathological input (characters)")
+    parser.add_argument("--max-size", type=int, default=65536, help="largest pathological input (characters)")
+    parser.add_argument("--mutations", type=int, default=2000, help="mutated exports to parse")
+    parser.add_argument("--max-ms", type=float, default=250.0, help="latency limit for one mutated export")
+    parser.add_argument("--budget", type=float, default=0.5, help="GuardedParser time budget to check (seconds)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rows, failures = check_growth(args.min_size, args.max_size)
+    print(f"{'parser':<24}{'family':<22}{'chars':>10}{'ms':>10}")
+    for parser_name, family, size, elapsed_ms in rows:
+        print(f"{parser_name:<24}{family:<22}{size:>10,}{elapsed_ms:>10.2f}")
+
+    worst_ms, mutation_failures = check_mutations(args.mutations, args.seed, args.max_ms)
+    print(f"\n{args.mutations} mutated exports: worst {worst_ms:.2f} ms")
+    failures += mutation_failures
+    failures += check_time_budget(args.budget)
+
+    if failures:
+        print("\nFailures:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("\nAll latency checks passed.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Load test for the parse/render HTTP service.
+
+Drives the ASGI app in-process by default (no server needed), or a running
+service with --url, using `--concurrency` clients that send synthetic exports
+back to back for `--duration` seconds. Reports sustained requests/sec, latency
+percentiles for successful requests, 429 rejections and pool batches.
+
+    python benchmarks/load_service.py --concurrency 64 --duration 10
+    python -m dazzle serve --port 8000 &
+    python benchmarks/load_service.py --url http://127.0.0.1:8000 --endpoint render
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_parsers import percentile # noqa: E402
+from dazzle.service import ServiceClient, create_app # noqa: E402
+from synthetic_exports import make_order_corpus # noqa: E402
+
+ENDPOINTS = {
+    "parse": "/parse",
+    "render": "/render/standard",
+    "batch": "/parse/batch",
+}
+BATCH_EXPORTS_PER_REQUEST = 20
+OVERLOAD_BACKOFF_SECONDS = 0.01
+
+
+class HTTPConnection:
+    """Minimal keep-alive HTTP/1.1 client over asyncio streams (JSON in, JSON out)."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self._reader = self._writer = None
+
+    async def post(self, path, payload):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode("utf-8")
+        self._writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+        await self._writer.drain()
+        status = int((await self._reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await self._reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        payload = json.loads(await self._reader.readexactly(int(headers.get("content-length", 0))))
+        return status, headers, payload
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+
+
+def _request_payload(endpoint, corpus, index):
+    if endpoint == "batch":
+        start = (index * BATCH_EXPORTS_PER_REQUEST) % len(corpus)
+        return {"exports": (corpus * 2)[start:start + BATCH_EXPORTS_PER_REQUEST]}
+    return {"text": corpus[index % len(corpus)]}
+
+
+async def _client_loop(post, endpoint, corpus, deadline, counters, latencies, offset):
+    path = ENDPOINTS[endpoint]
+    index = offset
+    clock = time.perf_counter
+    while clock() < deadline:
+        started = clock()
+        status, _, _ = await post(path, _request_payload(endpoint, corpus, index))
+        index += 1
+        if status == 200:
+            latencies.append(clock() - started)
+            counters["ok"] += 1
+        elif status == 429:
+            counters["rejected"] += 1
+            await asyncio.sleep(OVERLOAD_BACKOFF_SECONDS)
+        else:
+            counters["errors"] += 1
+
+
+async def run_load(args):
+    corpus = make_order_corpus(args.seed, args.corpus)
+    counters = {"ok": 0, "rejected": 0, "errors": 0}
+    latencies = []
+
+    if args.url:
+        connections = [HTTPConnection(args.url) for _ in range(args.concurrency)]
+        posts = [connection.post for connection in connections]
+        client = None
+    else:
+        app = create_app(max_workers=args.workers, max_queue=args.max_queue, batch_size=args.batch_size)
+        client = await ServiceClient(app).__aenter__()
+        posts = [client.post] * args.concurrency
+
+    try:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            _client_loop(post, args.endpoint, corpus, deadline, counters, latencies, offset)
+            for offset, post in enumerate(posts)
+        ))
+        elapsed = time.perf_counter() - started
+        health = (await client.get("/health"))[2] if client else None
+    finally:
+        if client:
+            await client.__aexit__(None, None, None)
+        else:
+            await asyncio.gather(*(connection.close() for connection in connections))
+
+    latencies.sort()
+    report = {
+        "endpoint": args.endpoint,
+        "target": args.url or "in-process",
+        "concurrency": args.concurrency,
+        "seconds": elapsed,
+        "requests_per_sec": counters["ok"] / elapsed,
+        **counters,
+    }
+    if latencies:
+        report.update({f"p{int(q * 100)}_ms": percentile(latencies, q) * 1000 for q in (0.5, 0.95, 0.99)})
+    if health:
+        report["pool_batches"] = health["batches"]
+        report["exports_per_batch"] = (
+            counters["ok"] * (BATCH_EXPORTS_PER_REQUEST if args.endpoint == "batch" else 1) / health["batches"]
+            if health["batches"] else 0.0
+        )
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the DAZZLE PREMIUM parse/render service.")
+    parser.add_argument("--url", help="base URL of a running service (default: drive the app in-process)")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="parse")
+    parser.add_argument("--concurrency", type=int, default=32, help="simultaneous clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to sustain the load")
+    parser.add_argument("--corpus", type=int, default=500, help="distinct synthetic exports to cycle through")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=None, help="in-process only: parser processes")
+    parser.add_argument("--max-queue", type=int, default=None, help="in-process only: queue limit before 429")
+    parser.add_argument("--batch-size", type=int, default=None, help="in-process only: exports per pool task")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key:<20}{value:.2f}" if isinstance(value, float) else f"{key:<20}{value}")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
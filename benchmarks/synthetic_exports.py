@@ -0,0 +1,132 @@
+"""
+Synthetic Shopify exports for benchmarking the parsers.
+
+make_order_export() builds one order page in the shape agents paste into the
+Email Generator (items with "M / YLW", "16 / BS", "US 10" and sock sizes, SKU and
+price lines, totals, customer/contact/address sections). make_orders_page() builds
+an orders list page of "Select gid://shopify/Order/" blocks for Batch Orders.
+Every generator takes a seeded random.Random so corpora are reproducible.
+"""
+import random
+
+FIRST_NAMES = ["Jane", "John", "Aaliyah", "Marcus", "Sofia", "Dwayne", "Mei", "Carlos", "Fatima", "Tyrell", "Olivia", "Andre"]
+LAST_NAMES = ["Roe", "Doe", "Johnson", "Williams", "Nguyen", "Garcia", "Brown", "Okafor", "Smith", "Lee", "Patel", "Jackson"]
+PRODUCTS = [
+    "Air Jordan 1 Retro High OG", "Nike Dunk Low", "Essentials Fleece Hoodie", "Tech Fleece Jogger",
+    "Graphic Crew Tee", "Air Max 90", "Yeezy Slide", "Varsity Jacket", "Cargo Pant", "Denali Puffer",
+]
+SOCK_PRODUCTS = ["Everyday Crew Socks 3-Pack", "Ankle Sock 6-Pack"]
+COLOR_CODES = ["YLW", "BLK", "WHT", "BS", "RED", "NVY", "GRY"]
+LETTER_SIZES = ["XS", "S", "M", "L", "XL", "XXL"]
+SHOE_SIZES = ["7", "8", "9", "9.5", "10", "10.5", "11", "12", "13"]
+STREETS = ["Main St", "Oak Ave", "East-West Hwy", "Georgia Ave", "Pine Rd"]
+CITIES = [("Hyattsville", "MD", "20782"), ("Baltimore", "MD", "21201"), ("Silver Spring", "MD", "20910"), ("Atlanta", "GA", "30303")]
+
+
+def _style_code(rng):
+    return f"{rng.choice('ABCDFHJ')}{rng.choice('BDJKQVZ')}{rng.randint(1000, 9999)}-{rng.randint(100, 999)}"
+
+
+def _size_line(rng, product):
+    """One of the size formats seen in real exports, or None for sock items without a size line."""
+    if product in SOCK_PRODUCTS:
+        return None if rng.random() < 0.7 else "One Size"
+    kind = rng.random()
+    if kind < 0.35:
+        return f"{rng.choice(LETTER_SIZES)} / {rng.choice(COLOR_CODES)}"
+    if kind < 0.55:
+        return f"{rng.randint(6, 18)} / {rng.choice(COLOR_CODES)}"
+    if kind < 0.8:
+        return f"US {rng.choice(SHOE_SIZES)}"
+    if kind < 0.9:
+        return rng.choice(LETTER_SIZES)
+    return rng.choice(SHOE_SIZES)
+
+
+def make_order_export(rng, order_number, item_count=None, missing_rate=0.1):
+    """
+    Builds one order page export. `item_count` defaults to a random 1-6;
+    `missing_rate` is the chance of dropping each customer field (name, email,
+    phone, order number line) to exercise the parser's fallbacks.
+    """
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    name = f"{first} {last}"
+    email = f"{first.lower()}.{last.lower()}{rng.randint(1, 999)}@example.com"
+    phone = f"+1 {rng.randint(201, 989)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}"
+    item_count = rng.randint(1, 6) if item_count is None else item_count
+
+    lines = []
+    if rng.random() >= missing_rate:
+        lines.append(f"dazzlepremium#{order_number}")
+    lines += [rng.choice(["Paid", "Payment pending"]), "Unfulfilled", f"Unfulfilled ({item_count})", "Standard Shipping"]
+
+    subtotal = 0.0
+    for _ in range(item_count):
+        product = rng.choice(SOCK_PRODUCTS if rng.random() < 0.15 else PRODUCTS)
+        price = rng.choice([18.0, 35.0, 57.0, 120.0, 180.0, 230.0])
+        quantity = 1 if rng.random() < 0.8 else rng.randint(2, 4)
+        subtotal += price * quantity
+        lines.append(f"{product} - {_style_code(rng)}")
+        size_line = _size_line(rng, product)
+        if size_line is not None and rng.random() >= missing_rate / 2:
+            lines.append(size_line)
+        lines.append(f"SKU: {rng.randint(10**9, 10**10 - 1)}")
+        lines.append(f"${price:.2f} x {quantity}")
+        lines.append(f"${price * quantity:,.2f}")
+
+    shipping = rng.choice([0.0, 10.0, 15.0])
+    tax = round(subtotal * 0.06, 2)
+    lines += [
+        "Subtotal", f"{item_count} item{'s' if item_count > 1 else ''}", f"${subtotal:,.2f}",
+        "Shipping", f"${shipping:.2f}",
+        "Tax", f"${tax:,.2f}",
+        "Total", f"${subtotal + shipping + tax:,.2f}",
+        "Paid", f"${subtotal + shipping + tax:,.2f}",
+    ]
+
+    if rng.random() >= missing_rate:
+        lines += ["Customer", name]
+    lines.append("Contact information")
+    if rng.random() >= missing_rate:
+        lines.append(email)
+    if rng.random() >= missing_rate:
+        lines.append(phone)
+    street, (city, state, zip_code) = rng.choice(STREETS), rng.choice(CITIES)
+    lines += ["Shipping address", name, f"{rng.randint(1, 9999)} {street}", f"{city} {state} {zip_code}", "United States"]
+    if rng.random() >= missing_rate:
+        lines.append(f"Order confirmation email was sent to {name} ({email})")
+    return "\n".join(lines)
+
+
+def make_orders_page(rng, block_count, first_order_number=1001, incomplete_rate=0.02):
+    """Builds an orders list page with `block_count` "Select gid://shopify/Order/" blocks."""
+    parts = ["Orders\nAll\nUnfulfilled\nUnpaid\n"]
+    for offset in range(block_count):
+        item_count = rng.randint(1, 6)
+        total = rng.randint(18, 1800) + rng.choice([0.0, 0.5, 0.99])
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        block = [
+            f"Select gid://shopify/Order/{rng.randint(10**12, 10**13 - 1)}",
+            f"#{first_order_number + offset}",
+            rng.choice(["Today at 9:12 am", "Yesterday at 4:40 pm", "Friday at 11:03 am"]),
+            f"{item_count} item{'s' if item_count > 1 else ''}",
+            name,
+            f"${total:,.2f}",
+            rng.choice(["Paid", "Payment pending"]),
+            "Unfulfilled",
+            "Standard Shipping",
+        ]
+        if rng.random() < incomplete_rate:
+            block.pop(rng.choice([1, 4, 5])) # Drop the order number, name or amount
+        parts.append("\n".join(block) + "\n")
+    return "".join(parts)
+
+
+def make_order_corpus(seed, order_count, missing_rate=0.1):
+    """Returns `order_count` single-order exports with 1-6 items each (a few larger ones mixed in)."""
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(order_count):
+        item_count = rng.randint(20, 35) if rng.random() < 0.05 else None
+        corpus.append(make_order_export(rng, 10000 + index, item_count=item_count, missing_rate=missing_rate))
+    return corpus
@@ -0,0 +1,68 @@
+"""
+Core (Streamlit-free) order processing for the DAZZLE PREMIUM order email generator.
+
+The public functions are re-exported here lazily: `import dazzle` only loads a
+submodule when one of its names is first used, and importing never touches the
+UI, the order database or the template files.
+
+    from dazzle import parse_shopify_export, generate_standard_email
+    subject, body = generate_standard_email(parse_shopify_export(export_text))
+
+The same operations are available headless as `python -m dazzle parse|batch|render`.
+"""
+import importlib
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    "parse_shopify_export": "dazzle.parsing",
+    "parse_orders": "dazzle.parsing",
+    "parse_order_block": "dazzle.parsing",
+    "parse_order_details_batch": "dazzle.parsing",
+    "parse_order_details_columns": "dazzle.parsing",
+    "parse_shopify_export_compact": "dazzle.parsing",
+    "split_shopify_exports": "dazzle.parsing",
+    "iter_shopify_exports": "dazzle.parsing",
+    "iter_order_blocks": "dazzle.parsing",
+    "iter_parsed_order_chunks": "dazzle.parsing",
+    "order_line_item_rows": "dazzle.parsing",
+    "generate_standard_email": "dazzle.emails",
+    "generate_high_risk_email": "dazzle.emails",
+    "generate_return_email": "dazzle.emails",
+    "generate_medium_risk_email": "dazzle.emails",
+    "EMAIL_TEMPLATES": "dazzle.emails",
+    "render_email_batch": "dazzle.emails",
+    "write_rendered_emails": "dazzle.emails",
+    "EmailDispatcher": "dazzle.dispatch",
+    "SmtpSettings": "dazzle.dispatch",
+    "ParsedOrder": "dazzle.models",
+    "OrderItem": "dazzle.models",
+    "LineItemColumns": "dazzle.models",
+    "write_columnar": "dazzle.exports",
+    "open_columnar_export": "dazzle.exports",
+    "load_risk_model": "dazzle.risk",
+    "compile_risk_rules": "dazzle.risk",
+    "LinkageIndex": "dazzle.linkage",
+    "load_catalog": "dazzle.catalog",
+    "ProductCatalog": "dazzle.catalog",
+    "ParseCache": "dazzle.cache",
+    "GuardedParser": "dazzle.guard",
+    "SharedBatchStore": "dazzle.shared",
+    "OrderStore": "dazzle.store",
+    "TemplateStore": "dazzle.templating",
+    "TemplateError": "dazzle.templating",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'dazzle' has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,7 @@
+"""Entry point for `python -m dazzle`."""
+import sys
+
+from dazzle.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Content-hash parse cache shared by every session in the server process.
+
+Parsed orders are keyed by a BLAKE2 digest of the normalized export text, kept in
+a bounded LRU with a TTL, and counted (hits, misses, evictions, expirations) so
+the cache's effect can be checked from the UI.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_PARSE_CACHE_SIZE = 512 # Parsed orders kept per server process
+DEFAULT_PARSE_CACHE_TTL = 3600.0 # Seconds before a cached parse is recomputed
+
+
+def normalize_export_text(raw_text_input):
+    """Unifies line endings and trims surrounding whitespace so re-pastes of the same export share one cache entry."""
+    return raw_text_input.replace("\r\n", "\n").replace("\r", "\n").strip()
+
+
+def export_fingerprint(normalized_text):
+    """Returns the cache key (hex BLAKE2b digest) for already-normalized export text."""
+    return hashlib.blake2b(normalized_text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+
+class ParseCache:
+    """
+    Thread-safe LRU + TTL cache in front of a parser function.
+    Results are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, parser, maxsize=DEFAULT_PARSE_CACHE_SIZE, ttl=DEFAULT_PARSE_CACHE_TTL, clock=time.monotonic):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.parser = parser
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict() # key -> (expires_at, parsed result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def parse(self, raw_text_input):
+        """Returns the parse of the normalized text, running the parser only on a miss."""
+        normalized_text = normalize_export_text(raw_text_input)
+        key = export_fingerprint(normalized_text)
+        now = self._clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+
+        # Parse outside the lock so a slow export never blocks other sessions' hits
+        result = self.parser(normalized_text)
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def clear(self):
+        """Drops every cached entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns the counters plus current size, limits and hit rate."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,305 @@
+"""
+Product catalog lookups for parsed line items.
+
+A catalog is a CSV or JSON file of style codes, product names and valid sizes
+(named by DAZZLE_CATALOG). ProductCatalog indexes it once:
+
+- an exact hash on the style code, keyed without case or punctuation so
+  "dz1234 100" finds "DZ1234-100";
+- a trigram inverted index over product names for fuzzy lookups, built with NumPy
+  as sorted posting lists. A query draws candidates from the posting lists of its
+  rarest trigrams, then counts every query trigram's hits on just those candidates
+  (binary searches) to get their exact trigram Jaccard similarity.
+
+resolve_item() maps a parsed (product name, style code, size) to the catalog's
+product and size, filling "Unknown Product" / "Size Not Found" where the catalog
+can tell and checking sizes against the product's valid ones. Resolutions are
+memoized per distinct item, so a batch pays for each product/size once.
+parse_shopify_export applies default_catalog() to every parse when one is configured.
+"""
+import csv
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass
+from functools import cache, lru_cache
+
+UNKNOWN_PRODUCT = "Unknown Product"
+UNKNOWN_STYLE_CODE = "N/A"
+SIZE_NOT_FOUND = "Size Not Found"
+DEFAULT_NAME_SIMILARITY = 0.5 # Trigram Jaccard needed to accept a fuzzy product name match
+RARE_TRIGRAMS = 6 # A query's rarest trigrams, whose posting lists supply the candidates
+NAME_CANDIDATES = 32 # Candidates (most rare-trigram hits) scored with the exact trigram Jaccard
+RESOLUTION_CACHE_SIZE = 65536
+
+STYLE_KEY_RE = re.compile(r"[^0-9A-Z]")
+STYLE_TOKEN_RE = re.compile(r"\b[A-Z0-9][A-Z0-9\-]{3,}\b")
+NON_ALNUM_RE = re.compile(r"[\W_]+")
+SIZE_PREFIX_RE = re.compile(r"^(?:SIZE|US|EU|UK)\s*[:.]?\s*")
+SIZE_FRACTION_RE = re.compile(r"^(\d+)\s+1/2$")
+SIZE_LIST_SPLIT_RE = re.compile(r"[|;,]")
+
+# Spelled-out sizes -> the letter sizes the parser extracts
+SIZE_WORDS = {
+    "XSMALL": "XS", "EXTRASMALL": "XS", "SMALL": "S", "MEDIUM": "M", "LARGE": "L",
+    "XLARGE": "XL", "EXTRALARGE": "XL", "XXLARGE": "XXL", "2XL": "XXL", "XXXLARGE": "XXXL", "3XL": "XXXL",
+    "ONESIZE": "ONESIZE", "OS": "ONESIZE", "OSFA": "ONESIZE",
+}
+
+CATALOG_STYLE_FIELDS = ("style_code", "Style Code", "Variant SKU", "SKU", "sku")
+CATALOG_NAME_FIELDS = ("name", "product_name", "Product", "Title", "title")
+CATALOG_SIZE_FIELDS = ("sizes", "Sizes", "size", "Size", "Option1 Value")
+
+
+class CatalogError(ValueError):
+    """A catalog file that cannot be read or has no usable products."""
+
+
+@dataclass(slots=True, frozen=True)
+class CatalogMatch:
+    product_name: str
+    style_code: str
+    size: str
+    matched_by: str | None # "style_code", "name_code" (a code found in the name), "name" (fuzzy) or None
+    size_status: str # "valid", "filled" (from a one-size product), "invalid" or "unchecked"
+
+
+def style_key(style_code):
+    """Style code without case, spaces or punctuation ("dz1234 100" -> "DZ1234100")."""
+    return STYLE_KEY_RE.sub("", style_code.upper())
+
+
+@lru_cache(maxsize=4096)
+def size_key(size):
+    """Comparable size ("US 10.0" -> "10", "10 1/2" -> "10.5", "Medium" -> "M", "One Size" -> "ONESIZE")."""
+    size = SIZE_PREFIX_RE.sub("", size.strip().upper())
+    fraction = SIZE_FRACTION_RE.match(size)
+    if fraction:
+        size = fraction.group(1) + ".5"
+    try:
+        number = float(size)
+    except ValueError:
+        compact = NON_ALNUM_RE.sub("", size)
+        return SIZE_WORDS.get(compact, compact)
+    return f"{number:g}"
+
+
+def product_key(name):
+    """Casefolded product name with punctuation collapsed to single spaces."""
+    return NON_ALNUM_RE.sub(" ", name.casefold()).strip()
+
+
+def _trigram_codes(keys):
+    """
+    Character trigrams of every key (padded like linkage.name_trigrams) as uint64
+    codes (three 21-bit code points), with the index of the key each came from.
+    """
+    import numpy as np
+
+    padded = [f"  {key} " for key in keys]
+    lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+    points = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    owners = np.repeat(np.arange(len(padded)), lengths)
+    local = np.arange(len(points)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    starts = np.nonzero(local <= np.repeat(lengths - 3, lengths))[0]
+    codes = (points[starts] << np.uint64(42)) | (points[starts + 1] << np.uint64(21)) | points[starts + 2]
+    return codes, owners[starts]
+
+
+class ProductCatalog:
+    """Exact style-code and fuzzy name indexes over (style_code, name, sizes) products."""
+
+    def __init__(self, products, name_similarity=DEFAULT_NAME_SIMILARITY):
+        self.name_similarity = name_similarity
+        self.style_codes = []
+        self.names = []
+        self.sizes = [] # product -> {size_key: catalog size}
+        self._by_style = {}
+        for style_code, name, sizes in products:
+            style_code = (style_code or "").strip()
+            key = style_key(style_code)
+            if not key:
+                continue
+            product = self._by_style.get(key)
+            if product is None:
+                product = self._by_style[key] = len(self.style_codes)
+                self.style_codes.append(style_code)
+                self.names.append((name or "").strip() or style_code)
+                self.sizes.append({})
+            for size in sizes:
+                size = size.strip()
+                if size:
+                    self.sizes[product].setdefault(size_key(size), size)
+        if not self.style_codes:
+            raise CatalogError("catalog has no products with a style code")
+
+        self._build_name_index([product_key(name) for name in self.names])
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+    def _build_name_index(self, name_keys):
+        """Trigram -> sorted product ids, stored CSR-style: unique trigram codes, offsets, one id array."""
+        import numpy as np
+
+        codes, owners = _trigram_codes(name_keys)
+        order = np.lexsort((owners, codes))
+        codes, owners = codes[order], owners[order]
+        distinct = np.ones(len(codes), dtype=bool)
+        distinct[1:] = (codes[1:] != codes[:-1]) | (owners[1:] != owners[:-1])
+        codes, owners = codes[distinct], owners[distinct]
+        self._trigrams, starts = np.unique(codes, return_index=True)
+        self._offsets = np.append(starts, len(codes))
+        self._posting_ids = owners.astype(np.int32)
+        self._trigram_counts = np.bincount(owners, minlength=len(name_keys)).astype(np.int32)
+
+    def __len__(self):
+        return len(self.style_codes)
+
+    def find_style(self, style_code):
+        """Product index for a style code, or None."""
+        if not style_code:
+            return None
+        return self._by_style.get(style_key(style_code))
+
+    def match_name(self, name):
+        """(product index, similarity) of the closest catalog name, or (None, 0.0) below the threshold."""
+        import numpy as np
+
+        key = product_key(name)
+        if not key:
+            return None, 0.0
+        query, _ = _trigram_codes([key])
+        query = np.unique(query)
+        positions = np.minimum(np.searchsorted(self._trigrams, query), len(self._trigrams) - 1)
+        positions = positions[self._trigrams[positions] == query]
+        if not len(positions):
+            return None, 0.0
+        postings = [self._posting_ids[self._offsets[i]:self._offsets[i + 1]] for i in positions.tolist()]
+        postings.sort(key=len)
+        # Candidates come from the rarest trigrams only; every query trigram is then checked for them
+        values, counts = np.unique(np.concatenate(postings[:RARE_TRIGRAMS]), return_counts=True)
+        candidates = values[np.argsort(counts, kind="stable")[-NAME_CANDIDATES:]]
+        hits = np.zeros(len(candidates), dtype=np.int32)
+        for ids in postings:
+            found = np.minimum(np.searchsorted(ids, candidates), len(ids) - 1)
+            hits += ids[found] == candidates
+        similarity = hits / (len(query) + self._trigram_counts[candidates] - hits)
+        best = int(np.argmax(similarity))
+        if similarity[best] < self.name_similarity:
+            return None, float(similarity[best])
+        return int(candidates[best]), float(similarity[best])
+
+    def _find_product(self, product_name, style_code):
+        product = self.find_style(style_code) if style_code and style_code != UNKNOWN_STYLE_CODE else None
+        if product is not None:
+            return product, "style_code"
+        if product_name and product_name != UNKNOWN_PRODUCT:
+            for token in STYLE_TOKEN_RE.findall(product_name.upper()):
+                if any(char.isdigit() for char in token):
+                    product = self.find_style(token)
+                    if product is not None:
+                        return product, "name_code"
+            product, _ = self.match_name(product_name)
+            if product is not None:
+                return product, "name"
+        return None, None
+
+    def resolve_item(self, product_name, style_code, size):
+        """CatalogMatch for one parsed item (memoized per distinct item)."""
+        memo_key = (product_name, style_code, size)
+        match = self._resolved.get(memo_key)
+        if match is not None:
+            return match
+
+        product, matched_by = self._find_product(product_name, style_code)
+        if product is None:
+            match = CatalogMatch(product_name, style_code, size, None, "unchecked")
+        else:
+            valid_sizes = self.sizes[product]
+            if not valid_sizes:
+                resolved_size, size_status = size, "unchecked"
+            elif size and size != SIZE_NOT_FOUND and size_key(size) in valid_sizes:
+                resolved_size, size_status = valid_sizes[size_key(size)], "valid"
+            elif (not size or size == SIZE_NOT_FOUND) and len(valid_sizes) == 1:
+                resolved_size, size_status = next(iter(valid_sizes.values())), "filled"
+            else:
+                resolved_size, size_status = size, "invalid"
+            match = CatalogMatch(self.names[product], self.style_codes[product], resolved_size, matched_by, size_status)
+
+        with self._lock:
+            if len(self._resolved) >= RESOLUTION_CACHE_SIZE:
+                self._resolved.clear()
+            self._resolved[memo_key] = match
+        return match
+
+    def resolve_items(self, items):
+        """CatalogMatches for parse_shopify_export item dicts."""
+        return [self.resolve_item(item["product_name"], item["style_code"], item["size"]) for item in items]
+
+    def apply(self, items):
+        """
+        Rewrites parsed item dicts in place with their catalog names, style codes and
+        sizes. Returns True if any item still needs a size check: no size found, or a
+        size the matched product is not offered in.
+        """
+        needs_size = False
+        for item, match in zip(items, self.resolve_items(items)):
+            item["product_name"], item["style_code"], item["size"] = match.product_name, match.style_code, match.size
+            needs_size = needs_size or match.size == SIZE_NOT_FOUND or match.size_status == "invalid"
+        return needs_size
+
+
+# --- Loading ---
+
+def _first_field(record, names):
+    for name in names:
+        value = record.get(name)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _size_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(size) for size in value]
+    return SIZE_LIST_SPLIT_RE.split(str(value))
+
+
+def _catalog_records(path):
+    """Yields product dicts from a CSV (one row per product or per variant) or JSON/JSONL catalog."""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8-sig", newline="") as catalog_file:
+        if extension == ".csv":
+            yield from csv.DictReader(catalog_file)
+        elif extension == ".jsonl":
+            for line in catalog_file:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension == ".json":
+            document = json.load(catalog_file)
+            yield from document.get("products", []) if isinstance(document, dict) else document
+        else:
+            raise CatalogError(f"{path}: catalogs must be .csv, .json or .jsonl files")
+
+
+def load_catalog(path, name_similarity=DEFAULT_NAME_SIMILARITY):
+    """Builds a ProductCatalog from a CSV or JSON(L) file. Variant rows of the same style code are merged."""
+    try:
+        products = [
+            (_first_field(record, CATALOG_STYLE_FIELDS), _first_field(record, CATALOG_NAME_FIELDS),
+             _size_list(_first_field(record, CATALOG_SIZE_FIELDS)))
+            for record in _catalog_records(path)
+        ]
+    except (OSError, json.JSONDecodeError, csv.Error, UnicodeDecodeError, AttributeError) as exc:
+        raise CatalogError(f"cannot read catalog {path}: {exc}") from exc
+    return ProductCatalog(((str(code) if code is not None else "", name, sizes) for code, name, sizes in products), name_similarity)
+
+
+@cache
+def default_catalog():
+    """The DAZZLE_CATALOG catalog, loaded once per process, or None when none is configured."""
+    path = os.environ.get("DAZZLE_CATALOG")
+    return load_catalog(path) if path else None
@@ -0,0 +1,418 @@
+"""
+Headless command line for DAZZLE PREMIUM order processing.
+
+    python -m dazzle parse export1.txt export2.txt > orders.jsonl
+    python -m dazzle batch orders_page.txt --format csv -o orders.csv
+    python -m dazzle batch orders_export.csv --input-format csv
+    python -m dazzle batch orders_page.txt --details --workers 4 > line_items.jsonl
+    python -m dazzle batch orders_page.txt --format feather -o orders.feather
+    python -m dazzle batch orders_page.txt --details --format parquet -o line_items.parquet
+    python -m dazzle render standard export.txt --format zip -o emails.zip
+    python -m dazzle parse exports/*.txt | python -m dazzle render auto --parsed
+    python -m dazzle parse --score --history dazzle_orders.sqlite3 exports/*.txt | python -m dazzle render auto --parsed
+    python -m dazzle parse --score exports/*.txt | python -m dazzle send auto --parsed -o sent.jsonl
+    python -m dazzle serve --port 8000
+    python -m dazzle profile slow_export.txt --operation render --template high_risk
+
+parse, batch and render read the named files ("-" or no file means stdin) and
+write JSONL (default) or CSV to stdout or --output (batch also writes Parquet or
+Feather); send renders like render but mails each email through the DAZZLE_SMTP_*
+server and writes one result per email; serve runs the HTTP service
+in dazzle.service; profile prints one input's stage breakdown and dumps a
+pyinstrument/cProfile profile of it. Only the standard library and the
+parsing/email modules are imported, so a run starts without Streamlit or pandas.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+from dazzle.emails import EMAIL_EXPORT_FORMATS, EMAIL_TEMPLATES, render_email_batch, write_rendered_emails
+from dazzle.exports import batch_orders_schema, iter_row_batches, write_columnar
+from dazzle.instrumentation import INSTRUMENTATION, profile_call
+from dazzle.parsing import (
+    BATCH_ORDER_COLUMNS,
+    LINE_ITEM_COLUMNS,
+    iter_csv_order_rows,
+    iter_file_chunks,
+    iter_json_order_rows,
+    iter_order_blocks,
+    iter_parsed_order_chunks,
+    iter_shopify_exports,
+    order_line_item_rows,
+    parse_order_block,
+    parse_order_details_columns,
+    parse_orders,
+    parse_shopify_export,
+)
+
+RECORD_FORMATS = ("jsonl", "csv")
+COLUMNAR_FORMATS = ("parquet", "feather") # batch only; needs pyarrow
+BATCH_INPUT_FORMATS = ("auto", "txt", "csv", "json")
+AUTO_TEMPLATE = "auto" # render: use each parsed order's own "template" key
+PROFILE_OPERATIONS = ("parse", "batch", "render")
+DEFAULT_PROFILE_OUTPUT_DIR = "dazzle_profiles"
+
+
+class CommandError(ValueError):
+    """A problem with the command's input, reported without a traceback."""
+
+
+# --- Input / Output ---
+
+def _open_input(path):
+    """Opens an input path as a binary stream; "-" is stdin."""
+    if path == "-":
+        return sys.stdin.buffer
+    try:
+        return open(path, "rb")
+    except OSError as error:
+        raise CommandError(f"cannot read {path}: {error.strerror}") from error
+
+
+def _close_input(stream):
+    if stream is not sys.stdin.buffer:
+        stream.close()
+
+
+def _read_text(path):
+    """Reads a whole input as UTF-8 text (undecodable bytes are replaced, like uploads in the UI)."""
+    stream = _open_input(path)
+    try:
+        return stream.read().decode("utf-8", errors="replace")
+    finally:
+        _close_input(stream)
+
+
+def _open_output(path):
+    """Opens the output path for binary writing; None or "-" is stdout."""
+    if path in (None, "-"):
+        return sys.stdout.buffer
+    return open(path, "wb")
+
+
+def write_records(records, fileobj, output_format, fieldnames):
+    """Streams dict records into the binary `fileobj` as JSON Lines or CSV. Returns the record count."""
+    count = 0
+    if output_format == "jsonl":
+        for count, record in enumerate(records, 1):
+            fileobj.write(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+            fileobj.write(b"\n")
+        return count
+
+    text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+    try:
+        writer = csv.DictWriter(text, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        for count, record in enumerate(records, 1):
+            writer.writerow(record)
+        text.flush()
+    finally:
+        text.detach() # Leave stdout usable after the command
+    return count
+
+
+def _warn(message):
+    print(f"dazzle: {message}", file=sys.stderr)
+
+
+# --- Commands ---
+
+def _iter_parsed_exports(paths):
+    """Yields (path, parse_shopify_export result) for each order; a file may hold several pasted order pages."""
+    for path in paths:
+        for parsed_data in iter_shopify_exports(_read_text(path)):
+            yield path, parsed_data
+
+
+def _score_parsed_exports(args):
+    """Parses every input, then scores them together (batch signals need the whole set). Yields (path, parsed, risk)."""
+    from dazzle.risk import load_risk_model, parsed_order_risk_features
+    from dazzle.store import OrderStore
+
+    exports = list(_iter_parsed_exports(args.inputs))
+    model = load_risk_model(args.risk_rules)
+    history = OrderStore(args.history) if args.history else None
+    try:
+        risk_scores = model.score(parsed_order_risk_features([parsed_data for _, parsed_data in exports], history=history))
+    finally:
+        if history is not None:
+            history.close()
+    flags = risk_scores.flag_labels()
+    for index, (path, parsed_data) in enumerate(exports):
+        risk = {"template": risk_scores.templates[index], "risk_score": int(risk_scores.scores[index]), "risk_flags": flags[index]}
+        yield path, parsed_data, risk
+
+
+def command_parse(args, output):
+    if args.score:
+        exports = _score_parsed_exports(args)
+    else:
+        exports = ((path, parsed_data, {}) for path, parsed_data in _iter_parsed_exports(args.inputs))
+
+    if args.format == "jsonl":
+        records = ({"source": path, **parsed_data, **risk} for path, parsed_data, risk in exports)
+        return write_records(records, output, "jsonl", None)
+
+    records = (
+        {"Source": path, **row, "Template": risk.get("template"), "Risk Score": risk.get("risk_score")}
+        for batch_order, (path, parsed_data, risk) in enumerate(exports, 1)
+        for row in order_line_item_rows(parsed_data, batch_order)
+    )
+    fieldnames = ["Source"] + LINE_ITEM_COLUMNS + (["Template", "Risk Score"] if args.score else [])
+    return write_records(records, output, "csv", fieldnames)
+
+
+def _batch_input_format(args):
+    if args.input_format != "auto":
+        return args.input_format
+    extension = os.path.splitext(args.input)[1].lower().lstrip(".")
+    if extension == "csv":
+        return "csv"
+    if extension in ("json", "jsonl"):
+        return "json"
+    return "txt"
+
+
+def command_batch(args, output):
+    input_format = _batch_input_format(args)
+    if args.details and input_format != "txt":
+        raise CommandError("--details needs orders page text, not a CSV/JSON export")
+
+    stream = _open_input(args.input)
+    try:
+        if args.details and args.format in COLUMNAR_FORMATS:
+            line_items = parse_order_details_columns(iter_order_blocks(iter_file_chunks(stream)), max_workers=args.workers)
+            try:
+                return line_items.write_columnar(output, args.format)
+            except ImportError as error:
+                raise CommandError(f"--format {args.format} needs pyarrow: pip install pyarrow") from error
+
+        if args.details:
+            blocks = iter_order_blocks(iter_file_chunks(stream))
+            records = (
+                row
+                for chunk_rows in iter_parsed_order_chunks(blocks, max_workers=args.workers)
+                for row in chunk_rows
+            )
+            return write_records(records, output, args.format, LINE_ITEM_COLUMNS)
+
+        if input_format == "csv":
+            rows = iter_csv_order_rows(stream)
+        elif input_format == "json":
+            rows = iter_json_order_rows(iter_file_chunks(stream))
+        else:
+            rows = (parse_order_block(block) for block in iter_order_blocks(iter_file_chunks(stream)))
+
+        skipped = 0
+        def complete_rows():
+            nonlocal skipped
+            for row in rows:
+                if row is None:
+                    skipped += 1
+                else:
+                    yield row
+
+        if args.format in COLUMNAR_FORMATS:
+            try:
+                schema = batch_orders_schema()
+                count = write_columnar(iter_row_batches(complete_rows(), schema), output, args.format, schema)
+            except ImportError as error:
+                raise CommandError(f"--format {args.format} needs pyarrow: pip install pyarrow") from error
+        else:
+            count = write_records(complete_rows(), output, args.format, BATCH_ORDER_COLUMNS)
+        if skipped:
+            _warn(f"{skipped} order(s) skipped due to incomplete parsing")
+        return count
+    finally:
+        _close_input(stream)
+
+
+def _iter_parsed_records(paths):
+    """Yields parsed orders from JSONL produced by `dazzle parse`."""
+    for path in paths:
+        stream = _open_input(path)
+        try:
+            for line_number, line in enumerate(io.TextIOWrapper(stream, encoding="utf-8"), 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as error:
+                    raise CommandError(f"{path}:{line_number}: not a JSON record ({error})") from error
+        finally:
+            _close_input(stream)
+
+
+def command_render(args, output):
+    if args.parsed:
+        orders = _iter_parsed_records(args.inputs)
+    else:
+        orders = (parsed_data for _, parsed_data in _iter_parsed_exports(args.inputs))
+    template = None if args.template == AUTO_TEMPLATE else args.template
+    return write_rendered_emails(render_email_batch(orders, template), output, args.format)
+
+
+def command_send(args, output):
+    from dataclasses import asdict, fields
+
+    from dazzle.dispatch import DispatchResult, EmailDispatcher, SmtpSettings
+
+    if args.parsed:
+        orders = _iter_parsed_records(args.inputs)
+    else:
+        orders = (parsed_data for _, parsed_data in _iter_parsed_exports(args.inputs))
+    template = None if args.template == AUTO_TEMPLATE else args.template
+    counts = {}
+
+    def counted(results):
+        for result in results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+            yield asdict(result)
+
+    with EmailDispatcher(SmtpSettings.from_env(), connections=args.connections, default_rate=args.rate,
+                         resend=args.resend) as dispatcher:
+        sent = dispatcher.send(render_email_batch(orders, template))
+        try:
+            count = write_records(counted(sent), output, args.format, [field.name for field in fields(DispatchResult)])
+        finally:
+            sent.close()
+    _warn(", ".join(f"{number} {status}" for status, number in sorted(counts.items())) or "no orders")
+    return count
+
+
+def command_serve(args, output):
+    try:
+        import uvicorn
+    except ImportError as error:
+        raise CommandError("serve needs an ASGI server: pip install uvicorn") from error
+    from dazzle.service import create_app
+
+    app = create_app(max_workers=args.workers, max_queue=args.max_queue, batch_size=args.batch_size)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+def command_profile(args, output):
+    text = _read_text(args.input)
+    if args.operation == "parse":
+        func, call_args = parse_shopify_export, (text,)
+    elif args.operation == "batch":
+        func, call_args = parse_orders, (text,)
+    else:
+        func, call_args = EMAIL_TEMPLATES[args.template], (parse_shopify_export(text),)
+
+    INSTRUMENTATION.enabled = True
+    func(*call_args)
+    trace = INSTRUMENTATION.recent(1)[0]
+    lines = [f"{trace['operation']}: {trace['total_ms']:.3f} ms"]
+    lines += [f"  {stage:<20}{ms:>10.3f} ms" for stage, ms in trace["stages_ms"].items()]
+    output.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+    path = profile_call(func, call_args, {}, args.profile_dir, trace["operation"])
+    _warn(f"profile written to {path}")
+
+
+COMMANDS = {
+    "parse": command_parse,
+    "batch": command_batch,
+    "render": command_render,
+    "send": command_send,
+    "serve": command_serve,
+    "profile": command_profile,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="dazzle",
+        description="Parse Shopify order exports and render customer emails without the Streamlit UI.",
+    )
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    parse_command = subcommands.add_parser("parse", help="parse order exports (one or more order pages per file)")
+    parse_command.add_argument("inputs", nargs="*", default=["-"], metavar="FILE", help="order exports (default: stdin)")
+    parse_command.add_argument("--format", choices=RECORD_FORMATS, default="jsonl",
+                               help="jsonl: one parsed order per line; csv: one row per line item")
+    parse_command.add_argument("--score", action="store_true",
+                               help="add the risk score and the email template it selects (for `render auto --parsed`)")
+    parse_command.add_argument("--risk-rules", default=None, metavar="JSON",
+                               help="risk rules file for --score (default: DAZZLE_RISK_RULES or the built-in rules)")
+    parse_command.add_argument("--history", default=None, metavar="DB",
+                               help="order database whose past orders feed the repeat-customer and contact signals")
+
+    batch_command = subcommands.add_parser("batch", help="parse an orders page, CSV or JSON export")
+    batch_command.add_argument("input", nargs="?", default="-", metavar="FILE", help="orders export (default: stdin)")
+    batch_command.add_argument("--input-format", choices=BATCH_INPUT_FORMATS, default="auto",
+                               help="input type; auto picks by file extension and treats stdin as page text")
+    batch_command.add_argument("--details", action="store_true",
+                               help="full line items per order (items, sizes, email, phone) instead of the summary")
+    batch_command.add_argument("--workers", type=int, default=None,
+                               help="worker processes for --details (default: CPU count)")
+    batch_command.add_argument("--format", choices=RECORD_FORMATS + COLUMNAR_FORMATS, default="jsonl",
+                               help="parquet/feather: typed columns in row groups (feather is uncompressed, so it can be memory-mapped)")
+
+    render_command = subcommands.add_parser("render", help="render customer emails for parsed orders")
+    render_command.add_argument("template", choices=sorted(EMAIL_TEMPLATES) + [AUTO_TEMPLATE],
+                                help=f"email template ({AUTO_TEMPLATE}: each order's \"template\" field, else standard)")
+    render_command.add_argument("inputs", nargs="*", default=["-"], metavar="FILE", help="order exports (default: stdin)")
+    render_command.add_argument("--parsed", action="store_true", help="inputs are JSONL from `dazzle parse`")
+    render_command.add_argument("--format", choices=sorted(EMAIL_EXPORT_FORMATS), default="jsonl",
+                                help="zip writes one .eml draft per order")
+
+    send_command = subcommands.add_parser("send", help="render customer emails and send them over SMTP (DAZZLE_SMTP_*)")
+    send_command.add_argument("template", choices=sorted(EMAIL_TEMPLATES) + [AUTO_TEMPLATE],
+                              help=f"email template ({AUTO_TEMPLATE}: each order's \"template\" field, else standard)")
+    send_command.add_argument("inputs", nargs="*", default=["-"], metavar="FILE", help="order exports (default: stdin)")
+    send_command.add_argument("--parsed", action="store_true", help="inputs are JSONL from `dazzle parse`")
+    send_command.add_argument("--format", choices=RECORD_FORMATS, default="jsonl", help="format of the per-email results")
+    send_command.add_argument("--connections", type=int, default=None,
+                              help="SMTP connections (and concurrent sends); default DAZZLE_SMTP_CONNECTIONS or 4")
+    send_command.add_argument("--rate", type=float, default=None,
+                              help="messages per second per recipient domain; default DAZZLE_SMTP_DOMAIN_RATE or 5")
+    send_command.add_argument("--resend", action="store_true",
+                              help="also send orders already sent with a different template (never the same one twice)")
+
+    for command in (parse_command, batch_command, render_command, send_command):
+        command.add_argument("-o", "--output", default=None, metavar="PATH", help="output file (default: stdout)")
+
+    serve_command = subcommands.add_parser("serve", help="run the HTTP parse/render service (needs uvicorn)")
+    serve_command.add_argument("--host", default="127.0.0.1")
+    serve_command.add_argument("--port", type=int, default=8000)
+    serve_command.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    serve_command.add_argument("--max-queue", type=int, default=None, help="waiting exports before 429 responses")
+    serve_command.add_argument("--batch-size", type=int, default=None, help="exports per worker task")
+
+    profile_command = subcommands.add_parser("profile", help="time and profile one input")
+    profile_command.add_argument("input", nargs="?", default="-", metavar="FILE", help="export or orders page (default: stdin)")
+    profile_command.add_argument("--operation", choices=PROFILE_OPERATIONS, default="parse",
+                                 help="parse: parse_shopify_export; batch: parse_orders; render: parse then a generate_* email")
+    profile_command.add_argument("--template", choices=sorted(EMAIL_TEMPLATES), default="standard")
+    profile_command.add_argument("--profile-dir", default=DEFAULT_PROFILE_OUTPUT_DIR,
+                                 help="where the profile is written")
+    profile_command.add_argument("-o", "--output", default=None, metavar="PATH", help="stage breakdown file (default: stdout)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        output = _open_output(getattr(args, "output", None))
+    except OSError as error:
+        _warn(f"cannot write {args.output}: {error.strerror}")
+        return 1
+    try:
+        COMMANDS[args.command](args, output)
+        output.flush()
+    except ValueError as error: # CommandError, TemplateError and malformed JSON exports
+        _warn(str(error))
+        return 1
+    except BrokenPipeError: # e.g. piped into `head`; silence the flush at interpreter exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    return 0
@@ -0,0 +1,532 @@
+"""
+Outbound sending of rendered customer emails over SMTP.
+
+EmailDispatcher takes the records render_email_batch() yields and sends them from a
+small pool of persistent SMTP connections, one worker thread per connection:
+
+    dispatcher = EmailDispatcher(SmtpSettings.from_env())
+    for result in dispatcher.send(render_email_batch(orders)):
+        print(result.order_number, result.status)
+
+- Connections are opened lazily, reused across messages, NOOP-checked after sitting
+  idle and recycled every CONNECTION_MAX_MESSAGES messages.
+- Each recipient domain gets its own rate (DomainRateLimiter), so a large batch of
+  gmail.com addresses cannot trip that provider's throttling.
+- Temporary failures (4xx replies, dropped connections, timeouts) are retried with
+  exponential backoff and jitter; 5xx replies fail the email straight away.
+- Every send is claimed first in a SQLite ledger under the normalized order number
+  (dispatch_key). An order that was already sent, or is being sent by another run, is
+  skipped whatever its template, so rerunning a batch (or re-rating its risk) never
+  mails a customer twice. Resending an order with a different template is an explicit
+  override (EmailDispatcher(resend=True)). A claim left behind by a crash mid-send
+  stays "sending" and is reported as skipped: it is never guessed to be unsent.
+
+The SMTP server and sender come from DAZZLE_SMTP_* environment variables (see
+SmtpSettings.from_env). Any local SMTP stand-in works for trying it out, e.g.
+`python -m aiosmtpd -n -l localhost:1025` with DAZZLE_SMTP_HOST=localhost and
+DAZZLE_SMTP_PORT=1025.
+"""
+import hashlib
+import os
+import queue
+import random
+import smtplib
+import sqlite3
+import ssl
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import parseaddr
+
+from dazzle.emails import rendered_email_bytes
+from dazzle.store import normalize_order_number
+
+DEFAULT_DISPATCH_DB_PATH = "dazzle_dispatch.sqlite3"
+DEFAULT_SMTP_PORT = 25
+DEFAULT_SMTP_TIMEOUT = 30.0 # Seconds per SMTP command
+DEFAULT_SMTP_CONNECTIONS = 4
+DEFAULT_DOMAIN_RATE = 5.0 # Messages per second to any one recipient domain
+SMTP_SECURITY_MODES = ("none", "starttls", "ssl")
+CONNECTION_MAX_MESSAGES = 100 # Messages per connection before it is replaced (servers cap this)
+CONNECTION_IDLE_SECONDS = 30.0 # Idle time after which a pooled connection is NOOP-checked
+IN_FLIGHT_PER_CONNECTION = 4 # Records queued ahead per connection; bounds memory for large batches
+MAX_SEND_ATTEMPTS = 4
+RETRY_BASE_DELAY = 2.0 # Seconds before the first retry; doubles per attempt
+RETRY_MAX_DELAY = 60.0
+
+# Statuses of a DispatchResult
+SENT = "sent"
+SKIPPED = "skipped" # Already sent (or being sent) for the same order
+INVALID = "invalid" # No order number or no usable email address
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dispatches (
+    dispatch_key TEXT PRIMARY KEY,
+    order_number TEXT NOT NULL,
+    template TEXT NOT NULL,
+    email_address TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    message_id TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+LEDGER_VERSION = 1 # PRAGMA user_version; 0 is a ledger keyed "<order number>:<template>"
+
+# A failed claim may be retried, and a sent one resent with another template when
+# :resend is set; "sending" claims are final
+CLAIM_SQL = """
+INSERT INTO dispatches (dispatch_key, order_number, template, email_address, status, updated_at)
+VALUES (:dispatch_key, :order_number, :template, :email_address, 'sending', :updated_at)
+ON CONFLICT(dispatch_key) DO UPDATE SET
+    template = excluded.template,
+    email_address = excluded.email_address,
+    status = 'sending',
+    error = NULL,
+    updated_at = excluded.updated_at
+WHERE dispatches.status = 'failed'
+    OR (:resend AND dispatches.status = 'sent' AND dispatches.template != excluded.template)
+"""
+LEGACY_KEYS_SQL = """
+SELECT dispatch_key, template, status, updated_at FROM dispatches
+WHERE substr(dispatch_key, -length(template) - 1) = ':' || template
+"""
+STATUS_RANK = {"failed": 0, "sending": 1, "sent": 2} # Which of an order's rows a merged ledger keeps
+
+
+class DispatchError(ValueError):
+    """Bad SMTP settings, or a server that rejects the login or the connection security."""
+
+
+@dataclass(slots=True, frozen=True)
+class SmtpSettings:
+    host: str
+    sender: str # From header, e.g. "DAZZLE PREMIUM <orders@dazzlepremium.com>"
+    port: int = DEFAULT_SMTP_PORT
+    username: str | None = None
+    password: str | None = None
+    security: str = "none" # none, starttls or ssl
+    timeout: float = DEFAULT_SMTP_TIMEOUT
+
+    def __post_init__(self):
+        if self.security not in SMTP_SECURITY_MODES:
+            raise DispatchError(f"SMTP security must be one of {', '.join(SMTP_SECURITY_MODES)}, not {self.security!r}")
+        if "@" not in parseaddr(self.sender)[1]:
+            raise DispatchError(f"sender {self.sender!r} has no email address")
+
+    @property
+    def envelope_sender(self):
+        return parseaddr(self.sender)[1]
+
+    @classmethod
+    def from_env(cls):
+        """
+        Settings from DAZZLE_SMTP_HOST, DAZZLE_SMTP_PORT, DAZZLE_SMTP_USER,
+        DAZZLE_SMTP_PASSWORD, DAZZLE_SMTP_SECURITY and DAZZLE_MAIL_FROM, or None
+        when DAZZLE_SMTP_HOST is not set (sending is off).
+        """
+        host = os.environ.get("DAZZLE_SMTP_HOST")
+        if not host:
+            return None
+        sender = os.environ.get("DAZZLE_MAIL_FROM")
+        if not sender:
+            raise DispatchError("DAZZLE_SMTP_HOST is set but DAZZLE_MAIL_FROM is not")
+        try:
+            port = int(os.environ.get("DAZZLE_SMTP_PORT") or DEFAULT_SMTP_PORT)
+        except ValueError as error:
+            raise DispatchError(f"DAZZLE_SMTP_PORT is not a port number: {error}") from error
+        return cls(
+            host=host,
+            sender=sender,
+            port=port,
+            username=os.environ.get("DAZZLE_SMTP_USER") or None,
+            password=os.environ.get("DAZZLE_SMTP_PASSWORD") or None,
+            security=(os.environ.get("DAZZLE_SMTP_SECURITY") or "none").lower(),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class DispatchResult:
+    order_number: str
+    email_address: str
+    template: str
+    status: str # sent, skipped, invalid or failed
+    attempts: int = 0
+    message_id: str | None = None
+    error: str | None = None
+
+
+def dispatch_key(order_number):
+    """Idempotency key of an order's email: the normalized order number, or None without one."""
+    return normalize_order_number(order_number)
+
+
+def recipient_domain(email_address):
+    """Lowercased domain of a deliverable address, or None for placeholders and malformed addresses."""
+    address = parseaddr(str(email_address or ""))[1]
+    local, _, domain = address.rpartition("@")
+    if not local or "." not in domain:
+        return None
+    return domain.lower()
+
+
+def parse_domain_rates(text):
+    """Parses "gmail.com=20,yahoo.com=2" (messages per second) into a dict."""
+    rates = {}
+    for entry in (text or "").split(","):
+        if not entry.strip():
+            continue
+        domain, separator, rate = entry.partition("=")
+        try:
+            rates[domain.strip().lower()] = float(rate)
+        except ValueError:
+            separator = ""
+        if not separator or not domain.strip():
+            raise DispatchError(f"domain rate {entry.strip()!r} is not domain=messages_per_second")
+    return rates
+
+
+def _is_transient(error):
+    """Whether a send error is worth retrying: 4xx replies, dropped connections and network errors."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPConnectError):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, OSError))
+
+
+def _error_text(error):
+    if isinstance(error, smtplib.SMTPResponseException):
+        message = error.smtp_error.decode("utf-8", "replace") if isinstance(error.smtp_error, bytes) else error.smtp_error
+        return f"{error.smtp_code} {message}"
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        code, message = next(iter(error.recipients.values()))
+        return f"{code} {message.decode('utf-8', 'replace') if isinstance(message, bytes) else message}"
+    return str(error) or type(error).__name__
+
+
+# --- Connection Pool and Rate Limits ---
+
+class SmtpPool:
+    """Up to `size` persistent SMTP connections, handed out one caller at a time."""
+
+    def __init__(self, settings, size=DEFAULT_SMTP_CONNECTIONS):
+        self.settings = settings
+        self._idle = queue.LifoQueue() # (smtp, messages sent, last used); the warmest connection first
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def _open(self):
+        settings = self.settings
+        try:
+            if settings.security == "ssl":
+                smtp = smtplib.SMTP_SSL(settings.host, settings.port, timeout=settings.timeout,
+                                        context=ssl.create_default_context())
+            else:
+                smtp = smtplib.SMTP(settings.host, settings.port, timeout=settings.timeout)
+                if settings.security == "starttls":
+                    smtp.starttls(context=ssl.create_default_context())
+            if settings.username:
+                smtp.login(settings.username, settings.password or "")
+        except (smtplib.SMTPAuthenticationError, smtplib.SMTPNotSupportedError, ssl.SSLError) as error:
+            raise DispatchError(f"SMTP server {settings.host}:{settings.port} refused the session: {_error_text(error)}") from error
+        return smtp
+
+    @staticmethod
+    def _discard(smtp):
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    def _checkout(self):
+        while True:
+            try:
+                smtp, sent, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open(), 0
+            if sent >= CONNECTION_MAX_MESSAGES:
+                self._discard(smtp)
+                continue
+            if time.monotonic() - last_used >= CONNECTION_IDLE_SECONDS:
+                try:
+                    if smtp.noop()[0] != 250:
+                        raise smtplib.SMTPServerDisconnected("NOOP refused")
+                except (smtplib.SMTPException, OSError):
+                    smtp.close()
+                    continue
+            return smtp, sent
+
+    @contextmanager
+    def connection(self):
+        """A connected SMTP client. It goes back to the pool afterwards unless the session broke."""
+        with self._slots:
+            smtp, sent = self._checkout()
+            try:
+                yield smtp
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # The server answered (and smtplib reset the transaction): the session is still usable
+                self._idle.put((smtp, sent + 1, time.monotonic()))
+                raise
+            except BaseException:
+                smtp.close()
+                raise
+            if self._closed:
+                self._discard(smtp)
+            else:
+                self._idle.put((smtp, sent + 1, time.monotonic()))
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                smtp, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(smtp)
+
+
+class DomainRateLimiter:
+    """
+    Spaces out messages per recipient domain: each domain gets `rates[domain]` (else
+    `default_rate`) messages per second. wait() blocks the calling worker until its slot.
+    """
+
+    def __init__(self, default_rate=DEFAULT_DOMAIN_RATE, rates=None):
+        self.default_rate = default_rate
+        self.rates = dict(rates or {})
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def delay(self, domain):
+        """Reserves the domain's next slot and returns the seconds until it."""
+        rate = self.rates.get(domain, self.default_rate)
+        if not rate or rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(domain, now))
+            self._next_slot[domain] = slot + 1.0 / rate
+        return slot - now
+
+    def wait(self, domain, stop=None):
+        """Sleeps until the domain's next slot; returns False if `stop` (an Event) is set first."""
+        delay = self.delay(domain)
+        if stop is not None:
+            return not stop.wait(delay) if delay > 0 else not stop.is_set()
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+
+# --- Idempotency Ledger ---
+
+class DispatchLedger:
+    """
+    SQLite record of every email claimed for sending (DAZZLE_DISPATCH_DB), one row per
+    order. claim() succeeds only for an order that was never sent or whose last attempt
+    failed, or, with resend, one that was sent with a different template.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("DAZZLE_DISPATCH_DB") or DEFAULT_DISPATCH_DB_PATH
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        if self.path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode = WAL")
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+            if self._connection.execute("PRAGMA user_version").fetchone()[0] < LEDGER_VERSION:
+                self._merge_template_keys()
+                self._connection.execute(f"PRAGMA user_version = {LEDGER_VERSION}")
+
+    def _merge_template_keys(self):
+        """
+        Rekeys a ledger written when keys were "<order number>:<template>" to one row per
+        order, keeping the most final (then latest) of each order's rows, so an order
+        sent before the upgrade still counts as sent.
+        """
+        best = {}
+        for key, template, status, updated_at in self._connection.execute(LEGACY_KEYS_SQL).fetchall():
+            rank = (STATUS_RANK.get(status, 0), updated_at)
+            order_key = key[:-len(template) - 1]
+            if order_key not in best or rank > best[order_key][0]:
+                best[order_key] = (rank, key)
+        for order_key, (rank, key) in best.items():
+            row = self._connection.execute(
+                "SELECT status, updated_at FROM dispatches WHERE dispatch_key = ?", (order_key,)
+            ).fetchone()
+            if row is not None and (STATUS_RANK.get(row[0], 0), row[1]) >= rank:
+                continue
+            self._connection.execute("DELETE FROM dispatches WHERE dispatch_key = ?", (order_key,))
+            self._connection.execute("UPDATE dispatches SET dispatch_key = ? WHERE dispatch_key = ?", (order_key, key))
+        self._connection.executemany(
+            "DELETE FROM dispatches WHERE dispatch_key = ?", [(key,) for key, *_ in self._connection.execute(LEGACY_KEYS_SQL)]
+        )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def claim(self, key, order_number, template, email_address, resend=False):
+        """
+        Marks the key as being sent; False if it was already sent or is being sent.
+        `resend` also claims a key that was sent with a template other than `template`.
+        """
+        params = {
+            "dispatch_key": key,
+            "order_number": str(order_number),
+            "template": template,
+            "email_address": email_address,
+            "updated_at": time.time(),
+            "resend": bool(resend),
+        }
+        with self._lock, self._connection:
+            return self._connection.execute(CLAIM_SQL, params).rowcount == 1
+
+    def finish(self, key, status, attempts, message_id=None, error=None):
+        """Records the outcome of a claimed send ("sent" or "failed")."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE dispatches SET status = ?, attempts = attempts + ?, message_id = ?, error = ?, updated_at = ? "
+                "WHERE dispatch_key = ?",
+                (status, attempts, message_id, error, time.time(), key),
+            )
+
+    def status(self, key):
+        """The key's ledger status (sending, sent or failed), or None if it was never claimed."""
+        entry = self.entry(key)
+        return entry[0] if entry else None
+
+    def entry(self, key):
+        """(status, template) of the key's last claim, or None if it was never claimed."""
+        with self._lock:
+            row = self._connection.execute("SELECT status, template FROM dispatches WHERE dispatch_key = ?", (key,)).fetchone()
+        return tuple(row) if row else None
+
+
+# --- Dispatcher ---
+
+class EmailDispatcher:
+    """
+    Sends rendered email records through an SmtpPool with per-domain rate limits,
+    retries and the ledger's once-per-order guarantee. `resend` deliberately sends
+    orders already sent with a different template again (never with the same one).
+    Use as a context manager (or call close()) to release the connections and the ledger.
+    """
+
+    def __init__(self, settings, ledger=None, connections=None, default_rate=None, domain_rates=None,
+                 max_attempts=MAX_SEND_ATTEMPTS, retry_base_delay=RETRY_BASE_DELAY, resend=False):
+        if settings is None:
+            raise DispatchError("sending is not configured (set DAZZLE_SMTP_HOST and DAZZLE_MAIL_FROM)")
+        self.settings = settings
+        self.connections = int(connections or os.environ.get("DAZZLE_SMTP_CONNECTIONS") or DEFAULT_SMTP_CONNECTIONS)
+        if default_rate is None:
+            default_rate = float(os.environ.get("DAZZLE_SMTP_DOMAIN_RATE") or DEFAULT_DOMAIN_RATE)
+        if domain_rates is None:
+            domain_rates = parse_domain_rates(os.environ.get("DAZZLE_SMTP_DOMAIN_RATES"))
+        self.ledger = ledger if ledger is not None else DispatchLedger()
+        self.pool = SmtpPool(settings, self.connections)
+        self.rate_limiter = DomainRateLimiter(default_rate, domain_rates)
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.resend = resend
+        self._message_domain = settings.envelope_sender.rpartition("@")[2]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+        self.ledger.close()
+
+    def _message_id(self, key, template):
+        """Stable per order and template, so a receiving server can tell a retry from a new email."""
+        digest = hashlib.sha1(f"{key}:{template}".encode("utf-8")).hexdigest()[:24]
+        return f"<{digest}.dispatch@{self._message_domain}>"
+
+    def _retry_delay(self, attempt):
+        delay = min(RETRY_MAX_DELAY, self.retry_base_delay * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def send_one(self, record, stop=None):
+        """Claims, sends and records one email; returns its DispatchResult. `stop` (an Event) ends retries early."""
+        order_number = str(record.get("order_number") or "")
+        email_address = str(record.get("email_address") or "")
+        template = record.get("template") or "standard"
+
+        def result(status, **fields):
+            return DispatchResult(order_number, email_address, template, status, **fields)
+
+        key = dispatch_key(order_number)
+        domain = recipient_domain(email_address)
+        if key is None:
+            return result(INVALID, error="no order number")
+        if domain is None:
+            return result(INVALID, error="no valid email address")
+        if not self.ledger.claim(key, order_number, template, email_address, self.resend):
+            status, sent_template = self.ledger.entry(key) or (None, None)
+            if status == "sent":
+                return result(SKIPPED, error=f"already sent ({sent_template})")
+            return result(SKIPPED, error="claimed by another send (or one interrupted mid-send); check the mailbox before resending")
+
+        message_id = self._message_id(key, template)
+        message = rendered_email_bytes(record, sender=self.settings.sender, message_id=message_id)
+        recipient = parseaddr(email_address)[1]
+        attempt = 0
+        while True:
+            if not self.rate_limiter.wait(domain, stop):
+                self.ledger.finish(key, FAILED, attempt, error="cancelled")
+                return result(FAILED, attempts=attempt, error="cancelled")
+            attempt += 1
+            try:
+                with self.pool.connection() as smtp:
+                    smtp.sendmail(self.settings.envelope_sender, [recipient], message)
+            except DispatchError:
+                self.ledger.finish(key, FAILED, attempt, error="SMTP session refused")
+                raise
+            except (smtplib.SMTPException, OSError) as error:
+                error_text = _error_text(error)
+                retry = _is_transient(error) and attempt < self.max_attempts
+                if not retry or (stop is not None and stop.wait(self._retry_delay(attempt))):
+                    self.ledger.finish(key, FAILED, attempt, error=error_text)
+                    return result(FAILED, attempts=attempt, error=error_text)
+                if stop is None:
+                    time.sleep(self._retry_delay(attempt))
+            else:
+                self.ledger.finish(key, SENT, attempt, message_id=message_id)
+                return result(SENT, attempts=attempt, message_id=message_id)
+
+    def send(self, records):
+        """
+        Sends every record concurrently (one worker per pooled connection) and yields
+        DispatchResults as they complete. Closing the generator early (e.g. a cancelled
+        job) stops queued sends; sends already under way finish and are recorded.
+        """
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix="dazzle-smtp")
+        window = self.connections * IN_FLIGHT_PER_CONNECTION
+        pending = set()
+        try:
+            for record in records:
+                pending.add(executor.submit(self.send_one, record, stop))
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,156 @@
+"""
+Columnar (Parquet / Feather) export and reload of batch results.
+
+Exports are written in row groups of EXPORT_ROW_GROUP_ROWS rows, one record batch at
+a time, so a large export never exists as a single serialized string. Feather files
+are written as uncompressed Arrow IPC, which lets open_columnar_export memory-map a
+saved file and hand back a Table whose columns point straight into the mapping (no
+parsing, no copy). Parquet has to be decoded, but only the pages are read, and the
+types (float amounts, dictionary-encoded sizes) come back intact, unlike CSV.
+
+pyarrow is imported inside the functions, like the rest of the package.
+"""
+import os
+from itertools import chain, islice
+
+EXPORT_ROW_GROUP_ROWS = 65536
+# Format -> (MIME type, download file name suffix)
+COLUMNAR_EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "feather": ("application/vnd.apache.arrow.file", ".feather"),
+}
+OPENABLE_EXPORT_EXTENSIONS = {".parquet": "parquet", ".feather": "feather", ".arrow": "feather"}
+
+
+class ExportFormatError(ValueError):
+    """A file that is not a readable Parquet/Feather export."""
+
+
+def batch_orders_schema():
+    """Arrow schema of parse_orders summary rows."""
+    import pyarrow as pa
+
+    return pa.schema([
+        ("Order Number", pa.string()),
+        ("Customer Name", pa.string()),
+        ("Amount ($)", pa.float64()),
+    ])
+
+
+def iter_frame_batches(frame, rows_per_batch=EXPORT_ROW_GROUP_ROWS):
+    """Yields a DataFrame as record batches of at most `rows_per_batch` rows (index dropped)."""
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    for start in range(0, len(frame), rows_per_batch):
+        yield pa.RecordBatch.from_pandas(frame.iloc[start:start + rows_per_batch], schema=schema, preserve_index=False)
+
+
+def iter_row_batches(rows, schema, rows_per_batch=EXPORT_ROW_GROUP_ROWS):
+    """Groups dict rows (e.g. a streaming parse) into record batches of `schema`."""
+    import pyarrow as pa
+
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, rows_per_batch))
+        if not chunk:
+            return
+        yield pa.RecordBatch.from_pylist(chunk, schema=schema)
+
+
+def write_columnar(batches, fileobj, export_format, schema=None):
+    """
+    Streams record batches into `fileobj` (path or binary file) as Parquet (one row
+    group per batch) or uncompressed Feather. `schema` is needed only to write an
+    empty file when there are no batches. Returns the number of rows written.
+    """
+    import pyarrow as pa
+
+    if export_format not in COLUMNAR_EXPORT_FORMATS:
+        raise ExportFormatError(f"unknown export format {export_format!r}")
+    batches = iter(batches)
+    first_batch = next(batches, None)
+    if first_batch is not None:
+        schema = first_batch.schema
+    elif schema is None:
+        raise ExportFormatError("nothing to export")
+
+    count = 0
+    if export_format == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(fileobj, schema)
+    else:
+        writer = pa.ipc.new_file(fileobj, schema, options=pa.ipc.IpcWriteOptions(compression=None))
+    with writer:
+        if first_batch is not None:
+            for batch in chain((first_batch,), batches):
+                writer.write_batch(batch)
+                count += batch.num_rows
+    return count
+
+
+def write_frame_columnar(frame, fileobj, export_format, rows_per_batch=EXPORT_ROW_GROUP_ROWS):
+    """write_columnar for a DataFrame (e.g. the parse_orders result shown in the UI)."""
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    return write_columnar(iter_frame_batches(frame, rows_per_batch), fileobj, export_format, schema)
+
+
+def export_format_for(name):
+    """Picks the columnar format from a file name's extension."""
+    export_format = OPENABLE_EXPORT_EXTENSIONS.get(os.path.splitext(name)[1].lower())
+    if export_format is None:
+        raise ExportFormatError(f"{name} is not a .parquet, .feather or .arrow file")
+    return export_format
+
+
+def open_columnar_export(source, export_format=None):
+    """
+    Opens a saved export as a pyarrow Table without re-parsing any text.
+    `source` is a file path, which is memory-mapped (zero-copy for Feather), or a
+    bytes-like object such as an upload's getbuffer(), which is wrapped without copying
+    (its format is then sniffed when not given).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if isinstance(source, (str, os.PathLike)):
+        export_format = export_format or export_format_for(os.fspath(source))
+        try:
+            if export_format == "parquet":
+                return pq.read_table(source, memory_map=True)
+            return pa.ipc.open_file(pa.memory_map(os.fspath(source), "r")).read_all()
+        except (OSError, pa.ArrowInvalid) as error:
+            raise ExportFormatError(f"cannot open {source}: {error}") from error
+
+    buffer = pa.py_buffer(source)
+    export_format = export_format or _sniff_export_format(buffer)
+    try:
+        if export_format == "parquet":
+            return pq.read_table(pa.BufferReader(buffer))
+        return pa.ipc.open_file(pa.BufferReader(buffer)).read_all()
+    except (OSError, pa.ArrowInvalid) as error:
+        raise ExportFormatError(f"not a readable {export_format} export: {error}") from error
+
+
+def _sniff_export_format(buffer):
+    """Tells Parquet ("PAR1") from Arrow IPC ("ARROW1") by the file's magic bytes."""
+    head = buffer[:6].to_pybytes()
+    if head.startswith(b"PAR1"):
+        return "parquet"
+    if head == b"ARROW1":
+        return "feather"
+    raise ExportFormatError("not a Parquet or Feather file")
+
+
+def list_saved_exports(directory):
+    """Returns openable export paths in `directory`, newest first ([] if it does not exist)."""
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.is_file()]
+    except OSError:
+        return []
+    exports = [entry for entry in entries if os.path.splitext(entry.name)[1].lower() in OPENABLE_EXPORT_EXTENSIONS]
+    exports.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    return [entry.path for entry in exports]
@@ -0,0 +1,204 @@
+"""
+Hardened parsing of untrusted pastes: size limits and a per-call time budget.
+
+GuardedParser wraps a parser function (parse_shopify_export_compact in the app) so a
+hostile or malformed paste can never stall the Streamlit server process that every
+agent shares:
+
+- Input limits: a paste over MAX_PASTE_CHARS is refused before it is split into
+  orders, each order over MAX_ORDER_CHARS is refused, and lines longer than
+  MAX_LINE_CHARS (no real order page has one) are clipped before any pattern sees them.
+- Time budget: every call runs in one of a few long-lived worker processes. A call
+  that has not answered within the budget (DAZZLE_PARSE_TIME_BUDGET seconds) raises
+  ParseTimeout; its worker is killed and replaced, so the stuck regex dies with it.
+
+Workers are fresh interpreters (`python -m dazzle.guard`), never forks of the calling
+process: the Streamlit server runs threads, and a forked child inherits any lock one
+of them held at that moment. They are not multiprocessing "spawn"/"forkserver"
+children either, which re-import the parent's __main__ (under Streamlit, the app
+script itself). The parser is pickled to each worker, so it must be importable by
+name, e.g. a module-level function.
+
+The parser patterns themselves are written to run in linear time (see
+dazzle.parsing); the budget is the backstop. benchmarks/fuzz_parsers.py checks both.
+"""
+import atexit
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+from multiprocessing.connection import Connection
+
+from dazzle.instrumentation import INSTRUMENTATION, capture_traces
+
+DEFAULT_PARSE_TIME_BUDGET = 2.0 # Seconds per order before its worker is killed
+DEFAULT_GUARD_WORKERS = 2
+MAX_PASTE_CHARS = 5_000_000 # A whole Email Generator paste (every order in it)
+MAX_ORDER_CHARS = 250_000 # One order page; real ones are a few KB
+MAX_LINE_CHARS = 2_000
+
+
+class ParseRejected(ValueError):
+    """An untrusted paste that was refused instead of parsed."""
+
+
+class InputTooLarge(ParseRejected):
+    """A paste or order page over the size limits."""
+
+
+class ParseTimeout(ParseRejected):
+    """A parse that ran past its time budget (its worker was killed)."""
+
+
+def check_paste_size(raw_text_input, max_chars=MAX_PASTE_CHARS):
+    """Raises InputTooLarge for a paste longer than `max_chars`."""
+    if len(raw_text_input) > max_chars:
+        raise InputTooLarge(f"paste is {len(raw_text_input):,} characters; the limit is {max_chars:,}")
+
+
+def clip_long_lines(text, max_line_chars=MAX_LINE_CHARS):
+    """Cuts every line down to `max_line_chars`; text without long lines is returned as is."""
+    lines = text.split("\n")
+    if max(map(len, lines)) <= max_line_chars:
+        return text
+    return "\n".join(line[:max_line_chars] for line in lines)
+
+
+def _serve_parses(connection, parser, initializer=None):
+    """Worker-process loop: parses each text it receives and sends back (status, result, stage traces)."""
+    if initializer is not None:
+        initializer()
+    while True:
+        try:
+            text = connection.recv()
+        except EOFError: # The server process went away
+            return
+        with capture_traces() as traces:
+            try:
+                reply = ("ok", parser(text))
+            except Exception as exc: # Reported to the caller, the worker keeps serving
+                reply = ("error", f"{type(exc).__name__}: {exc}")
+        connection.send((*reply, traces))
+
+
+class GuardedParser:
+    """
+    Callable that parses one order page in a killable worker process, within
+    `time_budget` seconds (DAZZLE_PARSE_TIME_BUDGET) and the input limits. Up to
+    `workers` (DAZZLE_PARSE_GUARD_WORKERS) calls run at once; more wait for a free
+    worker, for at most the same budget. `initializer` (e.g. default_catalog) runs
+    once in each worker before its first call.
+    """
+
+    def __init__(self, parser, time_budget=None, workers=None, max_chars=MAX_ORDER_CHARS, initializer=None):
+        self.parser = parser
+        self.initializer = initializer
+        if time_budget is None:
+            time_budget = float(os.environ.get("DAZZLE_PARSE_TIME_BUDGET") or DEFAULT_PARSE_TIME_BUDGET)
+        self.time_budget = time_budget
+        self.workers = int(workers or os.environ.get("DAZZLE_PARSE_GUARD_WORKERS") or DEFAULT_GUARD_WORKERS)
+        self.max_chars = max_chars
+        self._idle = queue.Queue() # (process, connection) pairs ready for a call
+        self._processes = set() # Every live worker, idle or busy
+        self._started = 0
+        self._lock = threading.Lock()
+        self.timeouts = 0
+        atexit.register(self.close) # Workers are not daemonic; a stuck one must not outlive the server
+
+    def _spawn(self):
+        parent_socket, child_socket = socket.socketpair()
+        # The worker imports dazzle (and then the parser) before it can read anything from
+        # us, so it gets this process's import path up front, whatever its working directory
+        import_path = os.pathsep.join(os.path.abspath(entry or os.curdir) for entry in sys.path)
+        with child_socket:
+            process = subprocess.Popen(
+                [sys.executable, "-m", "dazzle.guard", str(child_socket.fileno())],
+                pass_fds=(child_socket.fileno(),), stdin=subprocess.DEVNULL,
+                env={**os.environ, "PYTHONPATH": import_path},
+            )
+        connection = Connection(parent_socket.detach())
+        connection.send((self.parser, self.initializer))
+        self._processes.add(process)
+        return process, connection
+
+    def _kill(self, worker):
+        process, connection = worker
+        process.kill()
+        process.wait()
+        connection.close()
+        self._processes.discard(process)
+
+    def start(self):
+        """Starts every worker now rather than on first use, so the first calls don't wait for start-up."""
+        with self._lock:
+            while self._started < self.workers:
+                self._idle.put(self._spawn())
+                self._started += 1
+
+    def close(self):
+        """Stops every worker; idle ones are closed, busy ones are killed (their calls fail as crashed)."""
+        with self._lock:
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                self._kill(worker)
+                self._started -= 1
+            for process in list(self._processes):
+                process.kill()
+                process.wait()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._started < self.workers:
+                self._started += 1
+                return self._spawn()
+        try:
+            return self._idle.get(timeout=self.time_budget)
+        except queue.Empty:
+            raise ParseTimeout(f"every parser worker stayed busy for {self.time_budget:g}s") from None
+
+    def __call__(self, text):
+        if len(text) > self.max_chars:
+            raise InputTooLarge(f"order page is {len(text):,} characters; the limit is {self.max_chars:,}")
+        text = clip_long_lines(text)
+
+        worker = self._acquire()
+        process, connection = worker
+        try:
+            connection.send(text)
+            reply = connection.recv() if connection.poll(self.time_budget) else None
+        except (EOFError, OSError): # The worker died mid-call
+            reply = ("crashed", None, [])
+        if reply is None or reply[0] == "crashed":
+            self._kill(worker)
+            self._idle.put(self._spawn()) # Replace it before reporting, so the pool never shrinks
+            if reply is None:
+                self.timeouts += 1
+                raise ParseTimeout(f"parsing took longer than {self.time_budget:g}s and was stopped")
+            raise ParseRejected("the parser worker crashed on this paste")
+
+        self._idle.put(worker)
+        status, result, traces = reply
+        INSTRUMENTATION.merge(traces) # Worker stage timings show up in this process's diagnostics
+        if status == "error":
+            raise ParseRejected(f"could not parse this paste ({result})")
+        return result
+
+
+def _worker_main(fd):
+    """A worker process: reads the parser and initializer from the socket `fd`, then serves parses."""
+    connection = Connection(fd)
+    parser, initializer = connection.recv()
+    _serve_parses(connection, parser, initializer)
+
+
+if __name__ == "__main__":
+    _worker_main(int(sys.argv[1]))
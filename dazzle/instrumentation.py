@@ -0,0 +1,348 @@
+"""
+Per-stage latency instrumentation for the parsers and email renderers.
+
+Functions decorated with @instrumented("name") record one trace per call. Inside
+them, mark("stage") closes the current stage, so a trace is a list of
+(stage, seconds) pairs. Traces feed:
+
+- per-operation and per-stage histograms, exported as Prometheus text or JSON;
+- a ring of the last RECENT_TRACES_KEPT traces for the UI diagnostics expander.
+
+Optionally (DAZZLE_PROFILE_DIR), a sampled fraction of calls (DAZZLE_PROFILE_SAMPLE)
+run with a StackSampler watching them from a background thread; when one of those
+runs slower than DAZZLE_PROFILE_SLOW_MS, its folded stacks and its trace are written
+to DAZZLE_PROFILE_DIR. Nothing is re-run and the input itself is never written.
+
+Set DAZZLE_INSTRUMENTATION=0 to turn recording off. Histograms are per process,
+so process-pool workers ship their traces back with capture_traces()/merge().
+"""
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT_TRACES_KEPT = 50
+DEFAULT_PROFILE_SLOW_MS = 250.0
+DEFAULT_PROFILE_SAMPLE = 0.05 # Fraction of calls run under the stack sampler
+PROFILE_INTERVAL_SECONDS = 0.001 # Between stack samples (the GIL switch interval may stretch it)
+PROFILE_COOLDOWN_SECONDS = 30.0 # At most one slow-input profile per operation in this window
+
+_current_trace = contextvars.ContextVar("dazzle_trace", default=None)
+_capture = threading.local() # .records: list that traces are also appended to inside capture_traces()
+_PROFILING = object() # Marks a profile_call() run so it is not traced (or profiled) again
+
+
+class Trace:
+    """Stage timings of one instrumented call."""
+
+    __slots__ = ("operation", "started", "_last", "stages")
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started = self._last = time.perf_counter()
+        self.stages = []
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages.append((stage, now - self._last))
+        self._last = now
+
+
+def mark(stage):
+    """Ends the named stage of the trace running in this context (no-op outside one)."""
+    trace = _current_trace.get()
+    if trace is not None and trace is not _PROFILING:
+        trace.mark(stage)
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack from a background thread every `interval`
+    seconds while started, counting each distinct stack below `root` (the frame
+    that started it). write() saves the counts in the folded format that
+    flamegraph.pl and speedscope read.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_id = None
+        self._root = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._root = sys._getframe(1)
+        self._thread = threading.Thread(target=self._run, name="dazzle-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._root = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None and frame is not self._root:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as profile_file:
+            for stack, count in self.stacks.most_common():
+                profile_file.write(f"{stack} {count}\n")
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus semantics)."""
+
+    __slots__ = ("bucket_counts", "count", "sum")
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.bucket_counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def cumulative(self):
+        """Returns [(upper bound label, cumulative count)] including +Inf."""
+        running, buckets = 0, []
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.bucket_counts):
+            running += count
+            buckets.append(("+Inf" if bound == float("inf") else repr(bound), running))
+        return buckets
+
+    def as_dict(self):
+        return {"count": self.count, "sum": self.sum, "buckets": dict(self.cumulative())}
+
+
+class Instrumentation:
+    """Process-wide registry of operation/stage histograms and the most recent traces."""
+
+    def __init__(self, enabled=None, recent=RECENT_TRACES_KEPT, profile_dir=None, profile_slow_ms=None,
+                 profile_sample=None):
+        if enabled is None:
+            enabled = os.environ.get("DAZZLE_INSTRUMENTATION", "1").lower() not in ("0", "false", "no", "off")
+        self.enabled = enabled
+        self.profile_dir = profile_dir or os.environ.get("DAZZLE_PROFILE_DIR") or None
+        slow_ms = profile_slow_ms or os.environ.get("DAZZLE_PROFILE_SLOW_MS") or DEFAULT_PROFILE_SLOW_MS
+        self.profile_slow_seconds = float(slow_ms) / 1000
+        if profile_sample is None:
+            profile_sample = os.environ.get("DAZZLE_PROFILE_SAMPLE") or DEFAULT_PROFILE_SAMPLE
+        self.profile_sample = float(profile_sample)
+        self._lock = threading.Lock()
+        self._operations = {} # operation -> Histogram
+        self._stages = {} # (operation, stage) -> Histogram
+        self._recent = deque(maxlen=recent)
+        self._last_profiled = {} # operation -> perf_counter of the last capture
+
+    def record(self, operation, total, stages, input_size=None):
+        """Adds one finished call (durations in seconds) to the histograms and the recent ring."""
+        record = (operation, total, stages, input_size, time.time())
+        with self._lock:
+            histogram = self._operations.get(operation)
+            if histogram is None:
+                histogram = self._operations[operation] = Histogram()
+            histogram.observe(total)
+            for stage, seconds in stages:
+                histogram = self._stages.get((operation, stage))
+                if histogram is None:
+                    histogram = self._stages[(operation, stage)] = Histogram()
+                histogram.observe(seconds)
+            self._recent.append(record)
+        captured = getattr(_capture, "records", None)
+        if captured is not None:
+            captured.append(record[:4])
+
+    def merge(self, records):
+        """Records traces collected in another process by capture_traces()."""
+        for operation, total, stages, input_size in records:
+            self.record(operation, total, stages, input_size)
+
+    def recent(self, limit=None):
+        """Returns the newest traces first, as dicts with millisecond timings."""
+        with self._lock:
+            records = list(self._recent)
+        records.reverse()
+        return [_trace_dict(record) for record in (records[:limit] if limit else records)]
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+            self._stages.clear()
+            self._recent.clear()
+
+    def to_json(self):
+        """Histograms and recent traces as a JSON-serializable dict."""
+        with self._lock:
+            operations = {name: histogram.as_dict() for name, histogram in self._operations.items()}
+            for (operation, stage), histogram in self._stages.items():
+                operations.setdefault(operation, {}).setdefault("stages", {})[stage] = histogram.as_dict()
+        return {"buckets": list(LATENCY_BUCKETS), "operations": operations, "recent": self.recent()}
+
+    def to_prometheus(self):
+        """Histograms in the Prometheus text exposition format."""
+        lines = [
+            "# HELP dazzle_operation_duration_seconds Wall time of instrumented parser/renderer calls.",
+            "# TYPE dazzle_operation_duration_seconds histogram",
+        ]
+        with self._lock:
+            for operation, histogram in sorted(self._operations.items()):
+                lines += _prometheus_histogram("dazzle_operation_duration_seconds", f'operation="{operation}"', histogram)
+            lines += [
+                "# HELP dazzle_stage_duration_seconds Wall time of each stage inside an instrumented call.",
+                "# TYPE dazzle_stage_duration_seconds histogram",
+            ]
+            for (operation, stage), histogram in sorted(self._stages.items()):
+                labels = f'operation="{operation}",stage="{stage}"'
+                lines += _prometheus_histogram("dazzle_stage_duration_seconds", labels, histogram)
+        return "\n".join(lines) + "\n"
+
+    def _profiling(self, operation):
+        """Whether to sample this call's stacks: a sampled fraction, outside the operation's cooldown."""
+        if not self.profile_dir or random.random() >= self.profile_sample:
+            return False
+        last = self._last_profiled.get(operation)
+        return last is None or time.perf_counter() - last >= PROFILE_COOLDOWN_SECONDS
+
+    def _keep_profile(self, operation, total):
+        """Whether a sampled call was slow enough to write, starting the operation's cooldown if so."""
+        if total < self.profile_slow_seconds:
+            return False
+        now = time.perf_counter()
+        with self._lock:
+            last = self._last_profiled.get(operation)
+            if last is not None and now - last < PROFILE_COOLDOWN_SECONDS:
+                return False
+            self._last_profiled[operation] = now
+        return True
+
+    def write_profile(self, sampler, operation, total, stages, input_size=None):
+        """Writes a slow call's folded stacks and its trace (never its input); returns the profile path."""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stem = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{operation}_{os.getpid()}")
+        path = stem + ".folded"
+        sampler.write(path)
+        with open(stem + ".trace.json", "w", encoding="utf-8") as trace_file:
+            record = (operation, total, stages, input_size, time.time())
+            json.dump({**_trace_dict(record), "samples": sum(sampler.stacks.values())}, trace_file, indent=2)
+        return path
+
+
+def _trace_dict(record):
+    operation, total, stages, input_size, recorded_at = record
+    return {
+        "operation": operation,
+        "at": recorded_at,
+        "total_ms": total * 1000,
+        "stages_ms": {stage: seconds * 1000 for stage, seconds in stages},
+        "input_size": input_size,
+    }
+
+
+def _prometheus_histogram(name, labels, histogram):
+    lines = [f'{name}_bucket{{{labels},le="{bound}"}} {count}' for bound, count in histogram.cumulative()]
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum!r}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+INSTRUMENTATION = Instrumentation()
+
+
+@contextmanager
+def capture_traces():
+    """
+    Collects the (operation, total, stages, input_size) tuples recorded on this thread,
+    e.g. inside a process-pool task, so the parent can merge() them.
+    """
+    records = _capture.records = []
+    try:
+        yield records
+    finally:
+        _capture.records = None
+
+
+def _input_size(args):
+    first = args[0] if args else None
+    return len(first) if isinstance(first, str) else None
+
+
+def instrumented(operation):
+    """Decorator: records a trace per call of the function under `operation`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION.enabled or _current_trace.get() is not None:
+                return func(*args, **kwargs) # Nested calls are stages of the outer trace
+            sampler = StackSampler() if INSTRUMENTATION._profiling(operation) else None
+            trace = Trace(operation)
+            token = _current_trace.set(trace)
+            if sampler is not None:
+                sampler.start()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                if sampler is not None:
+                    sampler.stop()
+                _current_trace.reset(token)
+            total = time.perf_counter() - trace.started
+            INSTRUMENTATION.record(operation, total, trace.stages, _input_size(args))
+            if sampler is not None and INSTRUMENTATION._keep_profile(operation, total):
+                INSTRUMENTATION.write_profile(sampler, operation, total, trace.stages, _input_size(args))
+            return result
+        return wrapper
+    return decorator
+
+
+def profile_call(func, args, kwargs, directory, operation):
+    """
+    Runs func(*args, **kwargs) under pyinstrument (HTML) if installed, else cProfile
+    (.pstats), and writes the profile to `directory`. Returns the profile path. For
+    the offline `dazzle profile` command; served calls are profiled by sampling.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}_{operation}_{os.getpid()}")
+
+    token = _current_trace.set(_PROFILING)
+    try:
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            profiler = cProfile.Profile()
+            profiler.runcall(func, *args, **kwargs)
+            path = stem + ".pstats"
+            profiler.dump_stats(path)
+        else:
+            profiler = Profiler(interval=0.0001)
+            profiler.start()
+            try:
+                func(*args, **kwargs)
+            finally:
+                profiler.stop()
+            path = stem + ".html"
+            with open(path, "w", encoding="utf-8") as profile_file:
+                profile_file.write(profiler.output_html())
+    finally:
+        _current_trace.reset(token)
+    return path
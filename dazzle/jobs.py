@@ -0,0 +1,662 @@
+"""
+Background jobs for long-running batch work (batch parses, bulk email rendering
+and sending).
+
+Jobs are rows in a SQLite table, so status, progress and results outlive the
+Streamlit session that submitted them: a browser refresh (or another tab) finds the
+job again by its id. Work runs in a small thread pool inside the server process, so
+the session that submitted it keeps rerunning normally. A handler reports progress
+through its JobContext; once a job is cancelled, the next report raises JobCancelled
+inside the handler and the job stops there.
+
+Inputs and results are pickled into the job directory; a batch parse keeps its
+table there as an Arrow file, with the shared batch store (dazzle.shared) as a cache
+in front of it. Parse jobs that were queued or running when the process stopped are
+queued again on startup; other kinds (bulk emails) fail as interrupted and are only
+rerun by the user. Finished jobs and their files are pruned after JOB_RETENTION_SECONDS.
+"""
+import glob
+import io
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+DEFAULT_JOB_DB_PATH = "dazzle_jobs.sqlite3"
+DEFAULT_JOB_DIR = "dazzle_jobs"
+DEFAULT_JOB_WORKERS = min(4, os.cpu_count() or 1) # A few, so one large parse doesn't hold up every session's jobs
+PROGRESS_WRITE_INTERVAL = 0.5 # Seconds between progress writes to SQLite
+JOB_RETENTION_SECONDS = 7 * 86400
+SUMMARY_SLICE_BLOCKS = 2000 # Order blocks per parse_orders call in a summary job (one progress step)
+UPLOAD_PROGRESS_ROWS = 1000 # Rows between progress reports when streaming an uploaded CSV/JSON
+BLOCK_ORDINAL_COLUMN = "_block" # Each summary row's block in the pasted text, stored to seed incremental parsers
+
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+RESUMABLE_JOB_KINDS = ("batch_parse",) # Others (e.g. a mailing) are never restarted without the user
+INTERRUPTED_ERROR = "interrupted by a server restart; run it again"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    progress_done INTEGER NOT NULL DEFAULT 0,
+    progress_total INTEGER,
+    message TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+"""
+
+
+class JobError(ValueError):
+    """An unknown job id or kind, or a result asked for before the job is done."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler (by JobContext.report) once its job has been cancelled."""
+
+
+@dataclass(slots=True, frozen=True)
+class Job:
+    id: str
+    kind: str
+    status: str # queued, running, done, failed or cancelled
+    params: dict
+    progress_done: int
+    progress_total: int | None
+    message: str | None
+    error: str | None
+    cancel_requested: bool
+    created_at: float
+    updated_at: float
+    finished_at: float | None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    @property
+    def fraction(self):
+        """Progress in [0, 1], or None while the total is unknown."""
+        if self.status == "done":
+            return 1.0
+        if not self.progress_total:
+            return None
+        return min(1.0, self.progress_done / self.progress_total)
+
+
+class JobContext:
+    """Handed to a job handler: progress reporting, cancellation, and in-process extras."""
+
+    def __init__(self, queue, job_id, local=None):
+        self.queue = queue
+        self.job_id = job_id
+        self.local = local or {} # Unpersisted objects from the submitting session (e.g. a parser cache)
+        self._cancel_event = queue._cancel_events[job_id]
+        self._last_write = 0.0
+
+    def artifact_path(self, name):
+        """Path of a file kept with this job's result (e.g. "batch.arrows"), pruned with the job."""
+        return self.queue.artifact_path(self.job_id, name)
+
+    def service(self, name):
+        """A process-wide object from the queue's `services` (e.g. the order store), or None if it has none."""
+        factory = self.queue.services.get(name)
+        return None if factory is None else factory()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def report(self, done, total=None, message=None, force=False):
+        """Records progress (at most every PROGRESS_WRITE_INTERVAL seconds); raises JobCancelled if cancelled."""
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.job_id)
+        now = time.monotonic()
+        if force or now - self._last_write >= PROGRESS_WRITE_INTERVAL:
+            self._last_write = now
+            self.queue._update(self.job_id, progress_done=done, progress_total=total, message=message)
+
+
+# --- Job Handlers ---
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Registers handler(context, params, payload) -> result for a job kind."""
+    def register(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def _payload_text(payload):
+    if isinstance(payload, str):
+        return payload
+    return payload["data"].decode("utf-8", errors="replace")
+
+
+def _payload_file(payload):
+    """An uploaded export kept as {"name", "data"} as a named binary stream for the upload parsers."""
+    stream = io.BytesIO(payload["data"])
+    stream.name = payload["name"]
+    return stream
+
+
+def _iter_block_slices(text, blocks_per_slice):
+    """Splits orders page text into (slice, block count) pieces, each starting at a block marker."""
+    from dazzle.parsing import ORDER_BLOCK_MARKER
+
+    start = text.find(ORDER_BLOCK_MARKER)
+    while start != -1:
+        end, blocks = start, 0
+        while blocks < blocks_per_slice:
+            end = text.find(ORDER_BLOCK_MARKER, end + 1)
+            blocks += 1
+            if end == -1:
+                break
+        yield text[start:] if end == -1 else text[start:end], blocks
+        start = end
+
+
+@job_handler("batch_parse")
+def run_batch_parse(context, params, payload):
+    """
+    Batch Orders parse. params["mode"] is "summary" or "line_items", and the optional
+    params["batch_id"] names the batch its orders are saved with (the submitting
+    session's); the payload is pasted text or an uploaded file as {"name", "data"}.
+
+    The parsed orders are scored, linked and saved to the order store here, once per
+    job (see _apply_batch), so sessions that show the result have nothing to redo.
+
+    With the shared batch store (dazzle.shared) the parsed table is then written
+    once, to a file with the job ("batch_path"), and published in the store under the
+    input's content hash ("shared_key"). An input any session already parsed is not
+    parsed again: its job links the existing file, and the submitting session's
+    incremental parser takes on the stored parse. Read results with resolve_batch_parse.
+    """
+    from dazzle.shared import batch_content_key, shared_batches, write_batch_file
+
+    store = shared_batches()
+    if store is None:
+        result = _parse_batch(context, params, payload)
+        result.update(_apply_batch(context, result, params.get("batch_id")))
+        result.pop("new_rows", None)
+        return result
+
+    key = batch_content_key(params["mode"], payload)
+    table = _cached_batch_table(context, params, payload, store.get(key))
+    if table is not None:
+        result = {"parsed_blocks": None, "reused_blocks": None}
+        batch = _table_batch(params, table)
+    else:
+        result = _parse_batch(context, params, payload)
+        batch = {"frame": None, **result} if params["mode"] == "line_items" else result
+    applied = _apply_batch(context, batch, params.get("batch_id"))
+
+    batch_path = context.artifact_path("batch.arrows")
+    source_path = store.file_path(key) if table is not None else None
+    if source_path is None or not _link_batch_file(source_path, batch_path):
+        write_batch_file(batch_path, table if table is not None else _batch_table(params, result))
+    store.publish(key, batch_path)
+    for name in ("line_items", "frame", "warnings", "new_rows", "block_ordinals"): # Kept in the batch file, not the pickle
+        result.pop(name, None)
+    return {**result, **applied, "batch_path": batch_path, "shared_key": key}
+
+
+def _cached_batch_table(context, params, payload, table):
+    """
+    `table`, a stored parse of this job's input (or None), if the job can use it: the
+    submitting session's incremental parser (if any) takes it on. A summary table
+    without block ordinals cannot seed the parser, so the input is parsed again.
+    """
+    from dazzle.shared import table_frame
+
+    incremental_parser = context.local.get("incremental_parser")
+    if table is None or params["mode"] == "line_items" or incremental_parser is None or not isinstance(payload, str):
+        return table
+    if BLOCK_ORDINAL_COLUMN not in table.column_names:
+        return None
+    incremental_parser.adopt(payload, table_frame(table.drop_columns([BLOCK_ORDINAL_COLUMN])),
+                             table.column(BLOCK_ORDINAL_COLUMN).to_numpy())
+    return table
+
+
+def _batch_table(params, result):
+    """The Arrow table written for a fresh _parse_batch result (see resolve_batch_parse for reading it)."""
+    import pyarrow as pa
+
+    from dazzle.shared import table_with_warnings
+
+    if params["mode"] == "line_items":
+        return result["line_items"].to_arrow(include_amounts=True)
+    table = pa.Table.from_pandas(result["frame"], preserve_index=False)
+    if result.get("block_ordinals") is not None and table.num_columns:
+        table = table.append_column(BLOCK_ORDINAL_COLUMN, pa.array(result["block_ordinals"], type=pa.int64()))
+    return table_with_warnings(table, result["warnings"])
+
+
+def _table_batch(params, table):
+    """A stored batch table in resolve_batch_parse's form: zero-copy views, plus LineItemColumns for line items."""
+    from dazzle.models import LINE_ITEM_COLUMNS, LineItemColumns
+    from dazzle.shared import table_frame, table_warnings
+
+    if params["mode"] == "line_items":
+        return {"line_items": LineItemColumns.from_arrow(table), "frame": table_frame(table.select(LINE_ITEM_COLUMNS))}
+    if BLOCK_ORDINAL_COLUMN in table.column_names:
+        table = table.drop_columns([BLOCK_ORDINAL_COLUMN])
+    return {"frame": table_frame(table), "warnings": table_warnings(table)}
+
+
+def _link_batch_file(source_path, path):
+    """
+    Gives this job the already parsed batch at `source_path` as a hard link (the
+    pages are shared, and the batch outlives the job that parsed it). False if the
+    link cannot be made (then the batch is parsed again).
+    """
+    try:
+        os.link(source_path, path)
+    except OSError: # Its job was pruned meanwhile, or the filesystem has no hard links
+        return False
+    return True
+
+
+def _apply_batch(context, batch, batch_id=None):
+    """
+    The side effects of a parsed batch: risk scores ("risk", a RiskScores, or the
+    "risk_error" of a broken rules file), duplicate/repeat-customer "links", and the
+    orders saved to the order store and added to the linkage index. Orders are saved
+    with `batch_id` and linked before they are saved, and links leave that batch's
+    earlier saves out, so no order (re-parsed or not) counts as its own history. Uses
+    the queue's "order_store", "linkage_index" and "risk_model" services; without an
+    order store the batch is only parsed.
+    """
+    from dazzle.linkage import link_line_items, link_summary_rows
+    from dazzle.risk import RiskRulesError, line_item_risk_features, summary_risk_features
+
+    applied = {"risk": None, "risk_error": None, "links": None}
+    order_store = context.service("order_store")
+    line_items = batch.get("line_items")
+    if order_store is None or not (line_items if line_items is not None else len(batch["frame"])):
+        return applied
+
+    context.report(0, 1, "saving orders", force=True)
+    try:
+        risk_model = context.service("risk_model")
+        if risk_model is not None:
+            features = line_item_risk_features(line_items, order_store, batch_id) if line_items is not None \
+                else summary_risk_features(batch["frame"], order_store, batch_id)
+            applied["risk"] = risk_model.score(features)
+    except RiskRulesError as exc:
+        applied["risk_error"] = str(exc)
+    linkage_index = context.service("linkage_index")
+    if linkage_index is not None:
+        applied["links"] = link_line_items(linkage_index, line_items, batch_id) if line_items is not None \
+            else link_summary_rows(linkage_index, batch["frame"], batch_id)
+
+    # Keep every parsed order searchable from the header, and linkable by the next batch
+    saved_at = time.time()
+    if line_items is not None:
+        order_store.save_parsed_orders(line_items.iter_orders(), amounts=line_items.amounts, batch_id=batch_id)
+    else:
+        new_rows = batch.get("new_rows")
+        order_store.save_batch_rows(batch["frame"] if new_rows is None else new_rows, batch_id=batch_id)
+    if linkage_index is not None:
+        linkage_index.add_records(order_store.iter_linkage_records(updated_since=saved_at))
+    return applied
+
+
+def resolve_batch_parse(params, result):
+    """
+    A batch_parse result in its full form. Summary results are {"frame", "warnings",
+    "parsed_blocks", "reused_blocks"}; line-item results are {"line_items":
+    LineItemColumns, "frame"}, where "frame" (None if not shared) is the display
+    table. Shared frames are zero-copy views of the shared batch. Both also carry the
+    "risk", "risk_error" and "links" the job computed (_apply_batch).
+
+    A batch no longer in the shared store (its index entry was replaced or removed)
+    is read from the job's own file and published again. Raises JobError if that
+    file is gone.
+    """
+    key = result.get("shared_key")
+    if key is None:
+        return {"frame": None, **result} if params["mode"] == "line_items" else result
+
+    from dazzle.shared import read_batch_file, shared_batches
+
+    store = shared_batches()
+    table = store.get(key) if store is not None else None
+    if table is None:
+        try:
+            table = read_batch_file(result["batch_path"])
+        except FileNotFoundError:
+            raise JobError("This batch's parsed table is gone from the job directory; parse it again.") from None
+        if store is not None:
+            store.publish(key, result["batch_path"])
+    return {**result, **_table_batch(params, table)}
+
+
+def _parse_batch(context, params, payload):
+    """
+    Parses a batch_parse input. Summary results are {"frame", "warnings",
+    "new_rows", "parsed_blocks", "reused_blocks", "block_ordinals"} (the last two
+    only from the session's incremental parser); line-item results are
+    {"line_items": LineItemColumns}.
+    """
+    import pandas as pd
+
+    from dazzle.parsing import (
+        ORDER_BLOCK_MARKER, build_orders_frame, iter_order_blocks, iter_uploaded_order_rows,
+        parse_order_details_columns, parse_orders,
+    )
+
+    uploaded_table = isinstance(payload, dict) and not payload["name"].lower().endswith(".txt")
+    if params["mode"] == "line_items":
+        if uploaded_table:
+            raise JobError("Full line items needs the orders page text (paste it or upload a .txt file).")
+        text = _payload_text(payload)
+        total = text.count(ORDER_BLOCK_MARKER)
+        context.report(0, total, "orders", force=True)
+        line_items = parse_order_details_columns(
+            iter_order_blocks([text]), progress=lambda done: context.report(done, total, "orders")
+        )
+        return {"line_items": line_items}
+
+    result = {"new_rows": None, "parsed_blocks": None, "reused_blocks": None}
+    if uploaded_table:
+        stream = _payload_file(payload)
+        size = len(payload["data"])
+
+        def rows_with_progress():
+            for count, row in enumerate(iter_uploaded_order_rows(stream), 1):
+                if count % UPLOAD_PROGRESS_ROWS == 0:
+                    context.report(stream.tell(), size, "bytes")
+                yield row
+
+        context.report(0, size, "bytes", force=True)
+        result["frame"], result["warnings"] = build_orders_frame(rows_with_progress())
+        return result
+
+    text = _payload_text(payload)
+    incremental_parser = context.local.get("incremental_parser")
+    if incremental_parser is not None and isinstance(payload, str):
+        # A copy of the submitting session's parser (this job's alone): only blocks it has not seen are parsed
+        context.report(0, 1, "parses", force=True)
+        result["frame"], result["warnings"] = incremental_parser.parse(text)
+        result["new_rows"] = incremental_parser.last_new_rows
+        if result["new_rows"] is None:
+            result["new_rows"] = result["frame"].iloc[0:0]
+        result["parsed_blocks"] = incremental_parser.last_parsed_blocks
+        result["reused_blocks"] = incremental_parser.last_reused_blocks
+        result["block_ordinals"] = incremental_parser.block_ordinals()
+        return result
+
+    total = text.count(ORDER_BLOCK_MARKER)
+    if not total:
+        result["frame"], result["warnings"] = parse_orders(text)
+        return result
+    frames, warnings, done = [], [], 0
+    context.report(0, total, "orders", force=True)
+    for text_slice, blocks in _iter_block_slices(text, SUMMARY_SLICE_BLOCKS):
+        frame, slice_warnings = parse_orders(text_slice)
+        if not frame.empty:
+            frames.append(frame)
+        warnings.extend(slice_warnings)
+        done += blocks
+        context.report(done, total, "orders")
+    result["frame"] = pd.concat(frames, ignore_index=True) if len(frames) > 1 else (frames[0] if frames else pd.DataFrame())
+    result["warnings"] = warnings
+    return result
+
+
+def batch_line_items(queue, job_id):
+    """
+    The LineItemColumns of a finished "Full line items" batch_parse job, rebuilt from
+    its batch with the job's risk templates set. Raises JobError if the job or its
+    parsed table is gone.
+    """
+    job = queue.get(job_id)
+    if job is None or job.kind != "batch_parse" or job.params["mode"] != "line_items":
+        raise JobError("That batch is gone; parse it again.")
+    result = resolve_batch_parse(job.params, queue.result(job_id))
+    line_items = result["line_items"]
+    if result.get("risk") is not None:
+        line_items.set_templates(result["risk"].templates)
+    return line_items
+
+
+@job_handler("bulk_render")
+def run_bulk_render(context, params, payload):
+    """
+    Bulk email rendering of the line items of batch_parse job params["batch_job"]
+    with params["template"] (None for the per-order Template column) into
+    params["export_format"]. Results are {"data": export bytes, "count": emails}.
+    """
+    from dazzle.emails import render_email_batch, write_rendered_emails
+
+    line_items = batch_line_items(context.queue, params["batch_job"])
+    total = line_items.order_count
+    context.report(0, total, "emails", force=True)
+
+    def records_with_progress():
+        for count, record in enumerate(render_email_batch(line_items.iter_orders(), template=params["template"]), 1):
+            context.report(count, total, "emails")
+            yield record
+
+    with tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024) as export_file:
+        count = write_rendered_emails(records_with_progress(), export_file, params["export_format"])
+        export_file.seek(0)
+        return {"data": export_file.read(), "count": count}
+
+
+@job_handler("email_dispatch")
+def run_email_dispatch(context, params, payload):
+    """
+    Renders the line items of batch_parse job params["batch_job"] with
+    params["template"] (None for the per-order Template column) and sends each email
+    over SMTP (DAZZLE_SMTP_* settings). Orders already sent are skipped unless
+    params["resend"] asks to resend those sent with another template. Results are {"counts": {status: emails},
+    "results": [DispatchResult fields, ...]}.
+    """
+    from collections import Counter
+    from contextlib import closing
+    from dataclasses import asdict
+
+    from dazzle.dispatch import EmailDispatcher, SmtpSettings
+    from dazzle.emails import render_email_batch
+
+    line_items = batch_line_items(context.queue, params["batch_job"])
+    total = line_items.order_count
+    context.report(0, total, "emails sent", force=True)
+    counts = Counter()
+    results = []
+    records = render_email_batch(line_items.iter_orders(), template=params["template"])
+    with EmailDispatcher(SmtpSettings.from_env(), resend=params.get("resend", False)) as dispatcher, closing(dispatcher.send(records)) as sent:
+        for count, result in enumerate(sent, 1):
+            counts[result.status] += 1
+            results.append(asdict(result))
+            context.report(count, total, "emails sent") # A cancel closes send(); queued emails stay unsent
+    return {"counts": dict(counts), "results": results}
+
+
+# --- Job Queue ---
+
+class JobQueue:
+    """
+    SQLite-backed job queue with a thread pool. One instance per server process
+    (DAZZLE_JOB_DB, DAZZLE_JOB_DIR and DAZZLE_JOB_WORKERS configure it).
+
+    `services` maps names to zero-argument factories of process-wide objects that
+    handlers use through JobContext.service (the order store, linkage index and risk
+    model); unlike `local`, they are also there for jobs resumed after a restart.
+    """
+
+    def __init__(self, path=None, job_dir=None, max_workers=None, handlers=None, services=None):
+        self.path = path or os.environ.get("DAZZLE_JOB_DB") or DEFAULT_JOB_DB_PATH
+        self.job_dir = job_dir or os.environ.get("DAZZLE_JOB_DIR") or DEFAULT_JOB_DIR
+        self.handlers = JOB_HANDLERS if handlers is None else handlers
+        self.services = services or {}
+        os.makedirs(self.job_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._cancel_events = {}
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        if self.path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode = WAL")
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+        workers = int(max_workers or os.environ.get("DAZZLE_JOB_WORKERS") or DEFAULT_JOB_WORKERS)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dazzle-job")
+        self._prune()
+        self._resume()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._connection.close()
+
+    def _file(self, job_id, suffix):
+        return os.path.join(self.job_dir, f"{job_id}.{suffix}.pickle")
+
+    def artifact_path(self, job_id, name):
+        """Path of a handler-written file kept with a job's result (see JobContext.artifact_path)."""
+        return os.path.abspath(os.path.join(self.job_dir, f"{job_id}.{name}"))
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = :{name}" for name in fields)
+        with self._lock, self._connection:
+            self._connection.execute(f"UPDATE jobs SET {assignments} WHERE id = :id", {**fields, "id": job_id})
+
+    def submit(self, kind, params=None, payload=None, local=None):
+        """
+        Queues a job and returns its id. `payload` (any picklable input) is written to
+        the job directory so the job can be rerun after a restart; `local` objects are
+        passed to the handler as context.local only while this process lives.
+        """
+        import json
+
+        if kind not in self.handlers:
+            raise JobError(f"unknown job kind {kind!r}")
+        job_id = uuid.uuid4().hex
+        with open(self._file(job_id, "input"), "wb") as input_file:
+            pickle.dump(payload, input_file, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO jobs (id, kind, status, params, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(params or {}), now, now),
+            )
+        self._start(job_id, local)
+        return job_id
+
+    def _start(self, job_id, local=None):
+        self._cancel_events[job_id] = threading.Event()
+        self._executor.submit(self._run, job_id, local)
+
+    def _run(self, job_id, local):
+        job = self.get(job_id)
+        if job is None or job.cancel_requested:
+            self._finish(job_id, "cancelled")
+            return
+        self._update(job_id, status="running")
+        context = JobContext(self, job_id, local)
+        try:
+            with open(self._file(job_id, "input"), "rb") as input_file:
+                payload = pickle.load(input_file)
+            result = self.handlers[job.kind](context, job.params, payload)
+            with open(self._file(job_id, "result"), "wb") as result_file:
+                pickle.dump(result, result_file, protocol=pickle.HIGHEST_PROTOCOL)
+        except JobCancelled:
+            self._finish(job_id, "cancelled")
+        except Exception as exc: # Any handler failure is reported on the job, not raised into the pool
+            self._finish(job_id, "failed", error=str(exc) or type(exc).__name__)
+        else:
+            self._finish(job_id, "done")
+
+    def _finish(self, job_id, status, error=None):
+        self._update(job_id, status=status, error=error, finished_at=time.time())
+        self._cancel_events.pop(job_id, None)
+        try:
+            os.remove(self._file(job_id, "input"))
+        except OSError:
+            pass
+
+    def _resume(self):
+        """
+        Requeues the parse jobs (RESUMABLE_JOB_KINDS) a previous process left queued or
+        running. Other kinds fail as interrupted, so a restart made to stop a mailing
+        does stop it; cancelled ones are closed.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, kind, cancel_requested FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        for job_id, kind, cancel_requested in rows:
+            if cancel_requested:
+                self._finish(job_id, "cancelled")
+            elif kind not in RESUMABLE_JOB_KINDS:
+                self._finish(job_id, "failed", error=INTERRUPTED_ERROR)
+            elif not os.path.exists(self._file(job_id, "input")):
+                self._finish(job_id, "failed", error="input lost")
+            else:
+                self._update(job_id, status="queued", progress_done=0)
+                self._start(job_id)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        with self._lock, self._connection:
+            old_ids = [row[0] for row in self._connection.execute("SELECT id FROM jobs WHERE finished_at < ?", (cutoff,))]
+            self._connection.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+        for job_id in old_ids:
+            for path in glob.glob(os.path.join(self.job_dir, f"{job_id}.*")): # Input, result and artifacts
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get(self, job_id):
+        """The Job with this id, or None."""
+        import json
+
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        fields = dict(row)
+        fields["params"] = json.loads(fields["params"])
+        fields["cancel_requested"] = bool(fields["cancel_requested"])
+        return Job(**fields)
+
+    def cancel(self, job_id):
+        """Asks a queued or running job to stop; returns False if it had already finished."""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        self._update(job_id, cancel_requested=1)
+        event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+        return True
+
+    def result(self, job_id):
+        """Unpickles a finished job's result (raises JobError unless the job is done)."""
+        job = self.get(job_id)
+        if job is None:
+            raise JobError(f"unknown job {job_id!r}")
+        if job.status != "done":
+            raise JobError(f"job {job_id} is {job.status}")
+        with open(self._file(job_id, "result"), "rb") as result_file:
+            return pickle.load(result_file)
@@ -0,0 +1,431 @@
+"""
+Duplicate-order and repeat-customer linkage.
+
+Contacts are normalized first: emails are lowercased (dots and +tags dropped for
+Gmail), phones become E.164 ("+14105551234"), and names are accent-folded,
+punctuation-free and token-sorted so "García, Aaliyah" equals "aaliyah garcia".
+
+A LinkageIndex holds the order history (built once from the OrderStore):
+
+- hash indexes from normalized order number, email, phone and name to a customer id,
+  with customers merged through a union-find whenever an email or phone ties two
+  of them together;
+- a MinHash/LSH index over the character trigrams of every distinct name, so names
+  that are spelled slightly differently are found through a few band lookups
+  instead of comparing every pair.
+
+link_batch() flags a parsed batch against the history and against itself without
+changing the index; add_records() folds saved orders in afterwards, and is
+idempotent, so re-parsing the same paste does not count its orders twice. Orders
+are saved with the id of the Batch Orders batch that parsed them, and link_batch()
+leaves that batch's own earlier saves out of the history, so re-parsing a paste
+(or the same paste grown) does not find its orders there either.
+"""
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from array import array
+from functools import lru_cache
+
+from dazzle.store import _clean, normalize_email, normalize_order_number
+
+MINHASH_PERMUTATIONS = 100
+LSH_BANDS = 20 # 20 bands x 5 rows: ~80% of name pairs at Jaccard 0.6 share a band, ~2% at 0.25
+LSH_SIGNATURE_CHUNK = 4096 # Names MinHashed per numpy pass (bounds the shingles x permutations matrix)
+DEFAULT_NAME_SIMILARITY = 0.6 # Trigram Jaccard needed to report a similar name
+LSH_PENDING_MERGE = 4096 # Names added since the last sort before the band tables are rebuilt
+DEFAULT_COUNTRY_CODE = "1" # Numbers without a country code are NANP (US/Canada)
+DEFAULT_LINKAGE_HISTORY_DAYS = 183 # How much order history the index covers (DAZZLE_LINKAGE_DAYS)
+
+NON_DIGIT_RE = re.compile(r"\D")
+NON_NAME_CHARS_RE = re.compile(r"[^\w\s]|_")
+WHITESPACE_RE = re.compile(r"\s+")
+
+LINKAGE_COLUMNS = ["Duplicate Order", "Seen Before", "Customer Orders", "Similar Customer"]
+
+
+# --- Normalization ---
+
+def normalize_phone(phone_number, default_country_code=DEFAULT_COUNTRY_CODE):
+    """
+    E.164 form of a phone number ("+14105551234"), or None. Ten-digit numbers get the
+    default country code; "+"/"00"-prefixed numbers keep theirs.
+    """
+    phone_number = _clean(phone_number)
+    if phone_number is None:
+        return None
+    international = phone_number.lstrip().startswith(("+", "00"))
+    digits = NON_DIGIT_RE.sub("", phone_number)
+    if international:
+        digits = digits[2:] if phone_number.lstrip().startswith("00") else digits
+    elif len(digits) == 10:
+        digits = default_country_code + digits
+    elif not (len(digits) == 11 and digits.startswith(default_country_code)):
+        return None
+    if not 8 <= len(digits) <= 15:
+        return None
+    return "+" + digits
+
+
+@lru_cache(maxsize=65536)
+def normalize_name(customer_name):
+    """Accent-folded, casefolded, punctuation-free name with its tokens sorted; None for placeholders."""
+    customer_name = _clean(customer_name)
+    if customer_name is None:
+        return None
+    folded = customer_name
+    if not folded.isascii():
+        folded = unicodedata.normalize("NFKD", folded)
+        folded = "".join(char for char in folded if not unicodedata.combining(char))
+    folded = folded.casefold()
+    tokens = NON_NAME_CHARS_RE.sub(" ", folded).split()
+    return " ".join(sorted(tokens)) or None
+
+
+def name_trigrams(normalized_name):
+    """Character trigrams of a normalized name (padded, so short names still have some)."""
+    padded = f"  {normalized_name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigram_similarity(left, right):
+    """Jaccard similarity of two normalized names' (or their precomputed) trigram sets."""
+    left = left if isinstance(left, set) else name_trigrams(left)
+    right = right if isinstance(right, set) else name_trigrams(right)
+    return len(left & right) / len(left | right)
+
+
+# --- MinHash / LSH ---
+
+class NameLSH:
+    """
+    MinHash signatures of name trigrams, bucketed by LSH band. Only the band hashes
+    are kept (sorted uint64 arrays per band, searched with searchsorted), about
+    8 bytes x LSH_BANDS per distinct name. Candidates are verified with the exact
+    trigram Jaccard, so LSH only decides which pairs get compared.
+    """
+
+    def __init__(self, permutations=MINHASH_PERMUTATIONS, bands=LSH_BANDS, seed=1):
+        import numpy as np
+
+        if permutations % bands:
+            raise ValueError("permutations must be a multiple of bands")
+        rng = np.random.default_rng(seed)
+        self.bands = bands
+        self.rows = permutations // bands
+        self._multipliers = rng.integers(1, 1 << 32, size=permutations, dtype=np.uint64) | np.uint64(1)
+        self._increments = rng.integers(0, 1 << 32, size=permutations, dtype=np.uint64)
+        self._band_mix = rng.integers(1, 1 << 63, size=self.rows, dtype=np.uint64) | np.uint64(1)
+        self.names = [] # name id -> normalized name
+        self._sorted_keys = np.empty((bands, 0), dtype=np.uint64)
+        self._sorted_ids = np.empty((bands, 0), dtype=np.int64)
+        self._pending_keys = []
+        self._pending_ids = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def band_keys(self, normalized_names):
+        """(len(names), bands) uint64 band hashes of the names' MinHash signatures."""
+        import numpy as np
+
+        if len(normalized_names) > LSH_SIGNATURE_CHUNK:
+            return np.concatenate([
+                self.band_keys(normalized_names[start:start + LSH_SIGNATURE_CHUNK])
+                for start in range(0, len(normalized_names), LSH_SIGNATURE_CHUNK)
+            ])
+        if not normalized_names:
+            return np.empty((0, self.bands), dtype=np.uint64)
+        shingle_lists = [sorted(name_trigrams(name)) for name in normalized_names]
+        lengths = np.fromiter((len(shingles) for shingles in shingle_lists), dtype=np.int64, count=len(shingle_lists))
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingles in shingle_lists for shingle in shingles),
+            dtype=np.uint64, count=int(lengths.sum()),
+        )
+        with np.errstate(over="ignore"):
+            permuted = (hashes[:, None] * self._multipliers + self._increments) & np.uint64(0xFFFFFFFF)
+            starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            signatures = np.minimum.reduceat(permuted, starts, axis=0)
+            bands = signatures.reshape(len(normalized_names), self.bands, self.rows)
+            return (bands * self._band_mix).sum(axis=2, dtype=np.uint64)
+
+    def add(self, normalized_names):
+        """Adds names (assumed distinct and new); returns their ids."""
+        first_id = len(self.names)
+        self.names.extend(normalized_names)
+        if normalized_names:
+            self._pending_keys.append(self.band_keys(normalized_names))
+            self._pending_ids.append(range(first_id, len(self.names)))
+        if sum(len(ids) for ids in self._pending_ids) >= LSH_PENDING_MERGE:
+            self._merge_pending()
+        return range(first_id, len(self.names))
+
+    def _merge_pending(self):
+        import numpy as np
+
+        if not self._pending_keys:
+            return
+        keys = np.concatenate([self._sorted_keys.T] + self._pending_keys).T
+        ids = np.concatenate([self._sorted_ids[0]] + [np.asarray(ids, dtype=np.int64) for ids in self._pending_ids]) \
+            if self._sorted_ids.size else np.concatenate([np.asarray(ids, dtype=np.int64) for ids in self._pending_ids])
+        order = np.argsort(keys, axis=1, kind="stable")
+        self._sorted_keys = np.take_along_axis(keys, order, axis=1)
+        self._sorted_ids = ids[order]
+        self._pending_keys, self._pending_ids = [], []
+
+    def candidates(self, query_keys):
+        """Name ids sharing at least one band with each query row of band_keys() output."""
+        import numpy as np
+
+        self._merge_pending()
+        found = [set() for _ in range(len(query_keys))]
+        for band in range(self.bands):
+            keys = self._sorted_keys[band]
+            lows = np.searchsorted(keys, query_keys[:, band], side="left")
+            highs = np.searchsorted(keys, query_keys[:, band], side="right")
+            for row in np.nonzero(highs > lows)[0]:
+                found[row].update(self._sorted_ids[band, lows[row]:highs[row]].tolist())
+        return found
+
+
+# --- Linkage Index ---
+
+class LinkageIndex:
+    """
+    Order-number, contact and name indexes over the order history, plus NameLSH for
+    fuzzy names. Thread-safe; shared by every session in the process.
+    """
+
+    def __init__(self, name_similarity=DEFAULT_NAME_SIMILARITY):
+        self.name_similarity = name_similarity
+        self._lock = threading.Lock()
+        self._records = {} # record key -> (customer id, order number, batch id)
+        self._batch_records = {} # batch id -> record keys last saved by that batch
+        self.order_numbers = set()
+        self.emails = {} # normalized email -> customer id
+        self.phones = {} # E.164 phone -> customer id
+        self.names = {} # normalized name -> customer id (links only name-only orders)
+        self._parent = array("i") # union-find over customer ids
+        self._order_counts = array("i") # orders per root customer
+        self.lsh = NameLSH()
+        self.display_names = {} # normalized name -> first spelling seen, in NameLSH id order
+
+    @classmethod
+    def from_store(cls, store, history_days=None, **options):
+        """Builds the index from the OrderStore orders updated in the last `history_days` days."""
+        history_days = float(history_days or os.environ.get("DAZZLE_LINKAGE_DAYS") or DEFAULT_LINKAGE_HISTORY_DAYS)
+        index = cls(**options)
+        index.add_records(store.iter_linkage_records(updated_since=time.time() - history_days * 86400))
+        return index
+
+    def __len__(self):
+        return len(self._records)
+
+    def _find(self, customer):
+        parent = self._parent
+        while parent[customer] != customer:
+            parent[customer] = parent[parent[customer]]
+            customer = parent[customer]
+        return customer
+
+    def _union(self, left, right):
+        left, right = self._find(left), self._find(right)
+        if left != right:
+            if self._order_counts[left] < self._order_counts[right]:
+                left, right = right, left
+            self._parent[right] = left
+            self._order_counts[left] += self._order_counts[right]
+        return left
+
+    def _new_customer(self):
+        customer = len(self._parent)
+        self._parent.append(customer)
+        self._order_counts.append(0)
+        return customer
+
+    def _lookup(self, email, phone, name):
+        """Root customer ids matching a normalized contact (exact keys only)."""
+        customers = {self.emails.get(email), self.phones.get(phone)} if (email or phone) else {self.names.get(name)}
+        customers.discard(None)
+        return {self._find(customer) for customer in customers}
+
+    def add_records(self, records):
+        """
+        Folds (record_key, order_number, customer_name, email_address, phone_number,
+        batch_id) records into the index (batch_id may be left out). Records whose key
+        is already indexed only have their batch id updated.
+        """
+        new_names = []
+        with self._lock:
+            for record_key, order_number, customer_name, email_address, phone_number, *batch_id in records:
+                batch_id = batch_id[0] if batch_id else None
+                record = self._records.get(record_key)
+                if record is not None:
+                    if batch_id is not None and batch_id != record[2]:
+                        self._batch_records.get(record[2], set()).discard(record_key)
+                        self._batch_records.setdefault(batch_id, set()).add(record_key)
+                        self._records[record_key] = record[:2] + (batch_id,)
+                    continue
+                number = normalize_order_number(order_number)
+                if number is not None:
+                    self.order_numbers.add(number)
+                email, phone, name = normalize_email(email_address), normalize_phone(phone_number), normalize_name(customer_name)
+                matches = self._lookup(email, phone, name)
+                customer = matches.pop() if matches else self._new_customer()
+                for other in matches:
+                    customer = self._union(customer, other)
+                self._order_counts[self._find(customer)] += 1
+                self._records[record_key] = (customer, number, batch_id)
+                if batch_id is not None:
+                    self._batch_records.setdefault(batch_id, set()).add(record_key)
+                for key, table in ((email, self.emails), (phone, self.phones)):
+                    if key is not None:
+                        table.setdefault(key, customer)
+                if name is not None:
+                    if not (email or phone):
+                        self.names.setdefault(name, customer)
+                    if name not in self.display_names:
+                        self.display_names[name] = _clean(customer_name)
+                        new_names.append(name)
+            self.lsh.add(new_names)
+
+    def similar_names(self, normalized_names):
+        """For each name, the most similar *different* indexed name and its similarity (or (None, 0.0))."""
+        with self._lock:
+            if not normalized_names or not len(self.lsh):
+                return [(None, 0.0)] * len(normalized_names)
+            candidates = self.lsh.candidates(self.lsh.band_keys(normalized_names))
+            indexed = self.lsh.names
+        return [_best_similar(name, (indexed[name_id] for name_id in ids), self.name_similarity)
+                for name, ids in zip(normalized_names, candidates)]
+
+    def link_batch(self, order_numbers, customer_names, emails=None, phones=None, batch_id=None):
+        """
+        Flags one parsed batch (parallel lists; emails/phones may be None for summary
+        rows) against the history and within itself, without modifying the index.
+        Orders saved by `batch_id` (earlier parses of this batch) are not history.
+        Returns LINKAGE_COLUMNS as lists, one entry per order:
+
+        - Duplicate Order: the order number already appeared earlier in this batch;
+        - Seen Before: the order number is in the order history, saved by another batch;
+        - Customer Orders: orders by the same customer (email/phone, or exact name when
+          the batch has no contacts) in the history plus this batch, this one included;
+        - Similar Customer: the closest differently-spelled name in the history or batch.
+        """
+        size = len(order_numbers)
+        emails = [normalize_email(value) for value in emails] if emails is not None else [None] * size
+        phones = [normalize_phone(value) for value in phones] if phones is not None else [None] * size
+        names = [normalize_name(value) for value in customer_names]
+
+        batch = LinkageIndex(self.name_similarity)
+        numbers = [normalize_order_number(order_number) for order_number in order_numbers]
+        seen_numbers = set()
+        duplicate, seen_before, history_customers = [], [], []
+        with self._lock:
+            # This batch's own earlier saves: their numbers are not "seen before", nor do they count as customer history
+            own_numbers, own_counts = set(), {}
+            for record_key in self._batch_records.get(batch_id, ()) if batch_id is not None else ():
+                customer, number, _ = self._records[record_key]
+                own_numbers.add(number)
+                customer = self._find(customer)
+                own_counts[customer] = own_counts.get(customer, 0) + 1
+            for position, number in enumerate(numbers):
+                duplicate.append(number is not None and number in seen_numbers)
+                seen_before.append(number is not None and number in self.order_numbers and number not in own_numbers)
+                if number is not None:
+                    seen_numbers.add(number)
+                history_customers.append(self._lookup(emails[position], phones[position], names[position]))
+            history_counts = {
+                customer: self._order_counts[customer] - own_counts.get(customer, 0)
+                for found in history_customers for customer in found
+            }
+
+        # Within the batch: a throwaway index over the batch's own records (a repeated order number counts once)
+        batch.add_records(
+            (f"order:{numbers[position]}" if numbers[position] is not None else f"batch:{position}",
+             None, customer_names[position], emails[position], phones[position])
+            for position in range(size)
+        )
+        batch_customers = [next(iter(batch._lookup(emails[position], phones[position], names[position])), None) for position in range(size)]
+        # History customers reached by any order of a batch customer (so each is counted once), and
+        # the batch orders already in the history (so they are not counted twice)
+        reached, already_stored = {}, {}
+        for position, (found, batch_customer) in enumerate(zip(history_customers, batch_customers)):
+            if batch_customer is not None:
+                reached.setdefault(batch_customer, set()).update(found)
+                if seen_before[position] and found and not duplicate[position]:
+                    already_stored[batch_customer] = already_stored.get(batch_customer, 0) + 1
+        customer_orders = []
+        for batch_customer in batch_customers:
+            if batch_customer is None:
+                customer_orders.append(1)
+                continue
+            history_orders = sum(history_counts[customer] for customer in reached[batch_customer])
+            customer_orders.append(max(1, batch._order_counts[batch_customer] + history_orders - already_stored.get(batch_customer, 0)))
+
+        distinct_names = [name for name in dict.fromkeys(names) if name is not None]
+        history_similar = dict(zip(distinct_names, self.similar_names(distinct_names)))
+        batch_similar = dict(zip(distinct_names, batch.similar_names(distinct_names)))
+        display_names = {**batch.display_names, **self.display_names}
+        similar_customer = []
+        for name in names:
+            if name is None:
+                similar_customer.append("")
+                continue
+            best = max(history_similar[name], batch_similar[name], key=lambda match: match[1])
+            similar_customer.append(display_names[best[0]] if best[0] else "")
+
+        return {
+            "Duplicate Order": duplicate,
+            "Seen Before": seen_before,
+            "Customer Orders": customer_orders,
+            "Similar Customer": similar_customer,
+        }
+
+
+def _best_similar(name, candidate_names, threshold):
+    best, best_similarity = None, 0.0
+    trigrams = name_trigrams(name)
+    for candidate in candidate_names:
+        if candidate == name:
+            continue
+        similarity = trigram_similarity(trigrams, candidate)
+        if similarity >= threshold and similarity > best_similarity:
+            best, best_similarity = candidate, similarity
+    return best, best_similarity
+
+
+def link_line_items(index, line_items, batch_id=None):
+    """link_batch over a LineItemColumns batch (one entry per order)."""
+    text = line_items.order_text
+    return index.link_batch(
+        text["Order Number"].to_list(), text["Customer Name"].to_list(), text["Email"].to_list(), text["Phone"].to_list(),
+        batch_id=batch_id,
+    )
+
+
+def link_summary_rows(index, orders_frame, batch_id=None):
+    """link_batch over parse_orders summary rows, which carry names but no contacts."""
+    return index.link_batch(orders_frame["Order Number"].tolist(), orders_frame["Customer Name"].tolist(), batch_id=batch_id)
+
+
+def linkage_columns(links, row_orders=None):
+    """
+    LINKAGE_COLUMNS as arrays for display. `row_orders` (an int array of order
+    positions) repeats each order's values on its line-item rows.
+    """
+    import numpy as np
+
+    columns = {
+        "Duplicate Order": np.asarray(links["Duplicate Order"], dtype=bool),
+        "Seen Before": np.asarray(links["Seen Before"], dtype=bool),
+        "Customer Orders": np.asarray(links["Customer Orders"], dtype=np.int64),
+        "Similar Customer": np.asarray(links["Similar Customer"], dtype=object),
+    }
+    if row_orders is not None:
+        row_orders = np.asarray(row_orders)
+        columns = {name: values.take(row_orders) for name, values in columns.items()}
+    return columns
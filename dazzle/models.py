@@ -0,0 +1,453 @@
+"""
+Compact in-memory representations of parsed orders.
+
+parse_shopify_export returns plain dicts, which is what the CLI, the service and
+the templates exchange. Results that are *held* (the shared parse cache, session
+state, a month of batch line items) use the types below instead:
+
+- OrderItem / ParsedOrder: __slots__ dataclasses with the parser's field names.
+  They support dict-style reads, so code written against the dict shape
+  (`parsed["items"]`, `item.get("size")`) keeps working. Sizes and style codes
+  are interned, so repeated values share one string.
+- LineItemColumns: an array-backed columnar store for batch line items. Product,
+  style code, size and missing-info flags are dictionary-encoded (int32 codes into
+  a list of distinct values), per-order text is packed UTF-8, and the integer
+  columns live in array.array buffers, so a row costs a few dozen bytes instead of
+  a dict of Python strings. It converts to a DataFrame or a pyarrow Table (with
+  dictionary arrays), and writes Parquet or Feather.
+"""
+import sys
+from array import array
+from dataclasses import dataclass, fields
+
+from dazzle.exports import EXPORT_ROW_GROUP_ROWS, write_columnar
+
+LINE_ITEM_COLUMNS = [
+    "Batch Order", "Order Number", "Customer Name", "Email", "Phone",
+    "Product", "Style Code", "Size", "Quantity", "Missing Info",
+]
+# Line-item column -> parse_shopify_export key, for the text stored once per order
+ORDER_TEXT_COLUMNS = {
+    "Order Number": "order_number",
+    "Customer Name": "customer_name",
+    "Email": "email_address",
+    "Phone": "phone_number",
+}
+ITEM_TEXT_COLUMNS = ("Product", "Style Code", "Size")
+ORDER_AMOUNT_COLUMN = "Amount ($)" # Optional to_arrow column carrying each order's total, so from_arrow can restore it
+NULL_CODE = -1 # Dictionary code / quantity stored on the row of an order without items
+
+
+# --- Single Orders ---
+
+class _FieldMapping:
+    """
+    Dict-style read access to a slots dataclass, keyed by field name. Not a full
+    Mapping: ParsedOrder has a field called "items", so there is no items() method.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self.__dataclass_fields__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__dataclass_fields__
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__dataclass_fields__ else default
+
+    def keys(self):
+        return self.__dataclass_fields__.keys()
+
+    def __iter__(self):
+        return iter(self.__dataclass_fields__)
+
+    def __len__(self):
+        return len(self.__dataclass_fields__)
+
+    def to_dict(self):
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+
+@dataclass(slots=True, frozen=True)
+class OrderItem(_FieldMapping):
+    product_name: str
+    style_code: str
+    size: str
+    quantity: int
+
+    @classmethod
+    def from_dict(cls, item):
+        return cls(item["product_name"], sys.intern(item["style_code"]), sys.intern(item["size"]), item["quantity"])
+
+
+@dataclass(slots=True, frozen=True)
+class ParsedOrder(_FieldMapping):
+    customer_name: str
+    email_address: str
+    phone_number: str
+    order_number: str
+    items: tuple
+    missing_info: tuple
+
+    @classmethod
+    def from_dict(cls, parsed_data):
+        """Packs a parse_shopify_export result."""
+        return cls(
+            parsed_data["customer_name"],
+            parsed_data["email_address"],
+            parsed_data["phone_number"],
+            parsed_data["order_number"],
+            tuple(OrderItem.from_dict(item) for item in parsed_data["items"]),
+            tuple(sys.intern(flag) for flag in parsed_data["missing_info"]),
+        )
+
+    def to_dict(self):
+        """The parse_shopify_export dict shape (for JSON and anything that mutates the result)."""
+        return {
+            "customer_name": self.customer_name,
+            "email_address": self.email_address,
+            "phone_number": self.phone_number,
+            "order_number": self.order_number,
+            "items": [item.to_dict() for item in self.items],
+            "missing_info": list(self.missing_info),
+        }
+
+
+# --- Batch Line Items ---
+
+class DictionaryColumn:
+    """A text column stored as int32 codes into a list of distinct values (NULL_CODE is a null)."""
+
+    __slots__ = ("values", "codes", "_index")
+
+    def __init__(self):
+        self.values = []
+        self.codes = array("i")
+        self._index = {} # value -> code
+
+    def __len__(self):
+        return len(self.codes)
+
+    def encode(self, value):
+        if value is None:
+            return NULL_CODE
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def append(self, value):
+        self.codes.append(self.encode(value))
+
+    def extend(self, other):
+        """Appends another column's rows, re-coding them into this column's dictionary."""
+        remap = [self.encode(value) for value in other.values]
+        self.codes.extend([NULL_CODE if code == NULL_CODE else remap[code] for code in other.codes])
+
+    def nbytes(self):
+        return self.codes.itemsize * len(self.codes) + sum(sys.getsizeof(value) for value in self.values)
+
+    def to_categorical(self):
+        import numpy as np
+        import pandas as pd
+
+        return pd.Categorical.from_codes(np.frombuffer(self.codes, dtype=np.int32).copy(), categories=self.values)
+
+    @classmethod
+    def from_arrow(cls, dictionary_array):
+        """Rebuilds a column from a pyarrow DictionaryArray (e.g. one written by to_arrow)."""
+        import numpy as np
+
+        column = cls()
+        column.values = dictionary_array.dictionary.to_pylist()
+        column._index = {value: code for code, value in enumerate(column.values)}
+        codes = dictionary_array.indices.fill_null(NULL_CODE).to_numpy(zero_copy_only=False)
+        column.codes.frombytes(codes.astype(np.int32, copy=False).tobytes())
+        return column
+
+    def to_arrow(self):
+        import numpy as np
+        import pyarrow as pa
+
+        codes = np.frombuffer(self.codes, dtype=np.int32).copy() # Views would pin the array's buffer
+        indices = pa.array(codes, mask=codes == NULL_CODE, type=pa.int32())
+        return pa.DictionaryArray.from_arrays(indices, pa.array(self.values, type=pa.string()))
+
+
+class StringColumn:
+    """
+    A high-cardinality text column packed as UTF-8 bytes plus int64 end offsets
+    (Arrow's large_string layout), so a value costs its length plus 8 bytes.
+    """
+
+    __slots__ = ("data", "offsets")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("q", [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].decode("utf-8")
+
+    def append(self, value):
+        self.data += value.encode("utf-8", "replace") # Lone surrogates cannot round-trip through UTF-8
+        self.offsets.append(len(self.data))
+
+    def extend(self, other):
+        base = len(self.data)
+        self.data += other.data
+        self.offsets.extend([base + offset for offset in other.offsets[1:]])
+
+    def nbytes(self):
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+    def to_list(self):
+        data, offsets = bytes(self.data), self.offsets
+        return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+    def to_arrow(self):
+        import pyarrow as pa
+
+        return pa.LargeStringArray.from_buffers(len(self), pa.py_buffer(bytes(self.offsets)), pa.py_buffer(bytes(self.data)))
+
+
+class LineItemColumns:
+    """
+    Batch line items in columnar form, appended per parsed order (never as per-row
+    dicts) and exported with LINE_ITEM_COLUMNS, one row per item.
+
+    Order-level fields are stored once per order: order number, customer, email and
+    phone as packed StringColumns, missing-info flags dictionary-encoded. Item rows
+    hold an index into the orders plus dictionary-encoded product, style code and
+    size and an int64 quantity (NULL_CODE on the single row of an order without items).
+    """
+
+    __slots__ = ("batch_orders", "amounts", "order_text", "missing_info", "row_orders", "item_text", "quantities", "templates")
+
+    def __init__(self):
+        self.batch_orders = array("i")
+        self.amounts = array("d") # Order total from the page's Total line (NaN if unknown); used for risk scoring
+        self.order_text = {name: StringColumn() for name in ORDER_TEXT_COLUMNS}
+        self.missing_info = DictionaryColumn()
+        self.row_orders = array("i") # Row -> position of its order in the order-level columns
+        self.item_text = {name: DictionaryColumn() for name in ITEM_TEXT_COLUMNS}
+        self.quantities = array("q")
+        self.templates = None # Optional per-order DictionaryColumn, exported as a "Template" column
+
+    def __len__(self):
+        return len(self.row_orders)
+
+    @property
+    def order_count(self):
+        return len(self.batch_orders)
+
+    @property
+    def columns(self):
+        """Exported column names, like DataFrame.columns."""
+        return LINE_ITEM_COLUMNS + ["Template"] if self.templates is not None else list(LINE_ITEM_COLUMNS)
+
+    def set_templates(self, templates):
+        """Attaches one email template key (or None) per order, in order."""
+        column = DictionaryColumn()
+        for template in templates:
+            column.append(template)
+        if len(column) != self.order_count:
+            raise ValueError(f"expected {self.order_count} templates, got {len(column)}")
+        self.templates = column
+
+    def append_order(self, parsed_data, batch_order, amount=None):
+        """
+        Appends one parse_shopify_export result (dict or ParsedOrder). `batch_order`
+        is the order's 1-based position in the export, as in order_line_item_rows.
+        """
+        position = len(self.batch_orders)
+        self.batch_orders.append(batch_order)
+        self.amounts.append(float("nan") if amount is None else amount)
+        for name, key in ORDER_TEXT_COLUMNS.items():
+            self.order_text[name].append(parsed_data[key])
+        self.missing_info.append(", ".join(parsed_data["missing_info"]))
+
+        product, style_code, size = self.item_text["Product"], self.item_text["Style Code"], self.item_text["Size"]
+        items = parsed_data["items"]
+        if not items:
+            self.row_orders.append(position)
+            for column in (product, style_code, size):
+                column.codes.append(NULL_CODE)
+            self.quantities.append(NULL_CODE)
+            return
+        for item in items:
+            self.row_orders.append(position)
+            product.append(item["product_name"])
+            style_code.append(item["style_code"])
+            size.append(item["size"])
+            self.quantities.append(item["quantity"])
+
+    def extend(self, other):
+        """Appends the rows of another LineItemColumns (e.g. one returned by a worker process)."""
+        base = len(self.batch_orders)
+        self.batch_orders.extend(other.batch_orders)
+        self.amounts.extend(other.amounts)
+        for name, column in self.order_text.items():
+            column.extend(other.order_text[name])
+        self.missing_info.extend(other.missing_info)
+        self.row_orders.extend([base + position for position in other.row_orders])
+        for name, column in self.item_text.items():
+            column.extend(other.item_text[name])
+        self.quantities.extend(other.quantities)
+        self.templates = None # Templates describe the orders they were set for
+
+    def nbytes(self):
+        """Approximate memory held by the columns, including the distinct dictionary values."""
+        arrays = (self.batch_orders, self.amounts, self.row_orders, self.quantities)
+        return (
+            sum(values.itemsize * len(values) for values in arrays)
+            + sum(column.nbytes() for column in self.order_text.values())
+            + self.missing_info.nbytes()
+            + sum(column.nbytes() for column in self.item_text.values())
+            + (self.templates.nbytes() if self.templates is not None else 0)
+        )
+
+    def iter_orders(self):
+        """
+        Yields the orders back as parse_shopify_export-shaped dicts, one at a time,
+        like iter_parsed_orders_from_line_items does for a line-item DataFrame
+        (including a "template" key when templates are set).
+        """
+        order_text = [(key, self.order_text[name]) for name, key in ORDER_TEXT_COLUMNS.items()]
+        products, style_codes, sizes = (self.item_text[name] for name in ITEM_TEXT_COLUMNS)
+        missing_values = self.missing_info.values
+        row = 0
+        row_count = len(self.row_orders)
+        for position, missing_code in enumerate(self.missing_info.codes):
+            parsed_data = {key: column[position] for key, column in order_text}
+            parsed_data["items"] = []
+            parsed_data["missing_info"] = [flag for flag in missing_values[missing_code].split(", ") if flag]
+            if self.templates is not None and self.templates.codes[position] != NULL_CODE:
+                parsed_data["template"] = self.templates.values[self.templates.codes[position]]
+            while row < row_count and self.row_orders[row] == position:
+                product_code = products.codes[row]
+                if product_code != NULL_CODE:
+                    parsed_data["items"].append({
+                        "product_name": products.values[product_code],
+                        "style_code": style_codes.values[style_codes.codes[row]],
+                        "size": sizes.values[sizes.codes[row]],
+                        "quantity": self.quantities[row],
+                    })
+                row += 1
+            yield parsed_data
+
+    def _row_order_index(self):
+        import numpy as np
+
+        return np.frombuffer(self.row_orders, dtype=np.int32).copy() # Views would pin the array's buffer
+
+    def to_pandas(self):
+        """
+        DataFrame with LINE_ITEM_COLUMNS. Low-cardinality text columns are categoricals,
+        Quantity is nullable Int64, and the per-order text is repeated for each item row.
+        """
+        import numpy as np
+        import pandas as pd
+
+        rows = self._row_order_index()
+        quantities = np.frombuffer(self.quantities, dtype=np.int64)
+        data = {
+            "Batch Order": np.frombuffer(self.batch_orders, dtype=np.int32)[rows],
+            "Missing Info": pd.Categorical.from_codes(
+                np.frombuffer(self.missing_info.codes, dtype=np.int32)[rows], categories=self.missing_info.values
+            ),
+            "Quantity": pd.arrays.IntegerArray(quantities.copy(), quantities == NULL_CODE),
+        }
+        for name, column in self.order_text.items():
+            data[name] = np.array(column.to_list(), dtype=object)[rows]
+        data.update((name, column.to_categorical()) for name, column in self.item_text.items())
+        if self.templates is not None:
+            data["Template"] = pd.Categorical.from_codes(
+                np.frombuffer(self.templates.codes, dtype=np.int32)[rows], categories=self.templates.values
+            )
+        return pd.DataFrame({name: data[name] for name in self.columns})
+
+    def to_arrow(self, include_amounts=False):
+        """
+        pyarrow Table with LINE_ITEM_COLUMNS; low-cardinality text columns are dictionary
+        arrays. `include_amounts` appends ORDER_AMOUNT_COLUMN (the order total, per row).
+        """
+        import numpy as np
+        import pyarrow as pa
+
+        row_index = self._row_order_index()
+        rows = pa.array(row_index)
+        quantities = np.frombuffer(self.quantities, dtype=np.int64)
+        missing_codes = np.frombuffer(self.missing_info.codes, dtype=np.int32)[row_index]
+        arrays = {
+            "Batch Order": pa.array(np.frombuffer(self.batch_orders, dtype=np.int32)).take(rows),
+            "Missing Info": pa.DictionaryArray.from_arrays(
+                pa.array(missing_codes, type=pa.int32()), pa.array(self.missing_info.values, type=pa.string())
+            ),
+            "Quantity": pa.array(quantities.copy(), mask=quantities == NULL_CODE),
+        }
+        for name, column in self.order_text.items():
+            arrays[name] = column.to_arrow().take(rows)
+        arrays.update((name, column.to_arrow()) for name, column in self.item_text.items())
+        if self.templates is not None:
+            arrays["Template"] = self.templates.to_arrow().take(rows)
+        names = self.columns
+        if include_amounts:
+            arrays[ORDER_AMOUNT_COLUMN] = pa.array(np.frombuffer(self.amounts, dtype=np.float64)).take(rows)
+            names.append(ORDER_AMOUNT_COLUMN)
+        return pa.table([arrays[name] for name in names], names=names)
+
+    @classmethod
+    def from_arrow(cls, table):
+        """
+        Rebuilds the columns from a to_arrow() table, where an order's item rows are
+        consecutive and share its Batch Order. Amounts are restored when the table has
+        ORDER_AMOUNT_COLUMN; templates are not.
+        """
+        import numpy as np
+
+        line_items = cls()
+        if not table.num_rows:
+            return line_items
+        table = table.combine_chunks()
+        chunks = {name: table.column(name).chunk(0) for name in table.column_names}
+        batch_orders = chunks["Batch Order"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, batch_orders[1:] != batch_orders[:-1]]) # First row of each order
+        row_orders = np.repeat(np.arange(len(starts), dtype=np.int32), np.diff(np.r_[starts, len(batch_orders)]))
+
+        line_items.batch_orders.frombytes(batch_orders[starts].astype(np.int32).tobytes())
+        if ORDER_AMOUNT_COLUMN in chunks:
+            amounts = chunks[ORDER_AMOUNT_COLUMN].to_numpy(zero_copy_only=False)[starts]
+        else:
+            amounts = np.full(len(starts), np.nan)
+        line_items.amounts.frombytes(amounts.astype(np.float64).tobytes())
+        for name, column in line_items.order_text.items():
+            for value in chunks[name].take(starts).to_pylist():
+                column.append(value)
+        line_items.missing_info = DictionaryColumn.from_arrow(chunks["Missing Info"].take(starts))
+        line_items.row_orders.frombytes(row_orders.tobytes())
+        line_items.item_text = {name: DictionaryColumn.from_arrow(chunks[name]) for name in ITEM_TEXT_COLUMNS}
+        quantities = chunks["Quantity"].fill_null(NULL_CODE).to_numpy()
+        line_items.quantities.frombytes(quantities.astype(np.int64).tobytes())
+        return line_items
+
+    def write_columnar(self, where, export_format, rows_per_group=EXPORT_ROW_GROUP_ROWS):
+        """
+        Writes the table to a path or binary file object as Parquet or uncompressed
+        Feather, in row groups of `rows_per_group` (dictionary encoding is kept).
+        """
+        return write_columnar(self.to_arrow().to_batches(rows_per_group), where, export_format)
+
+    def write_parquet(self, where):
+        return self.write_columnar(where, "parquet")
+
+    def write_feather(self, where):
+        return self.write_columnar(where, "feather")
@@ -0,0 +1,1069 @@
+"""
+Order export parsing for DAZZLE PREMIUM.
+
+Holds the single-order Shopify export parser (parse_shopify_export, with
+split_shopify_exports for pastes of several order pages) and the batch orders-page
+parsers. Nothing here imports Streamlit, and pandas/pyarrow are only
+imported by the functions that build DataFrames, so process-pool workers and the
+CLI can import this module in milliseconds.
+"""
+import csv
+import io
+import json
+import os
+import re
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+from itertools import chain, islice
+
+from dazzle.catalog import SIZE_NOT_FOUND, default_catalog
+from dazzle.instrumentation import instrumented, mark
+from dazzle.models import LineItemColumns, ParsedOrder
+
+
+# --- Parser Patterns (compiled once at module load) ---
+# Every regex used by parse_shopify_export lives here so no pattern is recompiled
+# (or looked up in the re cache) per call.
+
+# Whole-text field patterns. These run over untrusted pastes, so none may backtrack
+# super-linearly: the email local part only starts at the beginning of a [\w.-] run
+# and is possessive, and the domain is the whole run after "@" (possessive) once a
+# lookahead has seen an inner dot. That matches exactly what the plain
+# [\w.-]+@[\w.-]+\.[\w.-]+ pattern matched, but in one pass instead of one per start.
+CONFIRMATION_NAME_MAX_CHARS = 200
+EMAIL_PATTERN = r"(?<![\w.-])[\w.-]++@(?=[\w.-]+?\.[\w.-])[\w.-]++"
+CONFIRMATION_NAME_RE = re.compile(
+    rf"Order confirmation email was sent to (.{{0,{CONFIRMATION_NAME_MAX_CHARS}}}?) \({EMAIL_PATTERN}\)", re.IGNORECASE
+)
+EMAIL_RE = re.compile(EMAIL_PATTERN)
+EMAIL_LABEL_RE = re.compile(rf"Email:\s*({EMAIL_PATTERN})", re.IGNORECASE)
+PHONE_RE = re.compile(r"(\+1[\s\-()]?\d{3}[\s\-()]?\d{3}[\s\-()]?\d{4}|\d{3}[\s\-()]?\d{3}[\s\-()]?\d{4})")
+PHONE_LABEL_RE = re.compile(r"(?:Phone|Tel|Contact):\s*(\+?\d[\d\s\-\(\).]{7,})", re.IGNORECASE)
+ORDER_NUMBER_RE = re.compile(r"dazzlepremium#(\d+)", re.IGNORECASE)
+ORDER_NUMBER_GENERAL_RE = re.compile(r"(?:Order #|Order Number|Invoice #)\s*(\d+)", re.IGNORECASE)
+
+# Line classification patterns
+# Order boundaries in a paste holding several order pages: an order-number header line, or a confirmation line
+ORDER_BOUNDARY_RE = re.compile(
+    r"^[ \t]*(?:dazzlepremium#|#|Order #|Order Number:?|Invoice #)[ \t]*(?P<number>\d{3,})\b"
+    r"|^[^\n]*?Order confirmation email was sent to[^\n]*\n?",
+    re.IGNORECASE | re.MULTILINE,
+)
+SECTION_LABEL_RE = re.compile(r"(?:Customer|Contact information|Shipping address|Billing address)\s*$", re.IGNORECASE)
+NOT_A_NAME_RE = re.compile(r"^\+?\d")
+STYLE_CODE_LINE_RE = re.compile(r" - [A-Z0-9\-]+$")
+PRICE_QTY_RE = re.compile(r"\$\d+\.\d{2}\s*x\s*\d+")
+QTY_RE = re.compile(r"x\s*(\d{1,9})(?!\d)", re.IGNORECASE) # Longer digit runs are not quantities (and would overflow int())
+LETTER_SIZE_RE = re.compile(r"\b(XS|S|M|L|XL|XXL|XXXL|One Size|OS)\b", re.IGNORECASE)
+SLASH_SIZE_RE = re.compile(r"(\b\d{1,2}\b|\b[A-Z]{1,3}\b)\s*/\s*[A-Z0-9]+", re.IGNORECASE)
+NUMERIC_SIZE_RE = re.compile(r"\s*(?:US|EU)?\s*(\d{1,3}(?:/\d{1,2})?)\s*$", re.IGNORECASE)
+
+# Keyword checks run against the already-lowercased line ("subtotal" is covered by "total")
+TOTALS_KEYWORD_RE = re.compile(r"discount|shipping|tax|total|paid|balance")
+ITEM_HEADER_EXCLUDE_RE = re.compile(r"sku|discount|subtotal")
+
+
+def _extract_line_size(line):
+    """
+    Returns the size found on a single detail line, or None.
+    Letter sizes win; otherwise a "M / YLW" style slash size, which a strict
+    standalone numeric size ("US 10", "10/12") overrides when present.
+    """
+    size_match = LETTER_SIZE_RE.search(line)
+    if size_match:
+        return size_match.group(0).strip()
+
+    size = None
+    match_slash_size = SLASH_SIZE_RE.search(line)
+    if match_slash_size:
+        size = match_slash_size.group(1).strip()
+    # Standalone numeric sizes only on lines without "SKU" or "$"
+    if "SKU" not in line.upper() and "$" not in line:
+        numeric_size_match = NUMERIC_SIZE_RE.match(line)
+        if numeric_size_match:
+            size = numeric_size_match.group(1).strip()
+    return size
+
+
+def _tokenize_export(raw_text_input):
+    """
+    Splits the export into stripped, non-empty lines and classifies each one in a
+    single pass. Every line is lowercased once and each pattern runs at most once
+    per line, so the extraction passes below only read these tokens.
+    """
+    tokens = []
+    for raw_line in raw_text_input.split('\n'):
+        line = raw_line.strip()
+        if not line:
+            continue
+        lowered = line.lower()
+        qty_match = QTY_RE.search(line)
+        is_totals = TOTALS_KEYWORD_RE.search(lowered) is not None
+        tokens.append({
+            "line": line,
+            "lower": lowered,
+            "section_label": SECTION_LABEL_RE.search(line) is not None,
+            "product": STYLE_CODE_LINE_RE.search(line) is not None,
+            "price_qty": PRICE_QTY_RE.search(line) is not None,
+            "totals": is_totals,
+            "excluded": is_totals or "sku" in lowered,
+            "quantity": int(qty_match.group(1)) if qty_match else None,
+            "size": _extract_line_size(line),
+        })
+    return tokens
+
+
+@instrumented("parse_shopify_export")
+def parse_shopify_export(raw_text_input):
+    """
+    Parses the raw Shopify order export text to extract key information.
+    This function uses multiple, redundant regex patterns and fallback strategies
+    to maximize extraction success without human intervention.
+    The export is tokenized once into classified lines; the heuristics below only
+    walk those tokens instead of re-scanning the text.
+    """
+    data = {
+        "customer_name": "[Customer Name Not Found]",
+        "email_address": "[Email Not Found]",
+        "phone_number": "[Phone Not Found]",
+        "order_number": "[Order # Not Found]",
+        "items": [],
+        "missing_info": []
+    }
+
+    tokens = _tokenize_export(raw_text_input)
+    lines = [token["line"] for token in tokens]
+    mark("tokenize")
+
+    # --- Extract Customer Name (Redundancy Level 1: Multiple Patterns) ---
+    name_found = False
+    
+    # Attempt 1: From "Order confirmation email was sent to [Name] ([email])"
+    email_sent_match = CONFIRMATION_NAME_RE.search(raw_text_input)
+    if email_sent_match:
+        data["customer_name"] = email_sent_match.group(1).strip()
+        name_found = True
+
+    # Attempt 2: Line after a "Customer", "Contact information", "Shipping address" or "Billing address" label
+    if not name_found:
+        for i, token in enumerate(tokens):
+            if token["section_label"] and i + 1 < len(lines):
+                potential_name = lines[i+1]
+                # Ensure it doesn't look like an email or phone number
+                if "@" not in potential_name and not NOT_A_NAME_RE.search(potential_name):
+                    data["customer_name"] = potential_name
+                    name_found = True
+                    break
+    
+    if not name_found or data["customer_name"] == "[Customer Name Not Found]":
+        data["missing_info"].append("Customer Name")
+    mark("customer_name")
+
+
+    # --- Extract Email Address (Redundancy Level 1: Multiple Patterns) ---
+    # Attempt 1: General email pattern
+    email_match = EMAIL_RE.search(raw_text_input)
+    if email_match:
+        data["email_address"] = email_match.group(0).strip()
+    else:
+        # Attempt 2: Look for "Email:" label explicitly
+        email_label_match = EMAIL_LABEL_RE.search(raw_text_input)
+        if email_label_match:
+            data["email_address"] = email_label_match.group(1).strip()
+        else:
+            data["missing_info"].append("Email Address")
+
+    # --- Extract Phone Number (Redundancy Level 1: Multiple Patterns) ---
+    # Attempt 1: Flexible US phone number regex (common formats)
+    phone_match = PHONE_RE.search(raw_text_input)
+    if phone_match:
+        data["phone_number"] = phone_match.group(0).strip()
+    else:
+        # Attempt 2: Look for "Phone:" label explicitly
+        phone_label_match = PHONE_LABEL_RE.search(raw_text_input)
+        if phone_label_match:
+            data["phone_number"] = phone_label_match.group(1).strip()
+        else:
+            data["missing_info"].append("Phone Number")
+    mark("email_phone")
+
+    # --- Extract Order Number (Redundancy Level 1: Multiple Patterns) ---
+    # Attempt 1: dazzlepremium# followed by digits
+    order_number_match = ORDER_NUMBER_RE.search(raw_text_input)
+    if order_number_match:
+        data["order_number"] = order_number_match.group(1).strip()
+    else:
+        # Attempt 2: General "Order #" or "Order Number" followed by digits
+        order_number_match_general = ORDER_NUMBER_GENERAL_RE.search(raw_text_input)
+        if order_number_match_general:
+            data["order_number"] = order_number_match_general.group(1).strip()
+        else:
+            data["missing_info"].append("Order Number")
+    mark("order_number")
+
+    # --- Extract Items (Redundancy Level 2: Layered Heuristics) ---
+    # Strategy: Find lines that look like product names, then parse details from surrounding lines.
+    
+    product_lines_info = []
+    # Heuristic 1: Lines ending with " - STYLECODE" that are not SKU/discount/totals lines
+    for i, token in enumerate(tokens):
+        if token["product"] and not token["excluded"]:
+            product_lines_info.append({"line": token["line"], "index": i})
+    
+    # Heuristic 2: Lines containing a price and a quantity (e.g., "$57.00 x 1")
+    # Fallback used only if Heuristic 1 didn't find anything.
+    if not product_lines_info:
+        for i, token in enumerate(tokens):
+            if token["price_qty"] and not token["excluded"]:
+                # Try to infer product name from the line above if it looks like a product description
+                if i > 0 and " - " in lines[i-1] and not ITEM_HEADER_EXCLUDE_RE.search(tokens[i-1]["lower"]):
+                    product_lines_info.append({"line": lines[i-1], "index": i-1})
+                else: # Fallback: use the line itself as product name, but this is less reliable
+                    product_lines_info.append({"line": token["line"].split('$')[0].strip(), "index": i})
+    mark("item_detection")
+
+
+    processed_indices = set() # To avoid processing the same product line multiple times
+
+    for prod_info in product_lines_info:
+        line_idx = prod_info["index"]
+        if line_idx in processed_indices:
+            continue # Skip if already processed
+
+        product_name = "Unknown Product"
+        style_code = "N/A"
+        size = "Size Not Found" # Default to "Size Not Found"
+        quantity = 1
+
+        # Extract product name and style code from the identified product line
+        if " - " in prod_info["line"]:
+            parts = prod_info["line"].rsplit(" - ", 1)
+            product_name = parts[0].strip()
+            style_code = parts[1].strip()
+        else:
+            product_name = prod_info["line"] # Use full line as product name if no " - "
+
+        # Look for size and quantity in the next few lines (Redundancy Level 3: Iterative Scan)
+        found_size_for_item = False
+        found_quantity_for_item = False
+
+        for detail in tokens[line_idx + 1:line_idx + 6]: # Scan up to 5 lines after the product line
+            if not found_quantity_for_item and detail["quantity"] is not None:
+                quantity = detail["quantity"]
+                found_quantity_for_item = True
+
+            if not found_size_for_item and detail["size"] is not None:
+                size = detail["size"]
+                found_size_for_item = True
+            
+            # If both size and quantity are found, we can stop scanning for this item's details.
+            if found_size_for_item and found_quantity_for_item:
+                break 
+
+            # Stop at a totals line or at the next product line
+            if detail["totals"] or (detail["product"] and detail["line"] != prod_info["line"]):
+                break
+
+        # Special handling for "Sock" products: assign "One Size" if no explicit size was found
+        # and the product name contains "sock".
+        if size == "Size Not Found" and "sock" in product_name.lower():
+            size = "One Size"
+
+        data["items"].append({
+            "product_name": product_name,
+            "style_code": style_code,
+            "size": size,
+            "quantity": quantity
+        })
+        processed_indices.add(line_idx) # Mark the main product line as processed
+    mark("item_details")
+
+    if not data["items"]:
+        data["missing_info"].append("Order Items")
+
+    # Resolve items against the product catalog (DAZZLE_CATALOG), which may fill in names
+    # and sizes, and also flags sizes the product is not offered in
+    catalog = default_catalog()
+    if catalog is not None and data["items"]:
+        needs_size = catalog.apply(data["items"])
+        mark("catalog")
+    else:
+        needs_size = any(item["size"] == SIZE_NOT_FOUND for item in data["items"])
+
+    # Add "Item Sizes" to missing_info if any item still has "Size Not Found" after all attempts
+    if needs_size:
+        data["missing_info"].append("Item Sizes")
+
+
+    return data
+
+
+def parse_shopify_export_compact(raw_text_input):
+    """parse_shopify_export packed into a ParsedOrder, for results that are cached or kept in session state."""
+    return ParsedOrder.from_dict(parse_shopify_export(raw_text_input))
+
+
+def split_shopify_exports(raw_text_input):
+    """
+    Splits a paste of one or more order pages into one text per order, in one regex
+    pass. A new order starts at an order-number header ("dazzlepremium#1002",
+    "#1002", "Order # 1002") with a different number than the current order's, or at
+    any header once the current order's "Order confirmation email was sent to" line
+    has passed. Pages without headers are split after each confirmation line instead.
+    A single-order export comes back unchanged as the only element.
+    """
+    starts = [0]
+    current_number = None
+    confirmation_end = None # End of the current order's confirmation line, once seen
+    for match in ORDER_BOUNDARY_RE.finditer(raw_text_input):
+        number = match.group("number")
+        if number is not None:
+            if number != current_number and (current_number is not None or confirmation_end is not None):
+                starts.append(match.start())
+                confirmation_end = None
+            current_number = number
+        else:
+            if confirmation_end is not None: # A second confirmation: the previous order ended after the first
+                starts.append(confirmation_end)
+                current_number = None
+            confirmation_end = match.end()
+
+    if len(starts) == 1:
+        return [raw_text_input]
+    segments = (raw_text_input[start:stop] for start, stop in zip(starts, starts[1:] + [len(raw_text_input)]))
+    return [segment for segment in segments if segment.strip()]
+
+
+def iter_shopify_exports(raw_text_input):
+    """Lazily yields a parse_shopify_export result per order in a paste of one or more order pages."""
+    for segment in split_shopify_exports(raw_text_input):
+        yield parse_shopify_export(segment)
+
+
+# --- Batch Order Parsing ---
+
+ORDER_BLOCK_MARKER = "Select gid://shopify/Order/"
+BATCH_ORDER_NUMBER_RE = re.compile(r"#\d+")
+BATCH_AMOUNT_RE = re.compile(r"\$[\d,]+\.\d{2}")
+ORDER_TOTAL_RE = re.compile(r"^Total[ \t]*\n?[ \t]*\$([\d,]+\.\d{2})", re.MULTILINE) # Not "Subtotal": anchored at line start
+BATCH_NAME_RE = re.compile(r"(?<!\d)\d++\sitems?\s*\n([^\n]+)") # Starts only at a digit run, so long runs stay linear
+JSON_ORDERS_WRAPPER_RE = re.compile(r'\{\s*"orders"\s*:\s*\[')
+
+BATCH_FRAME_CHUNK_ROWS = 5000 # Rows buffered as dicts before they are frozen into a DataFrame chunk
+UPLOAD_READ_CHUNK_CHARS = 1 << 20 # Characters decoded per read from an uploaded file
+BATCH_SKIPPED_WARNING = "One order skipped due to incomplete parsing"
+BATCH_ORDER_COLUMNS = ["Order Number", "Customer Name", "Amount ($)"]
+
+
+def iter_order_blocks(chunks):
+    """
+    Yields the text of each Shopify order block (everything after a
+    "Select gid://shopify/Order/" marker up to the next one) from an iterable of
+    text chunks. Only the block being assembled is held in memory, so a whole
+    export is never copied into a list of blocks. Yields nothing if no marker appears.
+    """
+    marker_length = len(ORDER_BLOCK_MARKER)
+    buffer = ""
+    search_from = 0
+    inside_block = False
+
+    for chunk in chunks:
+        buffer += chunk
+        block_start = 0
+        while True:
+            marker_index = buffer.find(ORDER_BLOCK_MARKER, search_from)
+            if marker_index == -1:
+                break
+            if inside_block:
+                yield buffer[block_start:marker_index]
+            inside_block = True
+            block_start = search_from = marker_index + marker_length
+
+        if inside_block:
+            buffer = buffer[block_start:]
+        else:
+            buffer = buffer[-(marker_length - 1):] # Text before the first marker is never part of a block
+        # A marker may straddle the chunk boundary, so rescan the tail on the next chunk
+        search_from = max(0, len(buffer) - marker_length + 1)
+
+    if inside_block:
+        yield buffer
+
+
+def order_block_amount(block):
+    """The first dollar amount in an order block as a float, or None."""
+    amount_match = BATCH_AMOUNT_RE.search(block)
+    if amount_match:
+        return float(amount_match.group(0).replace("$", "").replace(",", ""))
+    return None
+
+
+def order_page_total(block):
+    """
+    The order total of a full order page, from its "Total" line (the amount on the
+    same or the next line), as a float; None when the page has no Total line. The
+    first dollar amount on an order page is an item price, so it is never used instead.
+    """
+    total_match = ORDER_TOTAL_RE.search(block)
+    if total_match:
+        return float(total_match.group(1).replace(",", ""))
+    return None
+
+
+def parse_order_block(block):
+    """Extracts one batch row (order number, customer name, amount) from an order block, or None if incomplete."""
+    order = name = amount = None
+
+    order_match = BATCH_ORDER_NUMBER_RE.search(block)
+    if order_match:
+        order = order_match.group(0)
+
+    amount = order_block_amount(block)
+
+    name_match = BATCH_NAME_RE.search(block)
+    if name_match:
+        candidate = name_match.group(1).strip()
+        if "$" not in candidate and len(candidate) > 1:
+            name = candidate
+
+    if order and name and amount is not None:
+        return {
+            "Order Number": order,
+            "Customer Name": name,
+            "Amount ($)": amount
+        }
+    return None
+
+
+def build_orders_frame(rows, chunk_rows=BATCH_FRAME_CHUNK_ROWS):
+    """
+    Collects batch rows (None marks a skipped order) into a DataFrame.
+    Rows are frozen into DataFrame chunks every `chunk_rows` rows so only one
+    chunk's worth of dicts is alive at a time.
+    """
+    import pandas as pd
+
+    frames = []
+    pending = []
+    warnings = []
+
+    for row in rows:
+        if row is None:
+            warnings.append(BATCH_SKIPPED_WARNING)
+            continue
+        pending.append(row)
+        if len(pending) >= chunk_rows:
+            frames.append(pd.DataFrame(pending))
+            pending = []
+    if pending:
+        frames.append(pd.DataFrame(pending))
+
+    if not frames:
+        return pd.DataFrame(), warnings
+    if len(frames) == 1:
+        return frames[0], warnings
+    return pd.concat(frames, ignore_index=True), warnings
+
+
+@instrumented("parse_orders")
+def parse_orders(text):
+    """Parses pasted Shopify orders page text into a DataFrame of order rows plus skip warnings."""
+    if ORDER_BLOCK_MARKER not in text:
+        import pandas as pd
+        return pd.DataFrame(), ["No Shopify order blocks found"]
+
+    pa = _import_pyarrow()
+    if pa is not None:
+        try:
+            return parse_orders_vectorized(text)
+        except (UnicodeEncodeError, pa.ArrowInvalid): # e.g. lone surrogates Arrow cannot store as UTF-8
+            pass
+    result = build_orders_frame(parse_order_block(block) for block in iter_order_blocks([text]))
+    mark("block_loop")
+    return result
+
+
+# --- Vectorized Batch Order Parsing ---
+
+@cache
+def _import_pyarrow():
+    """Imports pyarrow on first use, or returns None if it is not installed (parse_orders then uses the block loop)."""
+    try:
+        import pyarrow
+        import pyarrow.compute # noqa: F401  (registers pyarrow.compute)
+    except ImportError:
+        return None
+    return pyarrow
+
+
+# The batch patterns with named groups, for Series.str.extract on Arrow strings (RE2 engine)
+VECTOR_ORDER_NUMBER_PATTERN = r"(?P<order>#\d+)"
+VECTOR_AMOUNT_PATTERN = r"\$(?P<amount>[\d,]+\.\d{2})"
+VECTOR_NAME_PATTERN = r"\d+\sitems?\s*\n(?P<name>[^\n]+)"
+# RE2's \d and \s are ASCII-only while Python's are Unicode-aware. Blocks containing a
+# character that only Python's classes match (Unicode digits, Unicode/vertical whitespace,
+# \x1c-\x1f) go through parse_order_block so both paths return identical rows.
+VECTOR_UNSAFE_PATTERN = (
+    r"[\x0b\x1c-\x1f\x85\xa0\x{1680}\x{2000}-\x{200a}\x{2028}\x{2029}\x{202f}\x{205f}\x{3000}]"
+    r"|[^\P{Nd}0-9]"
+)
+
+
+def parse_orders_vectorized(text):
+    """
+    Columnar version of parse_orders: splits the page once into an Arrow-backed
+    Series of blocks, extracts order number, amount and name with one
+    Series.str.extract per field, and derives the skip warnings from the null
+    masks. Returns the same DataFrame and warnings as the block loop. Needs pyarrow.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    mark("imports") # Only the first call in a process pays for these
+
+    if ORDER_BLOCK_MARKER not in text:
+        return pd.DataFrame(), ["No Shopify order blocks found"]
+
+    pieces = pc.split_pattern(pa.array([text], type=pa.large_string()), ORDER_BLOCK_MARKER)
+    block_array = pieces.flatten()[1:] # Text before the first marker is never part of a block
+    mark("split")
+
+    order_values, name_values, amount_values, complete = extract_block_columns(block_array)
+
+    warnings = [BATCH_SKIPPED_WARNING] * int((~complete).sum())
+    if not complete.any():
+        return pd.DataFrame(), warnings
+    frame = pd.DataFrame({
+        "Order Number": order_values[complete].tolist(),
+        "Customer Name": name_values[complete].tolist(),
+        "Amount ($)": amount_values[complete],
+    })
+    mark("frame")
+    return frame, warnings
+
+
+def extract_block_columns(block_array):
+    """
+    Runs the vectorized extraction over an Arrow string array of order blocks.
+    Returns numpy arrays, one entry per block: order numbers, customer names,
+    amounts and a `complete` mask (False where parse_order_block would return None).
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    blocks = pd.Series(block_array, dtype=pd.ArrowDtype(block_array.type), copy=False)
+    orders = blocks.str.extract(VECTOR_ORDER_NUMBER_PATTERN)["order"]
+    amounts = (
+        blocks.str.extract(VECTOR_AMOUNT_PATTERN)["amount"]
+        .str.replace(",", "", regex=False)
+        .astype(pd.ArrowDtype(pa.float64()))
+    )
+    names = blocks.str.extract(VECTOR_NAME_PATTERN)["name"].str.strip()
+    names = names.where(~names.str.contains("$", regex=False) & (names.str.len() > 1))
+    mark("extract")
+
+    complete = (orders.notna() & names.notna() & amounts.notna()).to_numpy(dtype=bool, na_value=False, copy=True)
+    order_values = orders.to_numpy(dtype=object, na_value=None)
+    name_values = names.to_numpy(dtype=object, na_value=None)
+    amount_values = amounts.to_numpy(dtype=float, na_value=float("nan"), copy=True)
+
+    unsafe = blocks.str.contains(VECTOR_UNSAFE_PATTERN).to_numpy(dtype=bool, na_value=False)
+    for index in unsafe.nonzero()[0]:
+        row = parse_order_block(blocks.iat[index])
+        complete[index] = row is not None
+        if row is not None:
+            order_values[index] = row["Order Number"]
+            name_values[index] = row["Customer Name"]
+            amount_values[index] = row["Amount ($)"]
+    mark("masks")
+    return order_values, name_values, amount_values, complete
+
+
+# --- Incremental Batch Order Parsing ---
+
+INCREMENTAL_VECTORIZE_MIN_BLOCKS = 256 # New blocks below this count are parsed one by one
+
+
+class IncrementalOrdersParser:
+    """
+    Re-parses an orders paste that grows over the day, parsing only blocks it has not
+    seen before. Blocks are keyed by their exact text (everything after the
+    "Select gid://shopify/Order/" marker, so the order id is part of the key); a
+    block that changes is simply a new key.
+
+    Parsed rows are appended to column buffers (order number, customer name, amount)
+    and never moved; each block maps to its buffer row, and a parse records the
+    output as a list of buffer rows. The DataFrame is gathered from the buffers (one
+    take per column) the first time `frame` is read after a parse, instead of being
+    concatenated from slices of the previous frame.
+
+    When the new text is the previous text with orders pasted on top, only the pasted
+    head is split and looked up; the previous output rows are kept, after the head's.
+    parse() returns the same DataFrame and warnings as parse_orders.
+    """
+
+    def __init__(self):
+        self.reset()
+        self.last_parsed_blocks = 0
+        self.last_reused_blocks = 0
+        self.last_new_rows = None # Rows parsed (not reused) by the last call, e.g. to store only those
+
+    def reset(self):
+        self._text = None # Text of the last parse
+        self._skipped = 0 # Skipped blocks in the last parse
+        self._block_count = 0 # Blocks in the last parse
+        self._positions = {} # block text -> buffer row, or -1 if skipped
+        self._order_numbers = []
+        self._customer_names = []
+        self._amounts = array("d")
+        self._rows = array("q") # Buffer rows of the last parse's output, in order
+        self._frame = None
+
+    def copy(self):
+        """
+        An independent parser with the same state, e.g. for a background job while the
+        session's parser keeps serving reruns. The buffers are copied, not the rows' strings.
+        """
+        other = IncrementalOrdersParser()
+        other._text, other._skipped, other._block_count = self._text, self._skipped, self._block_count
+        other._positions = dict(self._positions)
+        other._order_numbers = list(self._order_numbers)
+        other._customer_names = list(self._customer_names)
+        other._amounts = array("d", self._amounts)
+        other._rows = array("q", self._rows)
+        other._frame = self._frame # Immutable once built
+        return other
+
+    def block_ordinals(self):
+        """For each output row of the last parse, the index of its block in the text (see adopt)."""
+        if self._text is None:
+            return array("q")
+        positions = self._positions
+        blocks = self._text.split(ORDER_BLOCK_MARKER)[1:]
+        return array("q", (ordinal for ordinal, block in enumerate(blocks) if positions[block] != -1))
+
+    def adopt(self, text, frame, block_ordinals):
+        """
+        Takes on a parse of `text` done elsewhere (e.g. a batch another session already
+        parsed) from its output `frame` and block_ordinals(), so the next parse() only
+        parses what is new, as if this parser had parsed `text` itself.
+        """
+        if text == self._text:
+            return
+        self.reset()
+        blocks = text.split(ORDER_BLOCK_MARKER)[1:]
+        positions = dict.fromkeys(blocks, -1)
+        for row, ordinal in enumerate(block_ordinals):
+            positions[blocks[ordinal]] = row
+        self._positions = positions
+        self._order_numbers = frame["Order Number"].tolist()
+        self._customer_names = frame["Customer Name"].tolist()
+        self._amounts = array("d", frame["Amount ($)"].to_numpy(dtype="float64"))
+        self._rows = array("q", range(len(self._order_numbers)))
+        self._skipped = sum(positions[block] == -1 for block in blocks)
+        self._block_count = len(blocks)
+        self._text = text
+        self.last_parsed_blocks = 0
+        self.last_reused_blocks = len(blocks)
+        self.last_new_rows = None
+
+    @property
+    def frame(self):
+        """DataFrame of the last parse (complete rows only), or None; built from the buffers on first read."""
+        if self._frame is None and self._rows:
+            self._frame = self._gather(self._rows)
+        return self._frame
+
+    def _gather(self, rows):
+        import numpy as np
+        import pandas as pd
+
+        rows = np.frombuffer(rows, dtype=np.int64)
+        return pd.DataFrame({
+            "Order Number": np.array(self._order_numbers, dtype=object)[rows],
+            "Customer Name": np.array(self._customer_names, dtype=object)[rows],
+            "Amount ($)": np.frombuffer(self._amounts, dtype=np.float64)[rows],
+        })
+
+    @instrumented("parse_orders_incremental")
+    def parse(self, text):
+        import pandas as pd
+
+        if ORDER_BLOCK_MARKER not in text:
+            self.reset()
+            self.last_new_rows = None
+            return pd.DataFrame(), ["No Shopify order blocks found"]
+
+        previous_text = self._text
+        head_end = len(text) - len(previous_text) if previous_text is not None else -1
+        if text == previous_text:
+            self._assemble([], keep_previous=True)
+        elif head_end > 0 and text.endswith(previous_text) and not self._marker_at(text, head_end):
+            # Orders pasted on top: the head plus the previous preamble holds every new block
+            first_marker = previous_text.find(ORDER_BLOCK_MARKER)
+            blocks = (text[:head_end] + previous_text[:first_marker]).split(ORDER_BLOCK_MARKER)[1:]
+            self._assemble(blocks, keep_previous=True)
+        else:
+            self._assemble(text.split(ORDER_BLOCK_MARKER)[1:], keep_previous=False)
+        self._text = text
+
+        frame = self.frame
+        mark("frame")
+        return (frame if frame is not None else pd.DataFrame()), [BATCH_SKIPPED_WARNING] * self._skipped
+
+    @staticmethod
+    def _marker_at(text, index):
+        """True if a block marker spans position `index` (the seam between pasted and previous text)."""
+        window_start = max(0, index - len(ORDER_BLOCK_MARKER) + 1)
+        return ORDER_BLOCK_MARKER in text[window_start:index + len(ORDER_BLOCK_MARKER) - 1]
+
+    def _assemble(self, blocks, keep_previous):
+        """
+        Records the output rows for `blocks` (parsing only unseen ones into the
+        buffers); with keep_previous the previous output rows follow them unchanged.
+        """
+        positions = self._positions
+        new_blocks = {}
+        reused = 0
+        for block in blocks:
+            if block in positions:
+                reused += 1
+            elif block not in new_blocks:
+                new_blocks[block] = len(new_blocks)
+        mark("split")
+
+        first_new_row = len(self._order_numbers)
+        self._parse_new_blocks(list(new_blocks))
+        self.last_new_rows = self._gather(array("q", range(first_new_row, len(self._order_numbers))))
+        mark("parse_new")
+
+        rows = array("q")
+        skipped = 0
+        for block in blocks:
+            row = positions[block]
+            if row == -1:
+                skipped += 1
+            else:
+                rows.append(row)
+        if keep_previous:
+            rows.extend(self._rows)
+            skipped += self._skipped
+
+        if not keep_previous:
+            self._positions = {block: positions[block] for block in blocks} # Forget blocks no longer pasted
+            if len(self._order_numbers) > 2 * len(rows) + INCREMENTAL_VECTORIZE_MIN_BLOCKS:
+                rows = self._compact(rows)
+        if blocks or not keep_previous: # Otherwise the output (and a frame built from it) is unchanged
+            self._rows = rows
+            self._frame = None
+        self._skipped = skipped
+        self.last_parsed_blocks = len(new_blocks)
+        self.last_reused_blocks = reused + (self._block_count if keep_previous else 0)
+        self._block_count = len(blocks) + (self._block_count if keep_previous else 0)
+
+    def _compact(self, rows):
+        """Drops buffer rows no remembered block points at (edited or removed orders); returns `rows` renumbered."""
+        remap = {old: new for new, old in enumerate(dict.fromkeys(position for position in self._positions.values() if position != -1))}
+        self._order_numbers = [self._order_numbers[old] for old in remap]
+        self._customer_names = [self._customer_names[old] for old in remap]
+        self._amounts = array("d", [self._amounts[old] for old in remap])
+        self._positions = {block: -1 if row == -1 else remap[row] for block, row in self._positions.items()}
+        return array("q", [remap[row] for row in rows])
+
+    def _parse_new_blocks(self, blocks):
+        """Parses unseen blocks, appending their complete rows to the buffers and recording each block's row (or -1)."""
+        pa = _import_pyarrow() if len(blocks) >= INCREMENTAL_VECTORIZE_MIN_BLOCKS else None
+        if pa is not None:
+            try:
+                order_values, name_values, amount_values, complete = extract_block_columns(
+                    pa.array(blocks, type=pa.large_string()))
+            except (UnicodeEncodeError, pa.ArrowInvalid):
+                pa = None
+        if pa is None:
+            rows = [parse_order_block(block) for block in blocks]
+            complete = [row is not None for row in rows]
+            rows = [row for row in rows if row is not None]
+            order_values = [row["Order Number"] for row in rows]
+            name_values = [row["Customer Name"] for row in rows]
+            amount_values = [row["Amount ($)"] for row in rows]
+        else:
+            order_values = order_values[complete].tolist()
+            name_values = name_values[complete].tolist()
+            amount_values = amount_values[complete].tolist()
+
+        row = len(self._order_numbers)
+        for block, is_complete in zip(blocks, complete):
+            if is_complete:
+                self._positions[block] = row
+                row += 1
+            else:
+                self._positions[block] = -1
+        self._order_numbers.extend(order_values)
+        self._customer_names.extend(name_values)
+        self._amounts.extend(amount_values)
+
+
+def _parse_amount(value):
+    """Parses "$1,234.50" / "1234.5" / 1234.5 into a float, or None."""
+    if value is None:
+        return None
+    try:
+        return float(str(value).replace("$", "").replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def iter_file_chunks(uploaded_file, chunk_chars=UPLOAD_READ_CHUNK_CHARS):
+    """Decodes an uploaded file (or any binary stream, e.g. stdin) as UTF-8 text and yields it in fixed-size chunks."""
+    if uploaded_file.seekable():
+        uploaded_file.seek(0)
+    reader = io.TextIOWrapper(uploaded_file, encoding="utf-8", errors="replace")
+    try:
+        while True:
+            chunk = reader.read(chunk_chars)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if not uploaded_file.closed: # A caller may close the stream before exhausting this generator
+            reader.detach() # Leave the uploaded file open for the next rerun
+
+
+def iter_csv_order_rows(uploaded_file):
+    """
+    Yields batch rows from a Shopify orders CSV export. Multi-item orders repeat
+    the "Name" column on consecutive rows; only the first row carries the totals.
+    """
+    if uploaded_file.seekable():
+        uploaded_file.seek(0)
+    reader = io.TextIOWrapper(uploaded_file, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        previous_order = None
+        for record in csv.DictReader(reader):
+            order = (record.get("Name") or "").strip()
+            if order and order == previous_order:
+                continue
+            previous_order = order
+
+            name = (record.get("Billing Name") or record.get("Shipping Name") or "").strip()
+            amount = _parse_amount(record.get("Total"))
+            if order and len(name) > 1 and amount is not None:
+                yield {"Order Number": order, "Customer Name": name, "Amount ($)": amount}
+            else:
+                yield None
+    finally:
+        reader.detach()
+
+
+def _json_order_row(order):
+    """Maps a Shopify Admin API order object to a batch row, or None if incomplete."""
+    if not isinstance(order, dict):
+        return None
+    number = order.get("name") or (f"#{order['order_number']}" if order.get("order_number") else None)
+
+    name = None
+    for address_key in ("billing_address", "shipping_address"):
+        address = order.get(address_key) or {}
+        if address.get("name"):
+            name = address["name"].strip()
+            break
+    if not name:
+        customer = order.get("customer") or {}
+        name = " ".join(part for part in (customer.get("first_name"), customer.get("last_name")) if part).strip()
+
+    amount = _parse_amount(order.get("total_price"))
+    if number and name and len(name) > 1 and amount is not None:
+        return {"Order Number": number, "Customer Name": name, "Amount ($)": amount}
+    return None
+
+
+def iter_json_order_rows(chunks):
+    """
+    Yields batch rows from JSON text chunks holding a top-level array of orders,
+    an {"orders": [...]} export, or JSON Lines. Orders are decoded one at a time
+    with raw_decode, so the document is never loaded in full.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ""
+    position = 0
+    in_array = None # Decided from the first non-whitespace characters
+
+    while True:
+        # Skip separators between values
+        while position < len(buffer) and (buffer[position].isspace() or (in_array and buffer[position] == ",")):
+            position += 1
+
+        if in_array is None and position < len(buffer):
+            wrapper_match = JSON_ORDERS_WRAPPER_RE.match(buffer, position)
+            if buffer[position] == "[":
+                in_array, position = True, position + 1
+                continue
+            if wrapper_match:
+                in_array, position = True, wrapper_match.end()
+                continue
+            if buffer[position] == "{" and len(buffer) - position < 64:
+                pass # Too little text to rule out the {"orders": [ wrapper yet; read more below
+            else:
+                in_array = False
+
+        if in_array and position < len(buffer) and buffer[position] == "]":
+            return
+
+        if in_array is not None and position < len(buffer):
+            try:
+                order, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                pass # Value continues in the next chunk
+            else:
+                yield _json_order_row(order)
+                position = end
+                continue
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            if buffer[position:].strip():
+                if in_array is None:
+                    in_array = False
+                    continue
+                raise ValueError("Uploaded JSON ended in the middle of an order")
+            return
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_uploaded_order_rows(uploaded_file):
+    """Streams batch rows out of an uploaded TXT (orders page text), CSV or JSON/JSONL export."""
+    extension = uploaded_file.name.rsplit(".", 1)[-1].lower()
+    if extension == "csv":
+        return iter_csv_order_rows(uploaded_file)
+    if extension in ("json", "jsonl"):
+        return iter_json_order_rows(iter_file_chunks(uploaded_file))
+    return (parse_order_block(block) for block in iter_order_blocks(iter_file_chunks(uploaded_file)))
+
+
+# --- Multiprocess Line-Item Batch Parsing ---
+
+PARSE_WORKER_CHUNK_ORDERS = 64 # Order blocks sent to a worker process per task
+
+
+def order_line_item_rows(parsed_data, batch_order):
+    """
+    Flattens one parse_shopify_export result into batch line-item rows, one per
+    item. `batch_order` is the order's 1-based position in the export, which keeps
+    orders apart even when their order numbers are missing or repeated. An order
+    without items still yields a single row so it is not lost.
+    """
+    order_fields = {
+        "Batch Order": batch_order,
+        "Order Number": parsed_data["order_number"],
+        "Customer Name": parsed_data["customer_name"],
+        "Email": parsed_data["email_address"],
+        "Phone": parsed_data["phone_number"],
+    }
+    missing_info = ", ".join(parsed_data["missing_info"])
+
+    rows = []
+    for item in parsed_data["items"] or [{}]:
+        row = dict(order_fields)
+        row["Product"] = item.get("product_name")
+        row["Style Code"] = item.get("style_code")
+        row["Size"] = item.get("size")
+        row["Quantity"] = item.get("quantity")
+        row["Missing Info"] = missing_info
+        rows.append(row)
+    return rows
+
+
+def _parse_order_chunk(blocks, first_batch_order):
+    """Process-pool task: runs parse_shopify_export on each order block of a chunk and returns flattened rows."""
+    rows = []
+    for batch_order, block in enumerate(blocks, first_batch_order):
+        rows.extend(order_line_item_rows(parse_shopify_export(block), batch_order))
+    return rows
+
+
+def _parse_order_chunk_columns(blocks, first_batch_order):
+    """Process-pool task: like _parse_order_chunk, but returns the chunk as LineItemColumns."""
+    line_items = LineItemColumns()
+    for batch_order, block in enumerate(blocks, first_batch_order):
+        line_items.append_order(parse_shopify_export(block), batch_order, order_page_total(block))
+    return line_items
+
+
+def _iter_block_chunks(blocks, chunk_orders):
+    """Groups an iterable of order blocks into lists of at most `chunk_orders` blocks."""
+    blocks = iter(blocks)
+    while True:
+        chunk = list(islice(blocks, chunk_orders))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_pool_chunks(task, blocks, max_workers, chunk_orders):
+    """
+    Runs task(blocks_chunk, first_batch_order) over chunks of order blocks in a
+    ProcessPoolExecutor and yields the results in input order. Chunks are submitted
+    lazily, with at most two per worker in flight, so a huge export is never queued
+    all at once. A single chunk is parsed in-process, since forking workers would cost more.
+    """
+    chunks = _iter_block_chunks(blocks, chunk_orders)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        return
+    second_chunk = next(chunks, None)
+    if second_chunk is None:
+        yield task(first_chunk, 1)
+        return
+
+    workers = max_workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    next_batch_order = 1
+    try:
+        for blocks_chunk in chain((first_chunk, second_chunk), chunks):
+            pending.append(executor.submit(task, blocks_chunk, next_batch_order))
+            next_batch_order += len(blocks_chunk)
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_parsed_order_chunks(blocks, max_workers=None, chunk_orders=PARSE_WORKER_CHUNK_ORDERS):
+    """Runs parse_shopify_export over order blocks across worker processes and yields each chunk's line-item rows in input order."""
+    return _iter_pool_chunks(_parse_order_chunk, blocks, max_workers, chunk_orders)
+
+
+def parse_order_details_columns(blocks, max_workers=None, chunk_orders=PARSE_WORKER_CHUNK_ORDERS, progress=None):
+    """
+    Parses every order block with the full single-order parser (items, sizes,
+    style codes, phone, email) across worker processes into one LineItemColumns.
+    Workers ship their chunk back already dictionary-encoded, not as row dicts.
+    `progress`, if given, is called with the number of orders parsed so far after
+    each chunk; an exception it raises stops the parse and its workers.
+    """
+    line_items = LineItemColumns()
+    for chunk_columns in _iter_pool_chunks(_parse_order_chunk_columns, blocks, max_workers, chunk_orders):
+        line_items.extend(chunk_columns)
+        if progress is not None:
+            progress(line_items.order_count)
+    return line_items
+
+
+def parse_order_details_batch(blocks, max_workers=None, chunk_orders=PARSE_WORKER_CHUNK_ORDERS):
+    """
+    parse_order_details_columns as one DataFrame of line items with categorical text
+    columns. Returns (DataFrame, warnings) like parse_orders.
+    """
+    import pandas as pd
+
+    line_items = parse_order_details_columns(blocks, max_workers=max_workers, chunk_orders=chunk_orders)
+    if not line_items:
+        return pd.DataFrame(), []
+    return line_items.to_pandas(), []
@@ -0,0 +1,364 @@
+"""
+Rule-based order risk scoring that picks each order's email template.
+
+Orders are first turned into signal columns (one NumPy array per signal, one entry
+per order): amount, item count and quantities, missing fields, contact conflicts and
+repeat-customer history. A signal that cannot be known for an order (items on a
+summary row, history without an order store) is NaN, and no condition on it fires.
+Rules are plain data:
+
+    {"name": "high_amount", "signal": "amount", "op": ">=", "value": 1000, "points": 35}
+    {"name": "no_contact", "any": [<condition>, <condition>], "points": 25}
+
+compile_risk_rules() turns them into a RiskModel whose score() evaluates every rule
+as one vectorized comparison over the signal arrays, adds the points, and maps the
+score to a template through descending thresholds. Scoring cost is a few array
+operations per rule, independent of Python-level loops over orders.
+
+The default rules can be replaced with a JSON file of the same shape named by the
+DAZZLE_RISK_RULES environment variable.
+"""
+import json
+import os
+
+from dazzle.emails import EMAIL_TEMPLATES
+from dazzle.linkage import normalize_email, normalize_phone
+from dazzle.models import NULL_CODE
+
+# Signal -> description; every features dict has exactly these keys (NaN where unknown)
+RISK_SIGNALS = {
+    "amount": "order total in dollars (NaN when unknown)",
+    "item_count": "number of line items",
+    "total_quantity": "sum of item quantities",
+    "max_quantity": "largest single-item quantity",
+    "missing_count": "number of missing_info flags",
+    "missing_name": "customer name not found",
+    "missing_email": "email address not found",
+    "missing_phone": "phone number not found",
+    "missing_items": "no line items found",
+    "missing_sizes": "an item has no size",
+    "contact_conflict": "email seen with another phone, or phone with another email (batch or history)",
+    "prior_orders": "other stored orders with the same email or phone (customer name on summary rows)",
+    "batch_repeats": "other orders in this batch with the same email or phone",
+}
+# missing_info flag -> boolean signal
+MISSING_FLAG_SIGNALS = {
+    "Customer Name": "missing_name",
+    "Email Address": "missing_email",
+    "Phone Number": "missing_phone",
+    "Order Items": "missing_items",
+    "Item Sizes": "missing_sizes",
+}
+RISK_OPERATORS = (">", ">=", "<", "<=", "==", "!=")
+MAX_RISK_RULES = 63 # Fired rules are reported as bits of an int64
+
+# The amount rules add up to at most 40 points, below high_risk's 50: the amount alone
+# can ask for verification (medium_risk) but never picks the auto-cancel email
+DEFAULT_RISK_RULES = {
+    "rules": [
+        {"name": "high_amount", "signal": "amount", "op": ">=", "value": 1000, "points": 20},
+        {"name": "elevated_amount", "signal": "amount", "op": ">=", "value": 400, "points": 10},
+        {"name": "no_contact", "any": [
+            {"signal": "missing_email", "op": "==", "value": True},
+            {"signal": "missing_phone", "op": "==", "value": True},
+        ], "points": 25},
+        {"name": "no_name", "signal": "missing_name", "op": "==", "value": True, "points": 10},
+        {"name": "no_items", "signal": "missing_items", "op": "==", "value": True, "points": 10},
+        {"name": "contact_conflict", "signal": "contact_conflict", "op": "==", "value": True, "points": 30},
+        {"name": "bulk_quantity", "signal": "max_quantity", "op": ">=", "value": 5, "points": 20},
+        {"name": "many_items", "signal": "item_count", "op": ">=", "value": 6, "points": 10},
+        {"name": "new_customer_large_order", "all": [
+            {"signal": "prior_orders", "op": "==", "value": 0},
+            {"signal": "amount", "op": ">=", "value": 600},
+        ], "points": 10},
+        {"name": "repeat_customer", "signal": "prior_orders", "op": ">=", "value": 2, "points": -20},
+    ],
+    # First threshold the score reaches wins; below all of them is default_template
+    "templates": [
+        {"min_score": 50, "template": "high_risk"},
+        {"min_score": 25, "template": "medium_risk"},
+    ],
+    "default_template": "standard",
+}
+
+class RiskRulesError(ValueError):
+    """A risk rule set that does not compile (unknown signal, operator or template)."""
+
+
+# --- Rule Compilation ---
+
+def _compile_condition(condition, where):
+    """Returns a function features -> boolean array for one condition dict."""
+    import numpy as np
+
+    for combinator, reduce in (("all", np.logical_and.reduce), ("any", np.logical_or.reduce)):
+        if combinator in condition:
+            parts = condition[combinator]
+            if not isinstance(parts, list) or not parts:
+                raise RiskRulesError(f"{where}: {combinator!r} needs a non-empty list of conditions")
+            compiled = [_compile_condition(part, f"{where}.{combinator}[{i}]") for i, part in enumerate(parts)]
+            return lambda features: reduce([part(features) for part in compiled])
+
+    signal, op = condition.get("signal"), condition.get("op")
+    if signal not in RISK_SIGNALS:
+        raise RiskRulesError(f"{where}: unknown signal {signal!r} (known: {', '.join(RISK_SIGNALS)})")
+    if op not in RISK_OPERATORS:
+        raise RiskRulesError(f"{where}: unknown operator {op!r}")
+    value = condition.get("value")
+    if not isinstance(value, (bool, int, float)):
+        raise RiskRulesError(f"{where}: value must be a number or true/false")
+    ufunc = {
+        ">": np.greater, ">=": np.greater_equal, "<": np.less,
+        "<=": np.less_equal, "==": np.equal, "!=": np.not_equal,
+    }[op]
+
+    def compare(features):
+        values = features[signal]
+        fired = ufunc(values, value)
+        if values.dtype.kind == "f": # Unknown (NaN) signals never fire, not even for "!="
+            fired &= ~np.isnan(values)
+        return fired
+
+    return compare
+
+
+def compile_risk_rules(config):
+    """Validates a rule set (DEFAULT_RISK_RULES shape) and compiles it into a RiskModel."""
+    rules = config.get("rules")
+    if not isinstance(rules, list):
+        raise RiskRulesError("risk rules need a 'rules' list")
+    if len(rules) > MAX_RISK_RULES:
+        raise RiskRulesError(f"at most {MAX_RISK_RULES} rules are supported")
+
+    names, points, conditions = [], [], []
+    for index, rule in enumerate(rules):
+        name = rule.get("name") or f"rule_{index}"
+        if not isinstance(rule.get("points"), (int, float)) or isinstance(rule.get("points"), bool):
+            raise RiskRulesError(f"{name}: 'points' must be a number")
+        if name in names:
+            raise RiskRulesError(f"duplicate rule name {name!r}")
+        names.append(name)
+        points.append(rule["points"])
+        conditions.append(_compile_condition(rule, name))
+
+    thresholds = sorted(config.get("templates", []), key=lambda entry: entry["min_score"], reverse=True)
+    default_template = config.get("default_template", "standard")
+    for template in [entry["template"] for entry in thresholds] + [default_template]:
+        if template not in EMAIL_TEMPLATES:
+            raise RiskRulesError(f"unknown email template {template!r} (known: {', '.join(EMAIL_TEMPLATES)})")
+    return RiskModel(names, points, conditions, thresholds, default_template)
+
+
+def load_risk_model(path=None):
+    """The rules in `path` or DAZZLE_RISK_RULES (JSON), else DEFAULT_RISK_RULES, compiled."""
+    path = path or os.environ.get("DAZZLE_RISK_RULES") or None
+    if path is None:
+        return compile_risk_rules(DEFAULT_RISK_RULES)
+    try:
+        with open(path, encoding="utf-8") as rules_file:
+            config = json.load(rules_file)
+    except OSError as error:
+        raise RiskRulesError(f"cannot read risk rules {path}: {error.strerror}") from error
+    except ValueError as error:
+        raise RiskRulesError(f"{path}: not valid JSON ({error})") from error
+    return compile_risk_rules(config)
+
+
+class RiskScores:
+    """score() output: int scores, template keys and fired-rule bitmasks, one per order."""
+
+    __slots__ = ("scores", "templates", "flags", "rule_names")
+
+    def __init__(self, scores, templates, flags, rule_names):
+        self.scores = scores
+        self.templates = templates
+        self.flags = flags
+        self.rule_names = rule_names
+
+    def __len__(self):
+        return len(self.scores)
+
+    def flag_labels(self):
+        """Fired rule names per order as a Categorical ("high_amount, no_contact"); only distinct masks are decoded."""
+        import numpy as np
+        import pandas as pd
+
+        masks, codes = np.unique(self.flags, return_inverse=True)
+        labels = [
+            ", ".join(name for bit, name in enumerate(self.rule_names) if int(mask) >> bit & 1)
+            for mask in masks
+        ]
+        return pd.Categorical.from_codes(codes.astype(np.int32), categories=labels)
+
+
+class RiskModel:
+    """Compiled rule set; score() is vectorized over all orders."""
+
+    def __init__(self, names, points, conditions, thresholds, default_template):
+        self.rule_names = names
+        self.points = points
+        self._conditions = conditions
+        self.thresholds = thresholds
+        self.default_template = default_template
+
+    def score(self, features):
+        import numpy as np
+
+        order_count = len(features["amount"])
+        scores = np.zeros(order_count, dtype=np.int64)
+        flags = np.zeros(order_count, dtype=np.int64)
+        with np.errstate(invalid="ignore"): # NaN amounts simply fail their comparisons
+            for bit, (points, condition) in enumerate(zip(self.points, self._conditions)):
+                fired = np.broadcast_to(condition(features), order_count)
+                scores += np.where(fired, int(points), 0)
+                flags |= fired.astype(np.int64) << bit
+        templates = np.select(
+            [scores >= entry["min_score"] for entry in self.thresholds],
+            [entry["template"] for entry in self.thresholds],
+            default=self.default_template,
+        ).astype(object)
+        return RiskScores(scores, templates, flags, self.rule_names)
+
+
+# --- Signals ---
+
+def _contact_signals(features, order_numbers, emails, phones, history, batch_id=None):
+    """
+    Adds contact_conflict, prior_orders and batch_repeats from in-batch duplicates and
+    the order store (leaving out the orders `batch_id` saved, i.e. earlier parses of this batch).
+    """
+    import numpy as np
+    import pandas as pd
+
+    contacts = pd.DataFrame({"email": [normalize_email(value) for value in emails], "phone": [normalize_phone(value) for value in phones]})
+    email_phones = contacts.groupby("email")["phone"].transform("nunique").fillna(0).to_numpy()
+    phone_emails = contacts.groupby("phone")["email"].transform("nunique").fillna(0).to_numpy()
+    email_orders = contacts.groupby("email")["phone"].transform("size").fillna(1).to_numpy()
+    phone_orders = contacts.groupby("phone")["email"].transform("size").fillna(1).to_numpy()
+    features["contact_conflict"] = (email_phones > 1) | (phone_emails > 1)
+    features["batch_repeats"] = np.maximum(email_orders, phone_orders).astype(np.int64) - 1
+
+    if history is not None:
+        stored = history.contact_history(zip(order_numbers, emails, phones), batch_id=batch_id)
+        features["prior_orders"] = np.fromiter((prior for prior, _ in stored), dtype=np.int64, count=len(stored))
+        features["contact_conflict"] |= np.fromiter((conflict for _, conflict in stored), dtype=bool, count=len(stored))
+    else:
+        features["prior_orders"] = np.full(len(contacts), np.nan) # No order store: history is unknown
+    return features
+
+
+def _missing_signals(features, codes, values):
+    """Boolean missing_* columns and missing_count from dictionary-encoded missing_info strings."""
+    import numpy as np
+
+    flag_sets = [set(value.split(", ")) - {""} for value in values]
+    features["missing_count"] = np.array([len(flags) for flags in flag_sets], dtype=np.int64)[codes] \
+        if values else np.zeros(len(codes), dtype=np.int64)
+    for flag, signal in MISSING_FLAG_SIGNALS.items():
+        lookup = np.array([flag in flags for flags in flag_sets], dtype=bool)
+        features[signal] = lookup[codes] if values else np.zeros(len(codes), dtype=bool)
+    return features
+
+
+def line_item_risk_features(line_items, history=None, batch_id=None):
+    """
+    Signal arrays for the orders of a LineItemColumns. Item counts and quantities are
+    aggregated with bincount over the row -> order index; missing flags are decoded
+    once per distinct missing_info value. `history` is an OrderStore (or None);
+    orders it holds from `batch_id` (this batch's earlier parses) are not history.
+    """
+    import numpy as np
+
+    order_count = line_items.order_count
+    rows = np.frombuffer(line_items.row_orders, dtype=np.int32)
+    has_item = np.frombuffer(line_items.item_text["Product"].codes, dtype=np.int32) != NULL_CODE
+    quantities = np.where(has_item, np.frombuffer(line_items.quantities, dtype=np.int64), 0)
+    max_quantity = np.zeros(order_count, dtype=np.int64)
+    np.maximum.at(max_quantity, rows, quantities)
+
+    features = {
+        "amount": np.frombuffer(line_items.amounts, dtype=np.float64).copy(),
+        "item_count": np.bincount(rows, weights=has_item, minlength=order_count).astype(np.int64),
+        "total_quantity": np.bincount(rows, weights=quantities, minlength=order_count).astype(np.int64),
+        "max_quantity": max_quantity,
+    }
+    missing_codes = np.frombuffer(line_items.missing_info.codes, dtype=np.int32)
+    _missing_signals(features, missing_codes, line_items.missing_info.values)
+    return _contact_signals(
+        features,
+        line_items.order_text["Order Number"].to_list(),
+        line_items.order_text["Email"].to_list(),
+        line_items.order_text["Phone"].to_list(),
+        history,
+        batch_id,
+    )
+
+
+def parsed_order_risk_features(parsed_orders, amounts=None, history=None):
+    """Signal arrays for a list of parse_shopify_export results (dicts or ParsedOrders)."""
+    import numpy as np
+
+    order_count = len(parsed_orders)
+    item_quantities = [[item["quantity"] for item in parsed["items"]] for parsed in parsed_orders]
+    missing_values = [", ".join(parsed["missing_info"]) for parsed in parsed_orders]
+    distinct_missing = list(dict.fromkeys(missing_values))
+    missing_index = {value: code for code, value in enumerate(distinct_missing)}
+
+    features = {
+        "amount": np.array([np.nan if amount is None else amount for amount in amounts], dtype=np.float64)
+        if amounts is not None else np.full(order_count, np.nan),
+        "item_count": np.array([len(quantities) for quantities in item_quantities], dtype=np.int64),
+        "total_quantity": np.array([sum(quantities) for quantities in item_quantities], dtype=np.int64),
+        "max_quantity": np.array([max(quantities, default=0) for quantities in item_quantities], dtype=np.int64),
+    }
+    _missing_signals(
+        features, np.array([missing_index[value] for value in missing_values], dtype=np.int32), distinct_missing
+    )
+    return _contact_signals(
+        features,
+        [parsed["order_number"] for parsed in parsed_orders],
+        [parsed["email_address"] for parsed in parsed_orders],
+        [parsed["phone_number"] for parsed in parsed_orders],
+        history,
+    )
+
+
+def summary_risk_features(orders_frame, history=None, batch_id=None):
+    """
+    Signal arrays for parse_orders summary rows, which carry only an order number,
+    a customer name and the amount. The name is known to be present; items, contact
+    details and in-batch repeats are unknown (NaN). With `history` (an OrderStore),
+    prior_orders counts stored orders under the same customer name, except those
+    saved by `batch_id`.
+    """
+    import numpy as np
+
+    order_count = len(orders_frame)
+    features = {signal: np.full(order_count, np.nan) for signal in RISK_SIGNALS}
+    features["missing_name"] = np.zeros(order_count, dtype=bool)
+    features["amount"] = orders_frame["Amount ($)"].to_numpy(dtype=np.float64, na_value=np.nan)
+    if history is not None:
+        stored = history.customer_history(zip(
+            orders_frame["Order Number"].to_numpy(dtype=object, na_value=None),
+            orders_frame["Customer Name"].to_numpy(dtype=object, na_value=None),
+        ), batch_id=batch_id)
+        features["prior_orders"] = np.array([np.nan if prior is None else prior for prior in stored], dtype=np.float64)
+    return features
+
+
+def risk_columns(risk_scores, row_orders=None, include_template=True):
+    """
+    Display columns for scored orders: "Risk Score", "Risk Flags" and (optionally)
+    "Template". `row_orders` (an int array of order positions) repeats each order's
+    values on its line-item rows.
+    """
+    import numpy as np
+
+    flags = risk_scores.flag_labels()
+    columns = {"Risk Score": risk_scores.scores, "Risk Flags": flags}
+    if include_template:
+        columns["Template"] = risk_scores.templates
+    if row_orders is not None:
+        row_orders = np.asarray(row_orders)
+        columns = {name: values.take(row_orders) for name, values in columns.items()}
+    return columns
@@ -0,0 +1,382 @@
+"""
+HTTP service exposing the order parser and email templates to other systems.
+
+A plain ASGI application (no web framework) with these routes:
+
+    POST /parse              one export: text/plain body or {"text": ...} -> parsed order
+    POST /parse/batch        {"exports": [...]}, or an orders page as {"page": ...} / text/plain
+                             -> {"orders": [parsed order, ...]}
+    POST /render/{template}  {"order": parsed order} or {"text": export} -> subject and body
+    GET  /health             queue depth and pool size
+    GET  /metrics            parser/renderer stage histograms (Prometheus text; ?format=json for JSON)
+
+Parsing runs in a bounded ProcessPoolExecutor. Exports from requests that arrive
+together are collected into one pool task (up to `batch_size`, waiting at most
+`batch_wait` seconds), and at most one task per worker is in flight. Waiting exports
+beyond `max_queue` are refused with 429 and a Retry-After header.
+
+Serve it with any ASGI server, e.g. `python -m dazzle serve` (needs uvicorn), or
+call it in-process with ServiceClient.
+"""
+import asyncio
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs
+
+from dazzle.emails import EMAIL_TEMPLATES, render_email_batch
+from dazzle.instrumentation import INSTRUMENTATION, capture_traces
+from dazzle.parsing import iter_order_blocks, parse_shopify_export
+
+DEFAULT_SERVICE_MAX_QUEUE = 512 # Exports waiting for a worker before requests get 429
+DEFAULT_SERVICE_BATCH_SIZE = 32 # Exports per process-pool task
+DEFAULT_SERVICE_BATCH_WAIT = 0.002 # Seconds to wait for more exports before dispatching a partial batch
+MAX_REQUEST_BODY_BYTES = 8 << 20
+RETRY_AFTER_SECONDS = 1
+
+
+class ServiceOverloaded(Exception):
+    """The parse queue has no room for the request's exports."""
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _parse_exports(texts):
+    """Process-pool task: parses a batch of single-order exports and returns (results, stage traces)."""
+    with capture_traces() as traces:
+        results = [parse_shopify_export(text) for text in texts]
+    return results, traces
+
+
+def _env_number(name, default, cast):
+    value = os.environ.get(name)
+    return cast(value) if value else default
+
+
+class ParseBatcher:
+    """
+    Collects exports from concurrent requests into batches for a process pool.
+    parse() and parse_many() resolve once every export they submitted is parsed.
+    """
+
+    def __init__(self, max_workers=None, max_queue=DEFAULT_SERVICE_MAX_QUEUE,
+                 batch_size=DEFAULT_SERVICE_BATCH_SIZE, batch_wait=DEFAULT_SERVICE_BATCH_WAIT):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._pending = deque() # (text, future) waiting for a pool task
+        self._executor = None
+        self._dispatcher = None
+        self._wakeup = None
+        self._slots = None
+        self.batches = 0
+        self.rejected = 0
+
+    @property
+    def queued(self):
+        return len(self._pending)
+
+    async def start(self):
+        if self._dispatcher is not None:
+            return
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_workers)
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch_forever())
+
+    async def stop(self):
+        if self._dispatcher is None:
+            return
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        while self._pending:
+            _, future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(ServiceOverloaded("service shutting down"))
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._dispatcher = self._executor = None
+
+    async def parse_many(self, texts):
+        """Queues every export or none of them (ServiceOverloaded), then waits for the results in order."""
+        await self.start()
+        if len(self._pending) + len(texts) > self.max_queue:
+            self.rejected += 1
+            raise ServiceOverloaded(f"parse queue full ({len(self._pending)} waiting)")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+        self._wakeup.set()
+        return await asyncio.gather(*futures)
+
+    async def parse(self, text):
+        return (await self.parse_many([text]))[0]
+
+    async def _dispatch_forever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                if len(self._pending) < self.batch_size and self.batch_wait:
+                    await asyncio.sleep(self.batch_wait) # Let requests arriving together share the task
+                await self._slots.acquire() # Bounds in-flight tasks; the backlog stays in _pending
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                batch = [(text, future) for text, future in batch if not future.done()] # Dropped by disconnected clients
+                if not batch:
+                    self._slots.release()
+                    continue
+                self.batches += 1
+                task = loop.run_in_executor(self._executor, _parse_exports, [text for text, _ in batch])
+                task.add_done_callback(lambda done, batch=batch: self._resolve(done, batch))
+
+    def _resolve(self, done, batch):
+        self._slots.release()
+        error = ServiceOverloaded("service shutting down") if done.cancelled() else done.exception()
+        results = [None] * len(batch)
+        if error is None:
+            results, traces = done.result()
+            INSTRUMENTATION.merge(traces) # Worker stage timings land in this process's /metrics
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+class DazzleService:
+    """The ASGI application. Starts its process pool on lifespan startup (or the first request)."""
+
+    def __init__(self, max_workers=None, max_queue=None, batch_size=None, batch_wait=None):
+        self.batcher = ParseBatcher(
+            max_workers=max_workers or _env_number("DAZZLE_SERVICE_WORKERS", None, int),
+            max_queue=max_queue or _env_number("DAZZLE_SERVICE_MAX_QUEUE", DEFAULT_SERVICE_MAX_QUEUE, int),
+            batch_size=batch_size or _env_number("DAZZLE_SERVICE_BATCH_SIZE", DEFAULT_SERVICE_BATCH_SIZE, int),
+            batch_wait=batch_wait if batch_wait is not None else _env_number(
+                "DAZZLE_SERVICE_BATCH_WAIT", DEFAULT_SERVICE_BATCH_WAIT, float),
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.batcher.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.batcher.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        headers = {}
+        try:
+            payload = await self._route(scope, receive)
+            status = 200
+        except ServiceOverloaded as exc:
+            status, payload = 429, {"error": str(exc)}
+            headers["retry-after"] = str(RETRY_AFTER_SECONDS)
+        except HTTPError as exc:
+            status, payload = exc.status, {"error": exc.message}
+        except Exception as exc: # e.g. a worker process died (BrokenProcessPool)
+            status, payload = 500, {"error": f"{type(exc).__name__}: {exc}"}
+
+        if isinstance(payload, str): # Prometheus exposition
+            body, content_type = payload.encode("utf-8"), b"text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), b"application/json"
+        response_headers = [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]
+        response_headers += [(name.encode(), value.encode()) for name, value in headers.items()]
+        await send({"type": "http.response.start", "status": status, "headers": response_headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _route(self, scope, receive):
+        method, path = scope["method"], scope["path"].rstrip("/") or "/"
+        if path == "/health":
+            if method != "GET":
+                raise HTTPError(405, "use GET")
+            return {
+                "status": "ok",
+                "workers": self.batcher.max_workers,
+                "queued": self.batcher.queued,
+                "max_queue": self.batcher.max_queue,
+                "batches": self.batcher.batches,
+                "rejected": self.batcher.rejected,
+            }
+
+        if path == "/metrics":
+            if method != "GET":
+                raise HTTPError(405, "use GET")
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            if query.get("format", [""])[0] == "json":
+                return INSTRUMENTATION.to_json()
+            return INSTRUMENTATION.to_prometheus()
+
+        if path not in ("/parse", "/parse/batch") and not path.startswith("/render/"):
+            raise HTTPError(404, f"no route for {path}")
+        if method != "POST":
+            raise HTTPError(405, "use POST")
+        body = await self._read_body(scope, receive)
+
+        if path == "/parse":
+            return await self.batcher.parse(self._text_field(body, "text"))
+        if path == "/parse/batch":
+            return {"orders": await self.batcher.parse_many(self._batch_exports(body))}
+        return await self._render(path[len("/render/"):], body, scope)
+
+    async def _read_body(self, scope, receive):
+        """Returns the decoded JSON object for application/json requests, else the body text."""
+        content_type = ""
+        for name, value in scope.get("headers", []):
+            if name == b"content-type":
+                content_type = value.decode("latin-1").split(";")[0].strip().lower()
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise HTTPError(400, "client disconnected")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_REQUEST_BODY_BYTES:
+                raise HTTPError(413, f"request body over {MAX_REQUEST_BODY_BYTES} bytes")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks).decode("utf-8", errors="replace")
+        if content_type == "application/json":
+            try:
+                body = json.loads(body)
+            except ValueError as exc:
+                raise HTTPError(400, f"invalid JSON: {exc}") from exc
+            if not isinstance(body, dict):
+                raise HTTPError(400, "JSON body must be an object")
+        return body
+
+    @staticmethod
+    def _text_field(body, field):
+        if isinstance(body, str):
+            return body
+        text = body.get(field)
+        if not isinstance(text, str):
+            raise HTTPError(400, f'expected a "{field}" string (or a text/plain body)')
+        return text
+
+    def _batch_exports(self, body):
+        if isinstance(body, dict) and "exports" in body:
+            exports = body["exports"]
+            if not isinstance(exports, list) or not all(isinstance(text, str) for text in exports):
+                raise HTTPError(400, '"exports" must be a list of strings')
+        else:
+            exports = list(iter_order_blocks([self._text_field(body, "page")]))
+        if len(exports) > self.batcher.max_queue:
+            raise HTTPError(413, f"{len(exports)} orders in one request; the limit is {self.batcher.max_queue}")
+        return exports
+
+    async def _render(self, template, body, scope):
+        if template not in EMAIL_TEMPLATES:
+            raise HTTPError(404, f"unknown template {template!r}; use one of {sorted(EMAIL_TEMPLATES)}")
+        if isinstance(body, dict) and isinstance(body.get("order"), dict):
+            parsed_data = body["order"]
+        else:
+            parsed_data = await self.batcher.parse(self._text_field(body, "text"))
+        try:
+            # Rendering takes microseconds, so it runs on the event loop
+            record = next(render_email_batch([parsed_data], template))
+        except (KeyError, TypeError, ValueError) as exc:
+            raise HTTPError(400, f"cannot render order: {exc}") from exc
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if query.get("include_order", ["0"])[0] in ("1", "true"):
+            record["order"] = parsed_data
+        return record
+
+
+def create_app(**options):
+    """Builds the ASGI app; `options` override the DAZZLE_SERVICE_* environment settings."""
+    return DazzleService(**options)
+
+
+class ServiceClient:
+    """
+    In-process client that drives the ASGI app directly, without sockets.
+
+        async with ServiceClient(create_app()) as client:
+            status, headers, payload = await client.post("/parse", {"text": export_text})
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan_task = None
+        self._lifespan_receive = None # Messages to the app
+        self._lifespan_sent = None # Messages from the app
+
+    async def __aenter__(self):
+        self._lifespan_receive, self._lifespan_sent = asyncio.Queue(), asyncio.Queue()
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}}
+        self._lifespan_task = asyncio.get_running_loop().create_task(
+            self.app(scope, self._lifespan_receive.get, self._lifespan_sent.put))
+        await self._lifespan_receive.put({"type": "lifespan.startup"})
+        await self._lifespan_sent.get()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._lifespan_receive.put({"type": "lifespan.shutdown"})
+        await self._lifespan_sent.get()
+        await self._lifespan_task
+
+    async def request(self, method, path, body=b"", content_type="text/plain", query_string=b""):
+        """Sends one request and returns (status, headers dict, payload): decoded JSON, or text for /metrics."""
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "path": path,
+            "query_string": query_string,
+            "headers": [(b"content-type", content_type.encode())],
+        }
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        response = {}
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = {name.decode(): value.decode() for name, value in message["headers"]}
+            elif message["type"] == "http.response.body":
+                response["body"] = response.get("body", b"") + message.get("body", b"")
+
+        await self.app(scope, receive, send)
+        body = response["body"].decode("utf-8")
+        if response["headers"].get("content-type") == "application/json":
+            body = json.loads(body)
+        return response["status"], response["headers"], body
+
+    async def get(self, path):
+        return await self.request("GET", path)
+
+    async def post(self, path, payload=None, text=None, query_string=b""):
+        """POSTs `payload` as JSON, or `text` as text/plain."""
+        if payload is not None:
+            return await self.request("POST", path, json.dumps(payload).encode("utf-8"), "application/json", query_string)
+        return await self.request("POST", path, (text or "").encode("utf-8"), "text/plain", query_string)
@@ -0,0 +1,231 @@
+"""
+Process-wide index of parsed batches, keyed by content hash, read through shared
+memory mappings.
+
+A batch parse (summary rows or full line items) is written once, as an Arrow IPC
+stream file kept with its job (see dazzle.jobs.run_batch_parse). The store indexes
+those files: a symbolic link named after the hash of the input, in
+DAZZLE_SHARED_BATCH_DIR (/dev/shm/dazzle-batches where there is one), points at the
+job's file. Every later reader (another Streamlit session, or another process on the
+same host) memory-maps the file and reads the table in place: the Arrow buffers are
+views of the page cache, so opening a batch someone already parsed costs neither a
+re-parse nor a private copy. Within a process, sessions share one mapping.
+
+Files are written under a temporary name and renamed into place, so readers never
+see a partial batch. The index holds no data of its own: a link whose job file has
+been pruned is a miss and is removed. Each store keeps at most DAZZLE_SHARED_BATCH_MB
+of tables mapped, least recently used first, whoever wrote them; an evicted table is
+mapped again when it is next asked for (tables already handed out stay readable).
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import cache
+
+DEFAULT_SHARED_BATCH_MB = 512
+DEFAULT_SHARED_BATCH_DIR = "/dev/shm/dazzle-batches" if os.path.isdir("/dev/shm") else \
+    os.path.join(tempfile.gettempdir(), "dazzle-batches")
+BATCH_FILE_SUFFIX = ".arrows" # Arrow IPC stream
+STALE_BATCH_SECONDS = 86400 # Temporary links this old are taken to be left over from a crash
+KEY_VERSION = b"dazzle-batch-3" # Bump when a stored table's layout changes, so old files are not read
+WARNINGS_METADATA_KEY = b"dazzle.warnings"
+
+
+def batch_content_key(mode, payload):
+    """
+    Content hash of a batch parse input: the parse mode plus the pasted text, or an
+    uploaded file's extension and bytes. Equal inputs give equal keys in any process.
+    """
+    digest = hashlib.blake2b(KEY_VERSION, digest_size=12)
+    digest.update(mode.encode("utf-8") + b"\0")
+    if isinstance(payload, str):
+        digest.update(b"text\0" + payload.encode("utf-8", "surrogatepass"))
+    else:
+        extension = os.path.splitext(payload["name"])[1].lower()
+        digest.update(extension.encode("utf-8") + b"\0" + payload["data"])
+    return digest.hexdigest()
+
+
+def table_with_warnings(table, warnings):
+    """`table` with parse warnings kept in its schema metadata (read back by table_warnings)."""
+    import json
+
+    if not warnings:
+        return table
+    metadata = dict(table.schema.metadata or {})
+    metadata[WARNINGS_METADATA_KEY] = json.dumps(list(warnings)).encode("utf-8")
+    return table.replace_schema_metadata(metadata)
+
+
+def write_batch_file(path, table):
+    """
+    Writes `table` as an uncompressed Arrow IPC stream (compressed buffers could not
+    be read in place) to a temporary file beside `path`, then renames it into place.
+    Returns the file size.
+    """
+    import pyarrow as pa
+
+    directory, name = os.path.split(path)
+    descriptor, temporary_path = tempfile.mkstemp(prefix=f".{name}.", dir=directory)
+    try:
+        with os.fdopen(descriptor, "wb") as sink:
+            with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression=None)) as writer:
+                writer.write_table(table)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    return os.path.getsize(path)
+
+
+def read_batch_file(path):
+    """The table in a write_batch_file file as zero-copy views of its memory-mapped pages."""
+    import pyarrow as pa
+
+    with pa.memory_map(path) as source: # The table's buffers keep the mapping alive after close
+        return pa.ipc.open_stream(source).read_all()
+
+
+class SharedBatchStore:
+    """
+    Index of batch files under `directory` (DAZZLE_SHARED_BATCH_DIR), with at most
+    `max_bytes` (DAZZLE_SHARED_BATCH_MB) of their tables mapped by this process.
+    Thread-safe.
+    """
+
+    def __init__(self, max_bytes=None, directory=None):
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("DAZZLE_SHARED_BATCH_MB") or DEFAULT_SHARED_BATCH_MB) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.directory = directory or os.environ.get("DAZZLE_SHARED_BATCH_DIR") or DEFAULT_SHARED_BATCH_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._tables = OrderedDict() # key -> (mapped table, file size), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self._remove_stale()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + BATCH_FILE_SUFFIX)
+
+    def _remove_stale(self):
+        """Removes links to pruned job files, and temporary links a crashed process left behind."""
+        cutoff = time.time() - STALE_BATCH_SECONDS
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if not os.path.exists(entry.path) or entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError: # Removed by another process meanwhile
+                    pass
+
+    def nbytes(self):
+        """Bytes of batch files this process has mapped."""
+        with self._lock:
+            return sum(size for _, size in self._tables.values())
+
+    def get(self, key):
+        """
+        The table for `key` (zero-copy views of the batch file), or None. Batches
+        published by other processes are found by name.
+        """
+        with self._lock:
+            entry = self._tables.get(key)
+            if entry is None:
+                path = self.path(key)
+                try:
+                    table = read_batch_file(path)
+                    entry = (table, os.path.getsize(path))
+                except FileNotFoundError:
+                    if os.path.lexists(path): # Its job was pruned
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                    self.misses += 1
+                    return None
+                self._tables[key] = entry
+                self._evict(keep=key)
+            self._tables.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def file_path(self, key):
+        """The batch file `key` points at, or None if there is none."""
+        path = os.path.realpath(self.path(key))
+        return path if os.path.exists(path) else None
+
+    def publish(self, key, path):
+        """
+        Indexes the batch file at `path` (written with write_batch_file) under `key`,
+        replacing any earlier entry (the newest job's file is the longest lived). The file is not copied; it must outlive its use
+        through the store (a job's files live until the job is pruned).
+        """
+        link = self.path(key)
+        try:
+            same_file = os.path.samefile(link, path) # A hard link of the indexed file keeps its mapping
+        except OSError:
+            same_file = False
+        temporary_link = os.path.join(self.directory, f".{key}.{os.getpid()}.{threading.get_ident()}")
+        os.symlink(os.path.abspath(path), temporary_link)
+        try:
+            os.replace(temporary_link, link)
+        except BaseException:
+            os.remove(temporary_link)
+            raise
+        if not same_file:
+            with self._lock:
+                self._tables.pop(key, None) # Map the new file on the next get
+
+    def _evict(self, keep):
+        """Drops least recently used mappings until the store fits max_bytes. Caller holds the lock."""
+        held = sum(size for _, size in self._tables.values())
+        for key in list(self._tables):
+            if held <= self.max_bytes:
+                break
+            if key != keep:
+                held -= self._tables.pop(key)[1]
+
+    def close(self):
+        """Drops every mapping (tables already handed out stay readable)."""
+        with self._lock:
+            self._tables.clear()
+
+
+def table_warnings(table):
+    """The parse warnings stored with a table by table_with_warnings."""
+    import json
+
+    metadata = table.schema.metadata or {}
+    return json.loads(metadata[WARNINGS_METADATA_KEY]) if WARNINGS_METADATA_KEY in metadata else []
+
+
+def table_frame(table):
+    """
+    A DataFrame over a stored table without copying it: columns stay Arrow-backed
+    (pandas.ArrowDtype), except dictionary columns, which become categoricals (only
+    their small int32 codes are converted).
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    return table.to_pandas(types_mapper=lambda arrow_type: None if pa.types.is_dictionary(arrow_type) else pd.ArrowDtype(arrow_type))
+
+
+@cache
+def shared_batches():
+    """
+    The process-wide SharedBatchStore, or None when pyarrow is missing or
+    DAZZLE_SHARED_BATCH_MB is 0 (batch results are then pickled with their job).
+    """
+    try:
+        import pyarrow # noqa: F401
+    except ImportError:
+        return None
+    store = SharedBatchStore()
+    if store.max_bytes <= 0:
+        return None
+    return store
@@ -0,0 +1,629 @@
+"""
+Persistent local order store (SQLite).
+
+Every order parsed in the Email Generator or Batch Orders tab is upserted here so
+it can be found again from the header search box without re-pasting the export.
+Orders are indexed on order number, email, phone digits and customer name; line
+items are indexed with FTS5 on product name and style code (plain LIKE scans are
+used if this SQLite build lacks FTS5).
+
+The Analytics tab reads pre-aggregated rollup tables (revenue and orders per day,
+per-customer totals, size and style-code counts). Triggers keep them current as
+orders and items are written, so a save only touches the rollup rows of the orders
+it changed and the charts never group over the order history.
+"""
+import itertools
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from dazzle.cache import export_fingerprint, normalize_export_text
+
+DEFAULT_ORDER_DB_PATH = "dazzle_orders.sqlite3"
+DEFAULT_SEARCH_LIMIT = 20
+HISTORY_PAGE_ROWS = 10000 # Rows fetched per lock acquisition when streaming the history out
+
+# parse_shopify_export placeholders, stored as NULL
+NOT_FOUND_VALUES = {"[Customer Name Not Found]", "[Email Not Found]", "[Phone Not Found]", "[Order # Not Found]"}
+
+ORDER_NUMBER_QUERY_RE = re.compile(r"^(?:dazzlepremium)?#?(\d{1,9})$", re.IGNORECASE)
+NON_DIGIT_RE = re.compile(r"\D")
+LETTER_RE = re.compile(r"[A-Za-z]")
+WHITESPACE_RE = re.compile(r"\s+")
+GMAIL_DOMAINS = {"gmail.com", "googlemail.com"}
+
+ORDERS_TABLE = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    record_key TEXT NOT NULL UNIQUE,
+    order_number TEXT,
+    customer_name TEXT COLLATE NOCASE,
+    email_address TEXT COLLATE NOCASE,
+    email_key TEXT,
+    phone_number TEXT,
+    phone_digits TEXT,
+    amount REAL,
+    source TEXT NOT NULL,
+    batch_id TEXT,
+    missing_info TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+# Columns added to ORDERS_TABLE since stores were first created: (name, definition, backfill SQL or None)
+ADDED_ORDER_COLUMNS = [
+    ("batch_id", "TEXT", None),
+    ("email_key", "TEXT", "UPDATE orders SET email_key = normalize_email(email_address) WHERE email_address IS NOT NULL"),
+]
+SCHEMA = """
+CREATE INDEX IF NOT EXISTS orders_order_number ON orders(order_number);
+CREATE INDEX IF NOT EXISTS orders_email_address ON orders(email_address);
+CREATE INDEX IF NOT EXISTS orders_email_key ON orders(email_key);
+CREATE INDEX IF NOT EXISTS orders_phone_digits ON orders(phone_digits);
+CREATE INDEX IF NOT EXISTS orders_customer_name ON orders(customer_name);
+
+CREATE TABLE IF NOT EXISTS order_items (
+    id INTEGER PRIMARY KEY,
+    order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    product_name TEXT,
+    style_code TEXT,
+    size TEXT,
+    quantity INTEGER
+);
+CREATE INDEX IF NOT EXISTS order_items_order_id ON order_items(order_id);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS order_items_fts USING fts5(
+    product_name, style_code, content='order_items', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS order_items_fts_insert AFTER INSERT ON order_items BEGIN
+    INSERT INTO order_items_fts(rowid, product_name, style_code) VALUES (new.id, new.product_name, new.style_code);
+END;
+CREATE TRIGGER IF NOT EXISTS order_items_fts_delete AFTER DELETE ON order_items BEGIN
+    INSERT INTO order_items_fts(order_items_fts, rowid, product_name, style_code)
+    VALUES ('delete', old.id, old.product_name, old.style_code);
+END;
+"""
+
+# Day an order was first stored (order pages carry no order date), in server local time
+ROLLUP_DAY = "date({row}.created_at, 'unixepoch', 'localtime')"
+# Customers are keyed by email, or by name when the order has no email
+ROLLUP_CUSTOMER_KEY = "COALESCE(lower({row}.email_address), 'name:' || lower({row}.customer_name))"
+
+ROLLUP_TABLES = """
+CREATE TABLE IF NOT EXISTS rollup_daily (
+    day TEXT PRIMARY KEY,
+    orders INTEGER NOT NULL,
+    priced_orders INTEGER NOT NULL,
+    revenue REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollup_customers (
+    customer_key TEXT PRIMARY KEY,
+    customer_name TEXT,
+    email_address TEXT,
+    orders INTEGER NOT NULL,
+    revenue REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rollup_customers_revenue ON rollup_customers(revenue);
+CREATE TABLE IF NOT EXISTS rollup_sizes (
+    size TEXT PRIMARY KEY,
+    line_items INTEGER NOT NULL,
+    quantity INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollup_styles (
+    style_code TEXT PRIMARY KEY,
+    line_items INTEGER NOT NULL,
+    quantity INTEGER NOT NULL
+);
+"""
+
+# Adds (sign = 1) or removes (sign = -1) one order's / item's contribution; {row} is "new" or "old"
+ROLLUP_ORDER_DELTA = """
+INSERT INTO rollup_daily (day, orders, priced_orders, revenue)
+VALUES ({day}, {sign}, {sign} * ({row}.amount IS NOT NULL), {sign} * COALESCE({row}.amount, 0))
+ON CONFLICT(day) DO UPDATE SET
+    orders = orders + excluded.orders,
+    priced_orders = priced_orders + excluded.priced_orders,
+    revenue = revenue + excluded.revenue;
+INSERT INTO rollup_customers (customer_key, customer_name, email_address, orders, revenue)
+SELECT {customer_key}, {row}.customer_name, {row}.email_address, {sign}, {sign} * COALESCE({row}.amount, 0)
+WHERE {customer_key} IS NOT NULL
+ON CONFLICT(customer_key) DO UPDATE SET
+    customer_name = COALESCE(excluded.customer_name, customer_name),
+    email_address = COALESCE(excluded.email_address, email_address),
+    orders = orders + excluded.orders,
+    revenue = revenue + excluded.revenue;
+"""
+ROLLUP_ITEM_DELTA = """
+INSERT INTO rollup_{table} ({column}, line_items, quantity)
+SELECT {row}.{column}, {sign}, {sign} * COALESCE({row}.quantity, 1)
+WHERE {row}.{column} IS NOT NULL
+ON CONFLICT({column}) DO UPDATE SET
+    line_items = line_items + excluded.line_items,
+    quantity = quantity + excluded.quantity;
+"""
+ROLLUP_PRUNE = """
+DELETE FROM rollup_customers WHERE orders <= 0;
+DELETE FROM rollup_daily WHERE orders <= 0;
+DELETE FROM rollup_sizes WHERE line_items <= 0;
+DELETE FROM rollup_styles WHERE line_items <= 0;
+"""
+
+
+def _order_delta(row, sign):
+    return ROLLUP_ORDER_DELTA.format(
+        row=row, sign=sign, day=ROLLUP_DAY.format(row=row), customer_key=ROLLUP_CUSTOMER_KEY.format(row=row)
+    )
+
+
+def _item_delta(row, sign):
+    return "".join(
+        ROLLUP_ITEM_DELTA.format(row=row, sign=sign, table=table, column=column)
+        for table, column in (("sizes", "size"), ("styles", "style_code"))
+    )
+
+
+ROLLUP_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS orders_rollup_insert AFTER INSERT ON orders BEGIN
+{_order_delta("new", 1)}
+END;
+CREATE TRIGGER IF NOT EXISTS orders_rollup_update AFTER UPDATE OF amount, customer_name, email_address ON orders
+WHEN old.amount IS NOT new.amount OR old.customer_name IS NOT new.customer_name OR old.email_address IS NOT new.email_address
+BEGIN
+{_order_delta("old", -1)}
+{_order_delta("new", 1)}
+{ROLLUP_PRUNE}
+END;
+CREATE TRIGGER IF NOT EXISTS orders_rollup_delete AFTER DELETE ON orders BEGIN
+{_order_delta("old", -1)}
+{ROLLUP_PRUNE}
+END;
+CREATE TRIGGER IF NOT EXISTS order_items_rollup_insert AFTER INSERT ON order_items BEGIN
+{_item_delta("new", 1)}
+END;
+CREATE TRIGGER IF NOT EXISTS order_items_rollup_delete AFTER DELETE ON order_items BEGIN
+{_item_delta("old", -1)}
+{ROLLUP_PRUNE}
+END;
+"""
+
+# One-off backfill for a store created before the rollups existed
+ROLLUP_REBUILD = f"""
+BEGIN;
+DELETE FROM rollup_daily;
+DELETE FROM rollup_customers;
+DELETE FROM rollup_sizes;
+DELETE FROM rollup_styles;
+INSERT INTO rollup_daily (day, orders, priced_orders, revenue)
+SELECT {ROLLUP_DAY.format(row="o")}, count(*), count(o.amount), COALESCE(sum(o.amount), 0)
+FROM orders o GROUP BY 1;
+INSERT INTO rollup_customers (customer_key, customer_name, email_address, orders, revenue)
+SELECT {ROLLUP_CUSTOMER_KEY.format(row="o")}, max(o.customer_name), max(o.email_address), count(*), COALESCE(sum(o.amount), 0)
+FROM orders o WHERE {ROLLUP_CUSTOMER_KEY.format(row="o")} IS NOT NULL GROUP BY 1;
+INSERT INTO rollup_sizes (size, line_items, quantity)
+SELECT size, count(*), sum(COALESCE(quantity, 1)) FROM order_items WHERE size IS NOT NULL GROUP BY size;
+INSERT INTO rollup_styles (style_code, line_items, quantity)
+SELECT style_code, count(*), sum(COALESCE(quantity, 1)) FROM order_items WHERE style_code IS NOT NULL GROUP BY style_code;
+COMMIT;
+"""
+
+UPSERT_ORDER_SQL = """
+INSERT INTO orders (record_key, order_number, customer_name, email_address, email_key, phone_number, phone_digits,
+                    amount, source, batch_id, missing_info, created_at, updated_at)
+VALUES (:record_key, :order_number, :customer_name, :email_address, :email_key, :phone_number, :phone_digits,
+        :amount, :source, :batch_id, :missing_info, :now, :now)
+ON CONFLICT(record_key) DO UPDATE SET
+    order_number = COALESCE(excluded.order_number, order_number),
+    customer_name = COALESCE(excluded.customer_name, customer_name),
+    email_address = COALESCE(excluded.email_address, email_address),
+    email_key = COALESCE(excluded.email_key, email_key),
+    phone_number = COALESCE(excluded.phone_number, phone_number),
+    phone_digits = COALESCE(excluded.phone_digits, phone_digits),
+    amount = COALESCE(excluded.amount, amount),
+    batch_id = COALESCE(excluded.batch_id, batch_id),
+    missing_info = COALESCE(excluded.missing_info, missing_info),
+    updated_at = excluded.updated_at
+"""
+
+SEARCH_SELECT_SQL = """
+SELECT o.id, o.order_number, o.customer_name, o.email_address, o.phone_number, o.amount, o.source, o.updated_at,
+       (SELECT group_concat(COALESCE(i.product_name, '') || ' (' || COALESCE(i.size, '?') || ')', '; ')
+          FROM order_items i WHERE i.order_id = o.id) AS items
+FROM orders o
+"""
+
+# Temp table + correlated lookups for contact_history(); each subquery is an index probe
+CONTACT_LOOKUP_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS contact_lookup (
+    position INTEGER PRIMARY KEY,
+    order_number TEXT,
+    email_key TEXT,
+    phone_digits TEXT
+)
+"""
+# Emails are matched normalized (normalize_email), as the linkage index matches them; orders
+# saved by :batch_id (earlier parses of the batch being scored) are not its history
+NOT_THIS_BATCH = "(:batch_id IS NULL OR o.batch_id IS NOT :batch_id)"
+CONTACT_HISTORY_SQL = f"""
+SELECT l.position,
+       (SELECT count(*) FROM orders o
+         WHERE (o.email_key = l.email_key OR o.phone_digits = l.phone_digits)
+           AND o.order_number IS NOT l.order_number AND {NOT_THIS_BATCH}) AS prior_orders,
+       EXISTS (SELECT 1 FROM orders o
+                WHERE o.email_key = l.email_key AND o.phone_digits != l.phone_digits AND {NOT_THIS_BATCH})
+       OR EXISTS (SELECT 1 FROM orders o
+                   WHERE o.phone_digits = l.phone_digits AND o.email_key != l.email_key AND {NOT_THIS_BATCH}) AS conflicting
+FROM contact_lookup l
+"""
+
+# Same shape for customer_history(): summary rows are matched on customer name only
+CUSTOMER_LOOKUP_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS customer_lookup (
+    position INTEGER PRIMARY KEY,
+    order_number TEXT,
+    customer_name TEXT COLLATE NOCASE
+)
+"""
+CUSTOMER_HISTORY_SQL = f"""
+SELECT l.position,
+       (SELECT count(*) FROM orders o
+         WHERE o.customer_name = l.customer_name AND o.order_number IS NOT l.order_number
+           AND {NOT_THIS_BATCH}) AS prior_orders
+FROM customer_lookup l
+"""
+
+
+def _clean(value):
+    """Maps parser placeholders and blanks to None."""
+    if value is None or value in NOT_FOUND_VALUES:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def normalize_order_number(order_number):
+    """"#1001", "dazzlepremium#1001" and "1001" all store as "1001"."""
+    order_number = _clean(order_number)
+    if order_number is None:
+        return None
+    match = ORDER_NUMBER_QUERY_RE.match(order_number)
+    return match.group(1) if match else order_number
+
+
+def phone_digits(phone_number):
+    """Last 10 digits of a phone number (drops the +1 country code), or None."""
+    phone_number = _clean(phone_number)
+    if phone_number is None:
+        return None
+    digits = NON_DIGIT_RE.sub("", phone_number)
+    return digits[-10:] or None
+
+
+def normalize_email(email_address):
+    """Lowercased address without whitespace; Gmail dots and +tags are dropped. None for placeholders."""
+    email_address = _clean(email_address)
+    if email_address is None:
+        return None
+    email_address = WHITESPACE_RE.sub("", email_address).lower()
+    local, at, domain = email_address.rpartition("@")
+    if not at or not local or "." not in domain:
+        return None
+    if domain in GMAIL_DOMAINS:
+        local = local.split("+", 1)[0].replace(".", "")
+        domain = "gmail.com"
+    return f"{local}@{domain}"
+
+
+def order_record_key(order_number, fallback_text):
+    """
+    Upsert key shared by both tabs: the normalized order number when one was found,
+    otherwise a fingerprint of the source text (raw export or serialized parse).
+    """
+    order_number = normalize_order_number(order_number)
+    if order_number is not None:
+        return f"order:{order_number}"
+    return "export:" + export_fingerprint(normalize_export_text(fallback_text))
+
+
+def _like_prefix(text):
+    """LIKE pattern matching values that start with `text` literally (use with ESCAPE '\\')."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _fts_query(text):
+    """Turns free text into an FTS5 query: every token must match as a quoted prefix."""
+    tokens = [token.replace('"', '""') for token in text.split()]
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+class OrderStore:
+    """
+    SQLite-backed order history. One connection is shared by every session in the
+    process (guarded by a lock); WAL mode keeps other processes' reads unblocked.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("DAZZLE_ORDER_DB") or DEFAULT_ORDER_DB_PATH
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.create_function("normalize_email", 1, normalize_email, deterministic=True)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        if self.path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+        with self._connection:
+            self._connection.executescript(ORDERS_TABLE)
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(orders)")}
+            for column, definition, backfill in ADDED_ORDER_COLUMNS: # A store created before the column existed
+                if column not in columns:
+                    self._connection.execute(f"ALTER TABLE orders ADD COLUMN {column} {definition}")
+                    if backfill:
+                        self._connection.execute(backfill)
+            self._connection.executescript(SCHEMA)
+            backfill = self._connection.execute(
+                "SELECT count(*) = 0 FROM sqlite_master WHERE type = 'table' AND name = 'rollup_daily'"
+            ).fetchone()[0]
+            self._connection.executescript(ROLLUP_TABLES + ROLLUP_TRIGGERS)
+            if backfill:
+                self._connection.executescript(ROLLUP_REBUILD)
+            try:
+                self._connection.executescript(FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError: # SQLite built without FTS5
+                self.has_fts = False
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _upsert(self, parsed_data, record_key, source, amount, now, batch_id=None):
+        """Upserts one order plus (when parsed) its items. Caller holds the lock and the transaction."""
+        params = {
+            "record_key": record_key,
+            "order_number": normalize_order_number(parsed_data.get("order_number")),
+            "customer_name": _clean(parsed_data.get("customer_name")),
+            "email_address": _clean(parsed_data.get("email_address")),
+            "email_key": normalize_email(parsed_data.get("email_address")),
+            "phone_number": _clean(parsed_data.get("phone_number")),
+            "phone_digits": phone_digits(parsed_data.get("phone_number")),
+            "amount": amount,
+            "source": source,
+            "batch_id": batch_id,
+            "missing_info": ", ".join(parsed_data["missing_info"]) if "missing_info" in parsed_data else None,
+            "now": now,
+        }
+        self._connection.execute(UPSERT_ORDER_SQL, params)
+        order_id = self._connection.execute("SELECT id FROM orders WHERE record_key = ?", (record_key,)).fetchone()[0]
+
+        items = parsed_data.get("items")
+        if items:
+            # Replace rather than merge so a re-parse never duplicates line items
+            self._connection.execute("DELETE FROM order_items WHERE order_id = ?", (order_id,))
+            self._connection.executemany(
+                "INSERT INTO order_items (order_id, position, product_name, style_code, size, quantity) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (order_id, position, item.get("product_name"), item.get("style_code"), item.get("size"), item.get("quantity"))
+                    for position, item in enumerate(items, 1)
+                ],
+            )
+        return order_id
+
+    def save_parsed_order(self, parsed_data, raw_text_input, source="email_generator"):
+        """Stores one parse_shopify_export result; returns the order's row id."""
+        record_key = order_record_key(parsed_data.get("order_number"), raw_text_input)
+        with self._lock, self._connection:
+            return self._upsert(parsed_data, record_key, source, None, time.time())
+
+    def save_parsed_orders(self, parsed_orders, source="batch_line_items", amounts=None, batch_id=None):
+        """
+        Stores many parse_shopify_export results in one transaction; returns how many
+        were written. `amounts` optionally gives each order's total (None or NaN if unknown).
+        `batch_id` records the Batch Orders batch that saved them, so that batch's
+        re-parses can tell its own orders from earlier history.
+        """
+        now = time.time()
+        count = 0
+        amounts = iter(amounts) if amounts is not None else itertools.repeat(None)
+        with self._lock, self._connection:
+            for parsed_data, amount in zip(parsed_orders, amounts):
+                fallback = json.dumps(parsed_data, sort_keys=True, default=str)
+                amount = None if amount is None or math.isnan(amount) else float(amount)
+                self._upsert(parsed_data, order_record_key(parsed_data.get("order_number"), fallback), source, amount, now, batch_id)
+                count += 1
+        return count
+
+    def save_batch_rows(self, orders_frame, source="batch_summary", batch_id=None):
+        """
+        Stores parse_orders summary rows (order number, customer name, amount); returns
+        how many were written. `batch_id` is as for save_parsed_orders.
+        """
+        now = time.time()
+        count = 0
+        with self._lock, self._connection:
+            for order_number, customer_name, amount in orders_frame[["Order Number", "Customer Name", "Amount ($)"]].itertuples(index=False):
+                parsed_data = {"order_number": order_number, "customer_name": customer_name}
+                self._upsert(parsed_data, order_record_key(order_number, f"{order_number}|{customer_name}"), source, float(amount), now, batch_id)
+                count += 1
+        return count
+
+    def contact_history(self, contacts, batch_id=None):
+        """
+        Looks up stored history for many (order_number, email_address, phone_number)
+        contacts in one query. Returns one (prior_orders, conflicting) pair per contact:
+        how many other stored orders share its (normalized) email or phone, and whether
+        its email was stored with another phone (or its phone with another email).
+        Orders saved by `batch_id` are left out.
+        """
+        contacts = list(contacts)
+        history = [(0, False)] * len(contacts)
+        lookups = []
+        for position, (order_number, email_address, phone_number) in enumerate(contacts):
+            email_key, digits = normalize_email(email_address), phone_digits(phone_number)
+            if email_key is not None or digits is not None:
+                lookups.append((position, normalize_order_number(order_number), email_key, digits))
+        if not lookups:
+            return history
+        with self._lock, self._connection:
+            self._connection.execute(CONTACT_LOOKUP_SCHEMA)
+            self._connection.executemany("INSERT INTO contact_lookup VALUES (?, ?, ?, ?)", lookups)
+            rows = self._connection.execute(CONTACT_HISTORY_SQL, {"batch_id": batch_id}).fetchall()
+            self._connection.execute("DELETE FROM contact_lookup")
+        for position, prior_orders, conflicting in rows:
+            history[position] = (prior_orders, bool(conflicting))
+        return history
+
+    def customer_history(self, customers, batch_id=None):
+        """
+        Looks up stored history for many (order_number, customer_name) pairs in one
+        query, for rows that carry no email or phone (batch summary rows). Returns, per
+        pair, how many other stored orders have the same customer name (None when the
+        name is missing). Orders saved by `batch_id` are left out.
+        """
+        customers = list(customers)
+        history = [None] * len(customers)
+        lookups = [
+            (position, normalize_order_number(order_number), _clean(customer_name))
+            for position, (order_number, customer_name) in enumerate(customers)
+            if _clean(customer_name) is not None
+        ]
+        if not lookups:
+            return history
+        with self._lock, self._connection:
+            self._connection.execute(CUSTOMER_LOOKUP_SCHEMA)
+            self._connection.executemany("INSERT INTO customer_lookup VALUES (?, ?, ?)", lookups)
+            rows = self._connection.execute(CUSTOMER_HISTORY_SQL, {"batch_id": batch_id}).fetchall()
+            self._connection.execute("DELETE FROM customer_lookup")
+        for position, prior_orders in rows:
+            history[position] = prior_orders
+        return history
+
+    def iter_linkage_records(self, updated_since=None, page_rows=HISTORY_PAGE_ROWS):
+        """
+        Yields (record_key, order_number, customer_name, email_address, phone_number,
+        batch_id) for every order updated at or after `updated_since` (a time.time() value; None for all).
+        Rows are read in id order a page at a time, so the lock is never held between pages.
+        """
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT id, record_key, order_number, customer_name, email_address, phone_number, batch_id FROM orders"
+                    " WHERE id > ? AND updated_at >= ? ORDER BY id LIMIT ?",
+                    (last_id, updated_since or 0, page_rows),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield tuple(row)[1:]
+            last_id = rows[-1][0]
+
+    def count(self):
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM orders").fetchone()[0]
+
+    # --- Rollups (Analytics tab) ---
+
+    def daily_rollup(self, since_day=None):
+        """
+        (day, orders, priced_orders, revenue) per day from `since_day` ("YYYY-MM-DD";
+        None for all), oldest first. Average order value is revenue / priced_orders:
+        orders saved without an amount count as orders but not towards revenue.
+        """
+        with self._lock:
+            return [tuple(row) for row in self._connection.execute(
+                "SELECT day, orders, priced_orders, revenue FROM rollup_daily WHERE day >= ? ORDER BY day",
+                (since_day or "",),
+            )]
+
+    def top_customers(self, limit=10):
+        """(customer_name, email_address, orders, revenue) for the highest-revenue customers."""
+        with self._lock:
+            return [tuple(row) for row in self._connection.execute(
+                "SELECT customer_name, email_address, orders, revenue FROM rollup_customers"
+                " ORDER BY revenue DESC, orders DESC LIMIT ?",
+                (limit,),
+            )]
+
+    def item_distribution(self, column, limit=None):
+        """(value, line_items, quantity) per size (column="size") or style code (column="style_code"), most sold first."""
+        table = {"size": "rollup_sizes", "style_code": "rollup_styles"}[column]
+        with self._lock:
+            return [tuple(row) for row in self._connection.execute(
+                f"SELECT {column}, line_items, quantity FROM {table} ORDER BY quantity DESC, {column} LIMIT ?",
+                (-1 if limit is None else limit,),
+            )]
+
+    def rebuild_rollups(self):
+        """Recomputes every rollup table from the stored orders (they are otherwise kept current by triggers)."""
+        with self._lock, self._connection:
+            self._connection.executescript(ROLLUP_REBUILD)
+
+    def _branch_ids(self, sql, params, limit):
+        """Runs one search branch (an index or FTS5 lookup capped at `limit` rows) and returns order ids."""
+        return [row[0] for row in self._connection.execute(sql, list(params) + [limit])]
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT):
+        """
+        Finds orders by order number ("1001", "#1001", "dazzlepremium#1001"), email
+        prefix, phone number (full or leading digits), customer name prefix, or
+        product name / style code text. Each kind of match is its own capped index
+        or FTS5 lookup, so cost does not grow with the number of stored orders.
+        Returns a list of dicts: exact identifiers first, then names, then products.
+        """
+        query = (query or "").strip()
+        if not query:
+            return []
+
+        order_number_match = ORDER_NUMBER_QUERY_RE.match(query.replace(" ", ""))
+        digits = NON_DIGIT_RE.sub("", query)
+        branches = []
+        if "@" in query:
+            branches.append(("SELECT id FROM orders WHERE email_address LIKE ? ESCAPE '\\' LIMIT ?", [_like_prefix(query)]))
+        else:
+            if order_number_match:
+                branches.append(("SELECT id FROM orders WHERE order_number = ? ORDER BY id DESC LIMIT ?", [order_number_match.group(1)]))
+            if len(digits) >= 7 and not LETTER_RE.search(query):
+                if len(digits) >= 10:
+                    branches.append(("SELECT id FROM orders WHERE phone_digits = ? ORDER BY id DESC LIMIT ?", [digits[-10:]]))
+                else:
+                    branches.append(("SELECT id FROM orders WHERE phone_digits GLOB ? LIMIT ?", [digits + "*"]))
+            if not order_number_match:
+                branches.append(("SELECT id FROM orders WHERE customer_name LIKE ? ESCAPE '\\' LIMIT ?", [_like_prefix(query)]))
+                if self.has_fts:
+                    branches.append((
+                        "SELECT i.order_id FROM order_items i WHERE i.id IN "
+                        "(SELECT rowid FROM order_items_fts WHERE order_items_fts MATCH ? ORDER BY rowid DESC LIMIT ?) "
+                        "ORDER BY i.id DESC",
+                        [_fts_query(query)],
+                    ))
+                else:
+                    branches.append((
+                        "SELECT order_id FROM order_items WHERE product_name LIKE ? ESCAPE '\\' OR style_code LIKE ? ESCAPE '\\' "
+                        "ORDER BY id DESC LIMIT ?",
+                        ["%" + _like_prefix(query)] * 2,
+                    ))
+
+        with self._lock:
+            order_ids = []
+            for sql, params in branches:
+                # Item matches repeat an order once per item, so over-fetch before de-duplicating
+                for order_id in self._branch_ids(sql, params, limit * 5):
+                    if order_id not in order_ids:
+                        order_ids.append(order_id)
+                if len(order_ids) >= limit:
+                    break
+            order_ids = order_ids[:limit]
+            if not order_ids:
+                return []
+            placeholders = ", ".join("?" * len(order_ids))
+            rows = self._connection.execute(f"{SEARCH_SELECT_SQL} WHERE o.id IN ({placeholders})", order_ids).fetchall()
+
+        rows_by_id = {row["id"]: dict(row) for row in rows}
+        return [rows_by_id[order_id] for order_id in order_ids if order_id in rows_by_id]
@@ -0,0 +1,214 @@
+"""
+Compiled, hot-reloading email templates.
+
+Each email type is a .tmpl file made of "=== section ===" blocks (subject, body
+and, for itemized emails, item fragments) using str.format-style placeholders.
+Files are validated and compiled once into f-string render functions; a file is
+recompiled only when its mtime changes, so wording can be edited without a redeploy.
+
+A section's text is everything between its header line and the next header,
+minus the single newline that ends it. Trailing spaces and blank lines are kept.
+"""
+import os
+import re
+import string
+import threading
+import time
+
+from dazzle.instrumentation import mark
+
+DEFAULT_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "email_templates")
+TEMPLATE_SUFFIX = ".tmpl"
+TEMPLATE_RELOAD_CHECK_SECONDS = 1.0 # Minimum gap between mtime checks of one template file
+
+SECTION_HEADER_RE = re.compile(r"^=== ([a-z_]+) ===\n", re.MULTILINE)
+
+# Positional parameters of the compiled render functions, per section group
+ORDER_FIELDS = ("customer_name", "order_number", "order_details")
+ITEM_FIELDS = ("number", "product_name", "style_code", "size", "quantity")
+SECTION_FIELDS = {
+    "subject": ORDER_FIELDS,
+    "body": ORDER_FIELDS,
+    "item": ITEM_FIELDS,
+    "item_numbered_prefix": ITEM_FIELDS,
+    "item_quantity": ITEM_FIELDS,
+    "item_separator": (),
+    "no_items": (),
+}
+
+
+class TemplateError(ValueError):
+    """Raised when a template file is missing, malformed or uses an unknown placeholder."""
+
+
+def _parse_sections(text, path):
+    """Splits template file text into {section name: section text}."""
+    headers = list(SECTION_HEADER_RE.finditer(text))
+    if not headers or headers[0].start() != 0:
+        raise TemplateError(f"{path}: a template must start with a '=== section ===' header")
+
+    sections = {}
+    for header, next_header in zip(headers, headers[1:] + [None]):
+        name = header.group(1)
+        if name not in SECTION_FIELDS:
+            raise TemplateError(f"{path}: unknown section {name!r}")
+        if name in sections:
+            raise TemplateError(f"{path}: section {name!r} appears twice")
+        content = text[header.end():next_header.start() if next_header else len(text)]
+        sections[name] = content[:-1] if content.endswith("\n") else content
+    return sections
+
+
+def _compile_section(text, name, path):
+    """
+    Compiles a section into a Python function whose body is one f-string, so a
+    render costs the same as the hand-written f-strings it replaces. Placeholders
+    must be plain names from the section's field list (conversions and format
+    specs are allowed); literal text is embedded via repr(), never as code.
+    """
+    allowed = SECTION_FIELDS[name]
+    pieces = []
+    try:
+        parsed = list(string.Formatter().parse(text))
+    except ValueError as exc:
+        raise TemplateError(f"{path}: section {name!r}: {exc}") from exc
+
+    for literal, field, format_spec, conversion in parsed:
+        if literal:
+            pieces.append("f" + repr(literal.replace("{", "{{").replace("}", "}}")))
+        if field is None:
+            continue
+        if field not in allowed:
+            raise TemplateError(f"{path}: section {name!r} uses unknown placeholder {{{field}}}")
+        if "{" in format_spec or conversion not in (None, "s", "r", "a"):
+            raise TemplateError(f"{path}: section {name!r}: unsupported placeholder {{{field}!{conversion}:{format_spec}}}")
+        replacement = field + (f"!{conversion}" if conversion else "") + (f":{format_spec}" if format_spec else "")
+        pieces.append("f" + repr("{" + replacement + "}"))
+
+    source = f"def render({', '.join(allowed)}):\n    return {' '.join(pieces) or repr('')}\n"
+    namespace = {}
+    try:
+        code = compile(source, f"<template {path} [{name}]>", "exec")
+    except SyntaxError as exc:
+        raise TemplateError(f"{path}: section {name!r} could not be compiled: {exc.msg}") from exc
+    exec(code, namespace)
+    return namespace["render"]
+
+
+class CompiledTemplate:
+    """One email type compiled into render functions (one per section)."""
+
+    def __init__(self, name, sections, path):
+        for required in ("subject", "body"):
+            if required not in sections:
+                raise TemplateError(f"{path}: missing required section {required!r}")
+        self.name = name
+        self.path = path
+        self.format_subject = _compile_section(sections["subject"], "subject", path)
+        self.format_body = _compile_section(sections["body"], "body", path)
+        self.itemized = "item" in sections
+        if self.itemized:
+            self.format_item = _compile_section(sections["item"], "item", path)
+            prefix = sections.get("item_numbered_prefix")
+            quantity = sections.get("item_quantity")
+            self.format_numbered_prefix = _compile_section(prefix, "item_numbered_prefix", path) if prefix is not None else None
+            self.format_quantity = _compile_section(quantity, "item_quantity", path) if quantity is not None else None
+            self.item_separator = sections.get("item_separator", "\n")
+            self.no_items = sections.get("no_items", "")
+
+    def render_order_details(self, items):
+        """Renders the item list: every item's fragments are collected and joined once."""
+        if not items:
+            return self.no_items
+
+        numbered = self.format_numbered_prefix is not None and len(items) > 1
+        fragments = []
+        for number, item in enumerate(items, 1):
+            if number > 1:
+                fragments.append(self.item_separator)
+            fields = (
+                number,
+                item.get('product_name', 'N/A'),
+                item.get('style_code', 'N/A'),
+                item.get('size', 'Size Not Found'),
+                item.get('quantity', 1),
+            )
+            if numbered:
+                fragments.append(self.format_numbered_prefix(*fields))
+            fragments.append(self.format_item(*fields))
+            if self.format_quantity is not None and fields[4] > 1:
+                fragments.append(self.format_quantity(*fields))
+        return "".join(fragments)
+
+    def render(self, parsed_data):
+        """Returns (subject, message) for one parsed order."""
+        order_details = self.render_order_details(parsed_data.get("items", [])) if self.itemized else ""
+        mark("order_details")
+        fields = (
+            parsed_data.get("customer_name", "[Customer Name Not Found]"),
+            parsed_data.get("order_number", "[Order # Not Found]"),
+            order_details,
+        )
+        rendered = self.format_subject(*fields), self.format_body(*fields)
+        mark("subject_body")
+        return rendered
+
+
+def compile_template_file(path, name=None):
+    """Reads and compiles one .tmpl file."""
+    try:
+        with open(path, encoding="utf-8") as template_file:
+            text = template_file.read()
+    except OSError as exc:
+        raise TemplateError(f"Cannot read template {path}: {exc}") from exc
+    name = name or os.path.basename(path)[:-len(TEMPLATE_SUFFIX)]
+    return CompiledTemplate(name, _parse_sections(text, path), path)
+
+
+class TemplateStore:
+    """
+    Compiles templates from a directory on first use and recompiles a template when
+    its file's mtime changes. mtime checks are throttled to one per
+    `check_interval` seconds per template so bulk rendering stays syscall-free.
+    """
+
+    def __init__(self, directory=None, check_interval=TEMPLATE_RELOAD_CHECK_SECONDS, clock=time.monotonic):
+        self.directory = directory or os.environ.get("DAZZLE_TEMPLATE_DIR") or DEFAULT_TEMPLATE_DIR
+        self.check_interval = check_interval
+        self._clock = clock
+        self._compiled = {} # name -> (mtime_ns, checked_at, CompiledTemplate)
+        self._lock = threading.Lock()
+
+    def path_for(self, name):
+        """Returns the template file path for an email type name."""
+        return os.path.join(self.directory, name + TEMPLATE_SUFFIX)
+
+    def get(self, name):
+        """Returns the compiled template, recompiling it if its file changed."""
+        now = self._clock()
+        entry = self._compiled.get(name)
+        if entry is not None and now - entry[1] < self.check_interval:
+            return entry[2]
+
+        path = self.path_for(name)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError as exc:
+            if entry is not None:
+                return entry[2] # Keep serving the last good version while the file is being replaced
+            raise TemplateError(f"Template {name!r} not found at {path}") from exc
+
+        with self._lock:
+            entry = self._compiled.get(name)
+            if entry is not None and entry[0] == mtime_ns:
+                compiled = entry[2]
+            else:
+                compiled = compile_template_file(path, name)
+            self._compiled[name] = (mtime_ns, now, compiled)
+        return compiled
+
+    def render(self, name, parsed_data):
+        """Renders (subject, message) for one parsed order with the named template."""
+        compiled = self.get(name)
+        mark("template_lookup")
+        return compiled.render(parsed_data)
@@ -0,0 +1,270 @@
+"""
+The order parsers as they were in Codebase.py before any optimization, kept verbatim
+(parse_orders lifted out of the Batch Processing tab) as the reference that
+dazzle.parsing must keep matching.
+"""
+import re
+
+import pandas as pd
+
+
+def parse_shopify_export(raw_text_input):
+    """
+    Parses the raw Shopify order export text to extract key information.
+    This function uses multiple, redundant regex patterns and fallback strategies
+    to maximize extraction success without human intervention.
+    """
+    data = {
+        "customer_name": "[Customer Name Not Found]",
+        "email_address": "[Email Not Found]",
+        "phone_number": "[Phone Not Found]",
+        "order_number": "[Order # Not Found]",
+        "items": [],
+        "missing_info": []
+    }
+
+    # Normalize input: remove extra spaces, ensure consistent line breaks
+    normalized_text = re.sub(r'\s+', ' ', raw_text_input).strip() # Replace multiple spaces with single
+    lines = [line.strip() for line in raw_text_input.split('\n') if line.strip()]
+
+    # --- Extract Customer Name (Redundancy Level 1: Multiple Patterns) ---
+    name_found = False
+    
+    # Attempt 1: From "Order confirmation email was sent to [Name] ([email])"
+    email_sent_match = re.search(r"Order confirmation email was sent to (.*?) \([\w\.-]+@[\w\.-]+\.[\w\.-]+\)", raw_text_input, re.IGNORECASE)
+    if email_sent_match:
+        data["customer_name"] = email_sent_match.group(1).strip()
+        name_found = True
+
+    # Attempt 2: From "Customer" or "Contact information" sections
+    if not name_found:
+        for i, line in enumerate(lines):
+            # Look for "Customer" or "Contact information" labels
+            if re.search(r"Customer\s*$", line, re.IGNORECASE) or re.search(r"Contact information\s*$", line, re.IGNORECASE):
+                # Try to find the name on the next line
+                if i + 1 < len(lines):
+                    potential_name = lines[i+1].split('\n')[0].strip()
+                    # Ensure it doesn't look like an email or phone number
+                    if "@" not in potential_name and not re.search(r"^\+?\d", potential_name):
+                        data["customer_name"] = potential_name
+                        name_found = True
+                        break
+            # Attempt 3: From "Shipping address" or "Billing address" sections
+            elif (re.search(r"Shipping address\s*$", line, re.IGNORECASE) or \
+                  re.search(r"Billing address\s*$", line, re.IGNORECASE)):
+                # Try to find the name on the next line
+                if i + 1 < len(lines):
+                    potential_name = lines[i+1].split('\n')[0].strip()
+                    if "@" not in potential_name and not re.search(r"^\+?\d", potential_name):
+                        data["customer_name"] = potential_name
+                        name_found = True
+                        break
+    
+    if not name_found or data["customer_name"] == "[Customer Name Not Found]":
+        data["missing_info"].append("Customer Name")
+
+
+    # --- Extract Email Address (Redundancy Level 1: Multiple Patterns) ---
+    # Attempt 1: General email pattern
+    email_match = re.search(r"[\w\.-]+@[\w\.-]+\.[\w\.-]+", raw_text_input)
+    if email_match:
+        data["email_address"] = email_match.group(0).strip()
+    else:
+        # Attempt 2: Look for "Email:" label explicitly
+        email_label_match = re.search(r"Email:\s*([\w\.-]+@[\w\.-]+\.[\w\.-]+)", raw_text_input, re.IGNORECASE)
+        if email_label_match:
+            data["email_address"] = email_label_match.group(1).strip()
+        else:
+            data["missing_info"].append("Email Address")
+
+    # --- Extract Phone Number (Redundancy Level 1: Multiple Patterns) ---
+    # Attempt 1: Flexible US phone number regex (common formats)
+    phone_match = re.search(r"(\+1[\s\-()]?\d{3}[\s\-()]?\d{3}[\s\-()]?\d{4}|\d{3}[\s\-()]?\d{3}[\s\-()]?\d{4})", raw_text_input)
+    if phone_match:
+        data["phone_number"] = phone_match.group(0).strip()
+    else:
+        # Attempt 2: Look for "Phone:" label explicitly
+        phone_label_match = re.search(r"(?:Phone|Tel|Contact):\s*(\+?\d[\d\s\-\(\).]{7,})", raw_text_input, re.IGNORECASE)
+        if phone_label_match:
+            data["phone_number"] = phone_label_match.group(1).strip()
+        else:
+            data["missing_info"].append("Phone Number")
+
+    # --- Extract Order Number (Redundancy Level 1: Multiple Patterns) ---
+    # Attempt 1: dazzlepremium# followed by digits
+    order_number_match = re.search(r"dazzlepremium#(\d+)", raw_text_input, re.IGNORECASE)
+    if order_number_match:
+        data["order_number"] = order_number_match.group(1).strip()
+    else:
+        # Attempt 2: General "Order #" or "Order Number" followed by digits
+        order_number_match_general = re.search(r"(?:Order #|Order Number|Invoice #)\s*(\d+)", raw_text_input, re.IGNORECASE)
+        if order_number_match_general:
+            data["order_number"] = order_number_match_general.group(1).strip()
+        else:
+            data["missing_info"].append("Order Number")
+
+    # --- Extract Items (Redundancy Level 2: Layered Heuristics) ---
+    # Strategy: Find lines that look like product names, then parse details from surrounding lines.
+    
+    product_lines_info = []
+    # Heuristic 1: Lines containing " - " and ending with a style code (e.g., "Product Name - STYLECODE")
+    for i, line in enumerate(lines):
+        # This regex looks for product names followed by " - " and a style code,
+        # ensuring it's not a line containing keywords like SKU, discount, etc.
+        if re.search(r" - [A-Z0-9\-]+$", line) and \
+           not any(kw in line.lower() for kw in ["sku", "discount", "subtotal", "shipping", "tax", "total", "paid", "balance"]):
+            product_lines_info.append({"line": line, "index": i})
+    
+    # Heuristic 2: Lines containing a price and a quantity (e.g., "$57.00 x 1")
+    # This helps identify product lines that might not have a style code in their main name
+    # This is a fallback if Heuristic 1 didn't find anything, or to capture additional items.
+    if not product_lines_info: # If no products found by Heuristic 1, try this
+        for i, line in enumerate(lines):
+            if re.search(r"\$\d+\.\d{2}\s*x\s*\d+", line) and \
+               not any(kw in line.lower() for kw in ["sku", "discount", "subtotal", "shipping", "tax", "total", "paid", "balance"]):
+                # Try to infer product name from the line above if it looks like a product description
+                if i > 0 and " - " in lines[i-1] and not any(kw in lines[i-1].lower() for kw in ["sku", "discount", "subtotal"]):
+                    product_lines_info.append({"line": lines[i-1], "index": i-1})
+                else: # Fallback: use the line itself as product name, but this is less reliable
+                    # This might pick up non-product lines, so it's a last resort
+                    product_lines_info.append({"line": line.split('$')[0].strip(), "index": i})
+
+
+    processed_indices = set() # To avoid processing the same product line multiple times
+
+    for prod_info in product_lines_info:
+        line_idx = prod_info["index"]
+        if line_idx in processed_indices:
+            continue # Skip if already processed
+
+        product_name = "Unknown Product"
+        style_code = "N/A"
+        size = "Size Not Found" # Default to "Size Not Found"
+        quantity = 1
+
+        # Extract product name and style code from the identified product line
+        if " - " in prod_info["line"]:
+            parts = prod_info["line"].rsplit(" - ", 1)
+            product_name = parts[0].strip()
+            style_code = parts[1].strip()
+        else:
+            product_name = prod_info["line"] # Use full line as product name if no " - "
+
+        # Look for size and quantity in the next few lines (Redundancy Level 3: Iterative Scan)
+        found_size_for_item = False
+        found_quantity_for_item = False
+
+        for offset in range(1, 6): # Scan up to 5 lines after the product line
+            if line_idx + offset >= len(lines):
+                break # Reached end of document
+
+            potential_detail_line = lines[line_idx + offset].strip()
+            
+            # Attempt to extract Quantity
+            if not found_quantity_for_item:
+                qty_match = re.search(r"x\s*(\d+)", potential_detail_line, re.IGNORECASE)
+                if qty_match:
+                    quantity = int(qty_match.group(1))
+                    found_quantity_for_item = True
+            
+            # Attempt to extract Size (more flexible patterns)
+            if not found_size_for_item:
+                # Pattern 1: Common letter sizes (S, M, L, XL, etc.) or "One Size"
+                size_match = re.search(r"\b(XS|S|M|L|XL|XXL|XXXL|One Size|OS)\b", potential_detail_line, re.IGNORECASE)
+                
+                # Pattern 2: Sizes like "M / YLW" or "16 / BS" (size is the first part before /)
+                if not size_match:
+                    match_slash_size = re.search(r"(\b\d{1,2}\b|\b[A-Z]{1,3}\b)\s*/\s*[A-Z0-9]+", potential_detail_line, re.IGNORECASE)
+                    if match_slash_size:
+                        size = match_slash_size.group(1).strip() # Capture the first group (the actual size part)
+                        found_size_for_item = True
+                        
+                # Pattern 3: Standalone numeric sizes, but ONLY if the line doesn't contain "SKU" or "$"
+                if not size_match: # Only attempt if size not found by previous patterns
+                    if "SKU" not in potential_detail_line.upper() and "$" not in potential_detail_line:
+                        # Very strict: must be just the number or number/number on the line
+                        # Ensures it's a standalone size, not part of a larger number or price.
+                        numeric_size_match = re.search(r"^\s*(?:US|EU)?\s*(\d{1,3}(?:/\d{1,2})?)\s*$", potential_detail_line, re.IGNORECASE)
+                        if numeric_size_match:
+                            size = numeric_size_match.group(1).strip()
+                            found_size_for_item = True
+                        # No need for the broader search here, the strict one is safer given the context.
+                        # If it's not a standalone size line, it's probably not a size.
+
+                if size_match and not found_size_for_item: # Only assign if size hasn't been found yet
+                    size = size_match.group(0).strip()
+                    found_size_for_item = True
+            
+            # If both size and quantity are found, we can stop scanning for this item's details.
+            if found_size_for_item and found_quantity_for_item:
+                break 
+
+            # If we hit a line that signifies end of product details (e.g., another product, subtotal, discount)
+            # This is a strong signal to stop.
+            if any(kw in potential_detail_line.lower() for kw in ["subtotal", "discount", "shipping", "tax", "total", "paid", "balance"]) or \
+               (re.search(r" - [A-Z0-9\-]+$", potential_detail_line) and potential_detail_line != prod_info["line"]):
+                break # Stop scanning for details for this item
+
+        # Special handling for "Sock" products: assign "One Size" if no explicit size was found
+        # and the product name contains "sock".
+        if size == "Size Not Found" and "sock" in product_name.lower():
+            size = "One Size"
+
+        data["items"].append({
+            "product_name": product_name,
+            "style_code": style_code,
+            "size": size,
+            "quantity": quantity
+        })
+        processed_indices.add(line_idx) # Mark the main product line as processed
+
+    if not data["items"]:
+        data["missing_info"].append("Order Items")
+    
+    # Add "Item Sizes" to missing_info if any item still has "Size Not Found" after all attempts
+    for item in data["items"]:
+        if item["size"] == "Size Not Found" and "Item Sizes" not in data["missing_info"]:
+            data["missing_info"].append("Item Sizes")
+
+
+    return data
+
+
+def parse_orders(text):
+    rows = []
+    warnings = []
+
+    if "Select gid://shopify/Order/" not in text:
+        return pd.DataFrame(), ["No Shopify order blocks found"]
+
+    blocks = text.split("Select gid://shopify/Order/")[1:]
+
+    for block in blocks:
+        order = name = amount = None
+
+        order_match = re.search(r"#\d+", block)
+        if order_match:
+            order = order_match.group(0)
+
+        amount_match = re.search(r"\$[\d,]+\.\d{2}", block)
+        if amount_match:
+            amount = float(
+                amount_match.group(0).replace("$", "").replace(",", "")
+            )
+
+        name_match = re.search(r"\d+\sitems?\s*\n([^\n]+)", block)
+        if name_match:
+            candidate = name_match.group(1).strip()
+            if "$" not in candidate and len(candidate) > 1:
+                name = candidate
+
+        if order and name and amount is not None:
+            rows.append({
+                "Order Number": order,
+                "Customer Name": name,
+                "Amount ($)": amount
+            })
+        else:
+            warnings.append("One order skipped due to incomplete parsing")
+
+    return pd.DataFrame(rows), warnings
@@ -0,0 +1,10 @@
+"""Makes the dazzle package and the benchmark data generators importable from any working directory."""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_DIR = os.path.join(REPO_ROOT, "benchmarks")
+
+for path in (BENCHMARKS_DIR, REPO_ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
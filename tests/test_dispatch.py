@@ -0,0 +1,76 @@
+import random
+import socket
+import sqlite3
+
+import pytest
+
+from dazzle.dispatch import DispatchLedger, EmailDispatcher, SmtpSettings
+from dazzle.emails import render_email_batch
+from dazzle.parsing import parse_shopify_export
+from synthetic_exports import make_order_export
+
+ORDERS = [parse_shopify_export(make_order_export(random.Random(n), 1001 + n, missing_rate=0)) for n in range(5)]
+
+
+class CountingHandler:
+    def __init__(self):
+        self.recipients = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.recipients += envelope.rcpt_tos
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp_server():
+    controller_module = pytest.importorskip("aiosmtpd.controller")
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    handler = CountingHandler()
+    controller = controller_module.Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        yield SmtpSettings(host="127.0.0.1", port=port, sender="DAZZLE PREMIUM <orders@example.com>"), handler
+    finally:
+        controller.stop()
+
+
+def _send(settings, ledger_path, template, resend=False):
+    with EmailDispatcher(settings, ledger=DispatchLedger(ledger_path), resend=resend) as dispatcher:
+        return [result.status for result in dispatcher.send(render_email_batch(ORDERS, template))]
+
+
+def test_rerun_skips_orders_already_sent(smtp_server, tmp_path):
+    settings, handler = smtp_server
+    ledger_path = str(tmp_path / "dispatch.sqlite3")
+    assert _send(settings, ledger_path, "standard") == ["sent"] * 5
+    assert _send(settings, ledger_path, "standard") == ["skipped"] * 5
+    assert _send(settings, ledger_path, "high_risk") == ["skipped"] * 5 # One email per order, whatever the template
+    assert len(handler.recipients) == 5
+
+    assert _send(settings, ledger_path, "high_risk", resend=True) == ["sent"] * 5
+    assert _send(settings, ledger_path, "high_risk", resend=True) == ["skipped"] * 5
+    assert len(handler.recipients) == 10
+
+
+def test_ledger_keyed_by_template_is_rekeyed_per_order(tmp_path):
+    path = str(tmp_path / "dispatch.sqlite3")
+    DispatchLedger(path).close()
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("PRAGMA user_version = 0")
+        connection.executemany(
+            "INSERT INTO dispatches (dispatch_key, order_number, template, email_address, status, updated_at) "
+            "VALUES (?, ?, ?, 'ann@example.com', ?, ?)",
+            [("1001:standard", "#1001", "standard", "sent", 1.0), ("1001:high_risk", "#1001", "high_risk", "failed", 2.0),
+             ("1002:standard", "#1002", "standard", "failed", 1.0)],
+        )
+    connection.close()
+    ledger = DispatchLedger(path)
+    try:
+        assert ledger.entry("1001") == ("sent", "standard")
+        assert ledger.entry("1002") == ("failed", "standard")
+        assert ledger.entry("1001:standard") is None
+    finally:
+        ledger.close()
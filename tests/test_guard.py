@@ -0,0 +1,65 @@
+import os
+import random
+import re
+import subprocess
+import sys
+
+import pytest
+
+from conftest import BENCHMARKS_DIR, REPO_ROOT
+from dazzle.guard import GuardedParser, InputTooLarge, ParseTimeout
+from dazzle.parsing import parse_shopify_export_compact
+from synthetic_exports import make_order_export
+
+STUCK_PATTERN = re.compile(r"(x+x+)+y") # Exponential backtracking on a run of "x"
+
+
+def test_guarded_parse_matches_in_process_parse():
+    text = make_order_export(random.Random(1), 1001, missing_rate=0)
+    guarded = GuardedParser(parse_shopify_export_compact, workers=1)
+    try:
+        assert guarded(text) == parse_shopify_export_compact(text)
+    finally:
+        guarded.close()
+
+
+def test_stuck_parse_times_out_and_worker_is_replaced():
+    guarded = GuardedParser(STUCK_PATTERN.findall, time_budget=0.5, workers=1)
+    try:
+        guarded.start()
+        with pytest.raises(ParseTimeout):
+            guarded("x" * 64)
+        assert guarded.timeouts == 1
+        assert guarded("xxy") == ["xx"] # The replacement worker serves the next call
+    finally:
+        guarded.close()
+
+
+def test_oversized_order_is_refused_before_a_worker_sees_it():
+    guarded = GuardedParser(parse_shopify_export_compact, workers=1, max_chars=100)
+    try:
+        with pytest.raises(InputTooLarge):
+            guarded("x" * 101)
+    finally:
+        guarded.close()
+
+
+def test_workers_start_when_the_server_runs_outside_the_repo(tmp_path):
+    # Like `streamlit run /path/to/Codebase.py` from another directory: dazzle is importable
+    # only through sys.path entries the server added itself, not through cwd or PYTHONPATH
+    script = f"""
+import random, sys
+sys.path[:0] = [{REPO_ROOT!r}, {BENCHMARKS_DIR!r}]
+from dazzle.guard import GuardedParser
+from dazzle.parsing import parse_shopify_export_compact
+from synthetic_exports import make_order_export
+guarded = GuardedParser(parse_shopify_export_compact, workers=1)
+print(guarded(make_order_export(random.Random(1), 1001, missing_rate=0)).order_number)
+guarded.close()
+"""
+    env = {name: value for name, value in os.environ.items() if name != "PYTHONPATH"}
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "1001"
@@ -0,0 +1,41 @@
+import threading
+import time
+
+from dazzle.jobs import INTERRUPTED_ERROR, JobQueue
+
+
+def _wait(queue, job_id, status, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while queue.get(job_id).status != status:
+        assert time.monotonic() < deadline, f"job is {queue.get(job_id).status}, not {status}"
+        time.sleep(0.01)
+
+
+def test_parse_jobs_resume_after_a_restart(tmp_path):
+    release = threading.Event()
+
+    def stuck(context, params, payload):
+        release.wait()
+        raise RuntimeError("the old process is gone")
+
+    def echo(context, params, payload):
+        return {"params": params, "payload": payload}
+
+    paths = {"path": str(tmp_path / "jobs.sqlite3"), "job_dir": str(tmp_path / "jobs")}
+    # The first process dies with a parse running and a mailing still queued behind it
+    crashed = JobQueue(**paths, max_workers=1, handlers={"batch_parse": stuck, "email_dispatch": stuck})
+    try:
+        parse_id = crashed.submit("batch_parse", {"mode": "summary"}, payload="orders page")
+        send_id = crashed.submit("email_dispatch", {"template": "standard"})
+        _wait(crashed, parse_id, "running")
+
+        restarted = JobQueue(**paths, handlers={"batch_parse": echo, "email_dispatch": echo})
+        try:
+            _wait(restarted, parse_id, "done")
+            assert restarted.result(parse_id) == {"params": {"mode": "summary"}, "payload": "orders page"}
+            assert restarted.get(send_id).status == "failed" and restarted.get(send_id).error == INTERRUPTED_ERROR
+        finally:
+            restarted.close()
+    finally:
+        release.set()
+        crashed.close()
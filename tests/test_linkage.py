@@ -0,0 +1,40 @@
+import pandas as pd
+
+from dazzle.linkage import LinkageIndex, link_summary_rows
+from dazzle.store import OrderStore
+
+BATCH = pd.DataFrame({
+    "Order Number": ["#1001", "#1002", "#1003"],
+    "Customer Name": ["Ann Lee", "Ann Lee", "Bob Roe"],
+    "Amount ($)": [10.0, 20.0, 30.0],
+})
+
+
+def _parse_and_save(store, index, frame, batch_id):
+    links = link_summary_rows(index, frame, batch_id)
+    store.save_batch_rows(frame, batch_id=batch_id)
+    index.add_records(store.iter_linkage_records())
+    return links
+
+
+def test_reparsing_a_batch_does_not_find_its_own_orders():
+    store = OrderStore(":memory:")
+    index = LinkageIndex()
+    first = _parse_and_save(store, index, BATCH, "a")
+    assert _parse_and_save(store, index, BATCH, "a") == first
+    assert first["Seen Before"] == [False, False, False]
+    assert first["Customer Orders"] == [2, 2, 1]
+
+    grown = pd.concat([BATCH.iloc[:1].assign(**{"Order Number": "#1004"}), BATCH], ignore_index=True)
+    links = _parse_and_save(store, index, grown, "a")
+    assert links["Seen Before"] == [False] * 4
+    assert links["Customer Orders"] == [3, 3, 3, 1]
+
+
+def test_another_batch_sees_the_saved_orders():
+    store = OrderStore(":memory:")
+    index = LinkageIndex()
+    _parse_and_save(store, index, BATCH, "a")
+    links = _parse_and_save(store, index, BATCH, "b")
+    assert links["Seen Before"] == [True, True, True]
+    assert links["Customer Orders"] == [2, 2, 1]
@@ -0,0 +1,37 @@
+import random
+
+import baseline_parsers
+from dazzle import parsing
+from dazzle.parsing import IncrementalOrdersParser, parse_orders, parse_shopify_export
+from synthetic_exports import make_order_corpus, make_orders_page
+
+
+def test_export_parser_matches_the_baseline():
+    for text in make_order_corpus(5, 300, missing_rate=0.3):
+        assert parse_shopify_export(text) == baseline_parsers.parse_shopify_export(text)
+
+
+def test_orders_page_parser_matches_the_baseline(monkeypatch):
+    text = make_orders_page(random.Random(2), 500, incomplete_rate=0.05)
+    expected_frame, expected_warnings = baseline_parsers.parse_orders(text)
+    frame, warnings = parse_orders(text)
+    assert frame.to_dict("list") == expected_frame.to_dict("list") and warnings == expected_warnings
+
+    monkeypatch.setattr(parsing, "_import_pyarrow", lambda: None) # The block-loop fallback
+    frame, warnings = parse_orders(text)
+    assert frame.to_dict("list") == expected_frame.to_dict("list") and warnings == expected_warnings
+
+
+def test_adopted_parse_only_parses_new_blocks():
+    rng = random.Random(3)
+    text = make_orders_page(rng, 300, incomplete_rate=0.05)
+    grown = make_orders_page(rng, 20, first_order_number=5001, incomplete_rate=0.05) + text
+    parser = IncrementalOrdersParser()
+    frame, _ = parser.parse(text)
+
+    adopted = IncrementalOrdersParser()
+    adopted.adopt(text, frame, parser.block_ordinals())
+    frame, warnings = adopted.parse(grown)
+    assert (adopted.last_parsed_blocks, adopted.last_reused_blocks) == (20, 300)
+    expected_frame, expected_warnings = parse_orders(grown)
+    assert frame.equals(expected_frame) and warnings == expected_warnings
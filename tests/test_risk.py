@@ -0,0 +1,18 @@
+import pandas as pd
+
+from dazzle.risk import summary_risk_features
+from dazzle.store import OrderStore
+
+
+def test_history_matches_normalized_emails():
+    store = OrderStore(":memory:")
+    store.save_parsed_orders([{"order_number": "#1001", "email_address": "Ann.Lee+shop@gmail.com"}])
+    assert store.contact_history([("#1002", "annlee@googlemail.com", None)]) == [(1, False)]
+
+
+def test_batch_is_not_its_own_history():
+    store = OrderStore(":memory:")
+    frame = pd.DataFrame({"Order Number": ["#1001", "#1002"], "Customer Name": ["Ann Lee"] * 2, "Amount ($)": [10.0, 20.0]})
+    store.save_batch_rows(frame, batch_id="a")
+    assert summary_risk_features(frame, store, batch_id="a")["prior_orders"].tolist() == [0, 0]
+    assert summary_risk_features(frame, store, batch_id="b")["prior_orders"].tolist() == [1, 1]
@@ -0,0 +1,28 @@
+import asyncio
+
+from dazzle.parsing import parse_shopify_export
+from dazzle.service import RETRY_AFTER_SECONDS, ServiceClient, create_app
+from synthetic_exports import make_order_corpus
+
+
+def test_full_queue_gets_429_and_recovers():
+    exports = make_order_corpus(1, 3)
+
+    async def scenario():
+        # batch_size over max_queue holds a partial batch for batch_wait, so the queue stays full meanwhile
+        app = create_app(max_workers=1, max_queue=2, batch_size=4, batch_wait=0.5)
+        async with ServiceClient(app) as client:
+            filling = asyncio.create_task(client.post("/parse/batch", {"exports": exports[:2]}))
+            await asyncio.sleep(0.1)
+            refused = await client.post("/parse", {"text": exports[2]})
+            filled = await filling
+            retried = await client.post("/parse", {"text": exports[2]})
+            health = await client.get("/health")
+        return refused, filled, retried, health
+
+    refused, filled, retried, health = asyncio.run(scenario())
+    status, headers, payload = refused
+    assert status == 429 and headers["retry-after"] == str(RETRY_AFTER_SECONDS) and "queue full" in payload["error"]
+    assert filled[0] == 200 and len(filled[2]["orders"]) == 2
+    assert retried[0] == 200 and retried[2] == parse_shopify_export(exports[2])
+    assert health[2]["rejected"] == 1 and health[2]["queued"] == 0
@@ -0,0 +1,46 @@
+import os
+
+import pyarrow as pa
+
+from dazzle.shared import SharedBatchStore, write_batch_file
+
+
+def _batch_file(directory, name, rows=1000):
+    path = os.path.join(directory, name + ".batch.arrows")
+    write_batch_file(path, pa.table({"Order Number": [f"#{n}" for n in range(rows)]}))
+    return path
+
+
+def test_eviction_bounds_every_mapped_table(tmp_path):
+    jobs = tmp_path / "jobs"
+    jobs.mkdir()
+    paths = [_batch_file(str(jobs), f"job{n}") for n in range(4)]
+    size = os.path.getsize(paths[0])
+    writer = SharedBatchStore(max_bytes=10 * size, directory=str(tmp_path / "index"))
+    for n, path in enumerate(paths):
+        writer.publish(f"key{n}", path)
+
+    # A second process's store maps tables it never published; they count towards its bound too
+    reader = SharedBatchStore(max_bytes=2 * size, directory=str(tmp_path / "index"))
+    for n in range(4):
+        assert reader.get(f"key{n}").num_rows == 1000
+    assert reader.nbytes() <= 2 * size
+    assert reader.get("key3") is not None and reader.hits == 5
+    assert reader.get("key0").num_rows == 1000 # Evicted tables are mapped again
+
+
+def test_batches_are_indexed_not_copied(tmp_path):
+    path = _batch_file(str(tmp_path), "job")
+    store = SharedBatchStore(directory=str(tmp_path / "index"))
+    store.publish("key", path)
+    assert os.path.samefile(store.file_path("key"), path)
+    assert [entry.is_symlink() for entry in os.scandir(store.directory)] == [True]
+
+
+def test_link_to_a_pruned_job_is_a_miss(tmp_path):
+    path = _batch_file(str(tmp_path), "job")
+    store = SharedBatchStore(directory=str(tmp_path / "index"))
+    store.publish("key", path)
+    os.remove(path)
+    assert store.get("key") is None and store.misses == 1
+    assert os.listdir(store.directory) == []